@@ -2,8 +2,27 @@
 AskFunction: POST /api/ask
 Flow:
   1) aws___search_documentation (limit fixed to 10)
-  2) aws___read_documentation for top-K URLs
-  3) Summarize with Amazon Bedrock
+  2) re-rank the hits locally (BM25 over title/context, mcp_proxy_lib.rerank) and
+     aws___read_documentation only as many of them as the question needs
+     (at most read_top_k, + speculative spares); when the snippets already
+     cover the question nothing is read and the snippets become the corpus
+     - concurrent, bounded by the invocation deadline
+     - through the document store (mcp_proxy_lib.docstore), so pages the warmer
+       refreshed or /api/read already loaded are not fetched again; the pages
+       used are counted for the warmer (mcp_proxy_lib.popularity)
+     - each page is chunked/tokenized as soon as its read finishes, overlapping the remaining reads
+     - reading stops once the pages read so far hold ASK_ENOUGH_TOKENS of question-relevant text
+       (queued reads are cancelled; reads already in flight are awaited, they end by
+       the read deadline, so none of them keeps running into the next invocation)
+  3) Summarize with Amazon Bedrock (mcp_proxy_lib.model_router: a fast model for short
+     corpora and simple questions, the large one otherwise; on throttling the
+     next model in the route is tried, and 503 when all of them are throttled)
+Identical questions arriving concurrently run 1)-3) once; the others wait for
+that answer (mcp_proxy_lib.singleflight, across containers with the shared cache).
+
+JSON response fields: summary, refs, search (raw search result), cache.
+  "include_search": false   -> search を返さない
+  "fields": ["summary"]     -> 指定したフィールドだけ返す（"summary,refs" も可）
 """
 
 from __future__ import annotations
@@ -11,26 +30,82 @@ from __future__ import annotations
 import os
 import base64
 import json
-from typing import Any, Dict, List, Tuple
-
-import boto3
-
-from mcp_proxy_lib.http_client import mcp_tools_call
-from mcp_proxy_lib.security import response, verify_origin
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mcp_proxy_lib.answer_cache import ANSWER_TOOL, default_answer_cache, normalize_args
+from mcp_proxy_lib.corpus import Corpus, CorpusBuilder
+from mcp_proxy_lib.deadline import Deadline, DeadlineExceeded
+from mcp_proxy_lib.docstore import TOOL_READ, UpstreamToolError, default_document_store
+from mcp_proxy_lib.http_client import mcp_tools_call, mcp_tools_call_many
+from mcp_proxy_lib.lazy import LazyClient
+from mcp_proxy_lib.metrics import annotate, incr, record, stage, traced
+from mcp_proxy_lib.popularity import record_access
+from mcp_proxy_lib.model_router import Model, ModelsThrottled, Route, default_router, should_fall_back
+from mcp_proxy_lib.prompt import PromptTemplate, disable_prompt_cache, prompt_cache_enabled, prompt_cache_rejected, record_usage
+from mcp_proxy_lib.rerank import RELEVANT_CHUNK_COVERAGE, Hit, ReadPlan, plan_reads, query_weights, rank_hits
+from mcp_proxy_lib.security import compressible, project, response, verify_origin
+from mcp_proxy_lib.singleflight import coalesce
+from mcp_proxy_lib.snapstart import prime
 
 MCP_ENDPOINT = os.environ.get("MCP_ENDPOINT", "https://knowledge-mcp.global.api.aws").strip()
 ORIGIN_VERIFY_SECRET = (os.environ.get("ORIGIN_VERIFY_SECRET") or "").strip()
 
 BEDROCK_MODEL_ID = (os.environ.get("BEDROCK_MODEL_ID") or "").strip()
 MAX_CHARS_FOR_SUMMARY = int(os.environ.get("MAX_CHARS_FOR_SUMMARY") or "18000")
+MAX_TOKENS_FOR_SUMMARY = int(os.environ.get("MAX_TOKENS_FOR_SUMMARY") or "6000")
+# MAX_TOKENS_FOR_SUMMARY のうち、質問を見ずに詰める（prompt cache に載る）部分の割合
+SHARED_CORPUS_SHARE = float(os.environ.get("ASK_SHARED_CORPUS_SHARE") or "0.5")
 
 TOOL_SEARCH = "aws___search_documentation"
-TOOL_READ = "aws___read_documentation"
+
+ASK_FIELDS = ("summary", "refs", "search", "cache", "message", "partial")
 
 DEFAULT_READ_TOP_K = 3
 DEFAULT_READ_MAX_LENGTH = 6000  # 1ページあたりのread量（大きすぎるとBedrock投入が膨らむ）
 
-bedrock = boto3.client("bedrock-runtime")
+READ_CONCURRENCY = int(os.environ.get("ASK_READ_CONCURRENCY") or "5")
+# top-K に加えて投機的に read しておく予備の件数（失敗/遅延時に追加の往復なしで差し替える）
+SPECULATIVE_READS = int(os.environ.get("ASK_SPECULATIVE_READS") or "1")
+# true: top-K の read を JSON-RPC batch 1 往復で送る（拒否されたら並列の単発呼び出しに戻る）
+READ_BATCH = (os.environ.get("MCP_JSONRPC_BATCH") or "").strip().lower() in ("1", "true", "yes")
+# false: 検索順に read_top_k 件読む（re-rank / snippet だけの回答 / 途中打ち切りをしない）
+ADAPTIVE_READS = (os.environ.get("ASK_ADAPTIVE_READS") or "true").strip().lower() in ("1", "true", "yes")
+# read 済みページの「質問に関係する」本文がこの token 数に達したら残りの read を待たない（0 で無効）
+ENOUGH_TOKENS = int(os.environ.get("ASK_ENOUGH_TOKENS") or "3000")
+# read が終わらなくても Bedrock 要約に回す時間は残しておく
+SUMMARY_RESERVE_MS = int(os.environ.get("ASK_SUMMARY_RESERVE_MS") or "12000")
+# 打ち切った後、走行中の read の終了を read の deadline からさらに待つ上限
+READ_SETTLE_GRACE_S = 1.0
+
+# 同じ質問を処理中の別コンテナを待つ上限（先行側が落ちた場合はこの後に自分で処理する）
+ASK_LEASE_TTL_S = float(os.environ.get("ASK_LEASE_TTL_S") or "30")
+
+# 1 回の Bedrock 呼び出しの上限（実際には invocation deadline でさらに縮める）
+BEDROCK_READ_TIMEOUT_S = int(os.environ.get("BEDROCK_READ_TIMEOUT_S") or "25")
+
+# read_timeout（秒）-> bedrock-runtime client。呼び出しは残り時間を read_timeout にした client で同期的に行う
+# （別スレッドで待つだけだと、打ち切っても呼び出し自体は次の invocation まで走り続ける）。
+# 秒単位に切り捨てるので client は高々 BEDROCK_READ_TIMEOUT_S 個。
+# SDK のリトライは deadline に収まらないので使わない（throttling は route の次のモデルへ）。
+_BEDROCK_CLIENTS: Dict[int, LazyClient] = {}
+
+
+def _bedrock_client(read_timeout_s: int) -> LazyClient:
+    client = _BEDROCK_CLIENTS.get(read_timeout_s)
+    if client is None:
+        client = _BEDROCK_CLIENTS.setdefault(read_timeout_s, LazyClient(
+            "bedrock-runtime",
+            connect_timeout=min(3, read_timeout_s),
+            read_timeout=read_timeout_s,
+            retries={"total_max_attempts": 1, "mode": "standard"},
+        ))
+    return client
+
+
+# boto3 の import と client 生成は最初の Bedrock 呼び出しまで遅らせる（SnapStart 時は snapshot 前に済ませる）
+prime(_bedrock_client(BEDROCK_READ_TIMEOUT_S).get)
 
 
 def _validate_args(params: Dict[str, Any]) -> Dict[str, Any]:
@@ -68,128 +143,362 @@ def _validate_args(params: Dict[str, Any]) -> Dict[str, Any]:
         "limit": limit,
         "read_top_k": read_top_k,
         "read_max_length": read_max_length,
+        "fields": _validate_fields(params.get("fields"), include_search=params.get("include_search") is not False),
     }
     if topics:
         out["topics"] = topics
     return out
 
 
-def _pick_urls_from_search(search_result: Any, k: int) -> List[Dict[str, str]]:
+def _validate_fields(fields: Any, include_search: bool) -> Optional[List[str]]:
     """
-    search結果からURL候補を取り出す（形が多少違っても落ちにくく）
-    返り値: [{"title": "...", "url": "..."}, ...]
+    返り値 None = 全フィールド。message / partial（504 の応答）は常に残す。
     """
-    if k <= 0:
-        return []
+    if fields is None or fields == "":
+        return None if include_search else [f for f in ASK_FIELDS if f != "search"]
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    if not isinstance(fields, list) or not all(isinstance(f, str) for f in fields):
+        raise ValueError("fields must be an array of strings")
+    unknown = [f for f in fields if f not in ASK_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    names = [f for f in fields if include_search or f != "search"]
+    return names + [f for f in ("message", "partial") if f not in names]
+
+
+def _usable(state: List[Optional[bool]], k: int, relevant: List[int], final: bool = False) -> Optional[List[int]]:
+    """
+    優先順で見て、使うページの index を返す。まだ決まらない（より前に未完了がある）なら None。
+    - 成功 k 件、または成功分の関連 token 数が ENOUGH_TOKENS に達したところまで
+    - final=True なら未完了は失敗とみなす
+    """
+    used: List[int] = []
+    gathered = 0
+    for i, st in enumerate(state):
+        if st is None and not final:
+            return None
+        if not st:
+            continue
+        used.append(i)
+        gathered += relevant[i]
+        if len(used) >= k or (ADAPTIVE_READS and ENOUGH_TOKENS > 0 and gathered >= ENOUGH_TOKENS):
+            break
+    return used
 
-    items = None
-    if isinstance(search_result, dict):
-        items = search_result.get("items") or search_result.get("results") or search_result.get("documents")
 
-    refs: List[Dict[str, str]] = []
-    if isinstance(items, list):
-        for it in items:
-            if not isinstance(it, dict):
-                continue
-            url = str(it.get("url") or it.get("link") or "").strip()
-            if not url:
-                continue
-            title = str(it.get("title") or it.get("name") or "").strip()
-            refs.append({"title": title, "url": url})
-            if len(refs) >= k:
+def _read_into_corpus(candidates: List[Dict[str, str]], k: int, read_max_length: int, deadline: Deadline, builder: CorpusBuilder) -> List[Dict[str, str]]:
+    """
+    candidates（優先順、上位 k 件 + 予備）を並列に read し、終わったものから builder に投入する。
+    - deadline（Bedrock 分の予約を差し引いたもの）までに終わった read だけを使う
+    - 個別の read 失敗はログに残してスキップ（予備があれば差し替わる）
+    - 戻る前に走行中の read の終了を待つ（Lambda は応答後に凍結されるので、次の呼び出しに持ち越さない）
+    返り値: corpus に入れる refs（優先順、最大 k 件）。builder の order は candidates の index。
+    """
+    targets = [r for r in candidates if r.get("url")]
+    if not targets or k <= 0:
+        return []
+
+    state: List[Optional[bool]] = [None] * len(targets)
+    relevant = [0] * len(targets)
+    weights = query_weights(builder.question)
+    urls = [ref["url"] for ref in targets]
+
+    # read は Bedrock 分の予約を残した deadline で打ち切る（各 attempt の timeout もこれに合わせて縮む）
+    read_deadline = Deadline(deadline.expires_at - SUMMARY_RESERVE_MS / 1000.0)
+
+    # future -> その future が返す結果の index 群
+    pool = ThreadPoolExecutor(max_workers=max(1, min(READ_CONCURRENCY, len(targets))))
+    if READ_BATCH and len(urls) > 1:
+        futures = {
+            pool.submit(_read_windows_batch, urls, read_max_length, read_deadline): list(range(len(urls)))
+        }
+    else:
+        futures = {
+            pool.submit(lambda u: [_read_window(u, read_max_length, read_deadline)], u): [i]
+            for i, u in enumerate(urls)
+        }
+
+    budget_s = read_deadline.remaining()
+    try:
+        for fut in as_completed(futures, timeout=budget_s):
+            indices = futures[fut]
+            try:
+                results = fut.result()
+            except Exception as ex:
+                results = [None] * len(indices)
+                print("[ASK_READ_FAILURE]", {"urls": [targets[i]["url"] for i in indices], "error": str(ex)[:2000]})
+            for i, result in zip(indices, results):
+                if result is None:
+                    state[i] = False
+                    continue
+                text = _extract_text_from_read(result)
+                # 残りの read を待つ間にチャンク分割・トークン化を済ませる
+                builder.add(i, targets[i].get("title", ""), targets[i]["url"], text)
+                relevant[i] = builder.relevant_tokens(i, weights, RELEVANT_CHUNK_COVERAGE)
+                state[i] = bool(text)
+            if _usable(state, k, relevant) is not None:
                 break
-    return refs
+    except FuturesTimeout:
+        print("[ASK_READ_TIMEOUT]", {
+            "budget_s": round(budget_s, 3),
+            "pending": [targets[i]["url"] for f, idx in futures.items() if not f.done() for i in idx],
+        })
+    finally:
+        # 未着手の read は取り消し、走行中のものは終わるのを待つ（各 attempt の timeout は read_deadline までなので長くは待たない）
+        pool.shutdown(wait=False, cancel_futures=True)
+        running = [f for f in futures if not f.done()]
+        if running:
+            _, still = wait(running, timeout=max(0.0, read_deadline.remaining()) + READ_SETTLE_GRACE_S)
+            if still:
+                print("[ASK_READ_NOT_SETTLED]", {
+                    "pending": [targets[i]["url"] for f in still for i in futures[f]],
+                })
+
+    used = _usable(state, k, relevant, final=True) or []
+    for i in used:
+        # warmer が先読みする文書として数える（read と同じ集計）
+        record_access(TOOL_READ, targets[i]["url"])
+    return [dict(targets[i], _order=i) for i in used]
+
+
+def _read_window(url: str, max_length: int, deadline: Deadline) -> Optional[Dict[str, Any]]:
+    """
+    文書の先頭 max_length 文字（document store 経由: warmer が更新した文書をそのまま使う）。
+    upstream が isError を返したら None。
+    """
+    try:
+        return default_document_store(MCP_ENDPOINT).window(url, 0, max_length, deadline=deadline)
+    except UpstreamToolError as ue:
+        print("[ASK_READ_FAILURE]", {"urls": [url], "error": str(ue)[:2000]})
+        return None
 
 
-def _extract_text_from_read(read_result: Any) -> str:
+def _read_windows_batch(urls: List[str], max_length: int, deadline: Deadline) -> List[Optional[Dict[str, Any]]]:
     """
-    read結果から本文を取り出す（toolの返却形に依存するので保守的に）
-    - dict内に "content" があり、[{type:"text", text:"..."}] 形式が多い想定で拾う
-    - ダメなら全体をJSON化
+    _read_window の JSON-RPC batch 版。document store に無い文書だけを 1 回の batch で取得して保存する。
     """
-    if isinstance(read_result, dict):
-        content = read_result.get("content")
-        if isinstance(content, list):
-            texts = []
-            for c in content:
-                if isinstance(c, dict) and c.get("type") == "text":
-                    t = c.get("text")
-                    if isinstance(t, str) and t.strip():
-                        texts.append(t.strip())
-            if texts:
-                return "\n".join(texts)
+    store = default_document_store(MCP_ENDPOINT)
+    results = [store.cached_window(u, 0, max_length) for u in urls]
+    missing = [i for i, r in enumerate(results) if r is None]
+    if not missing:
+        return results
+    fetched = mcp_tools_call_many(MCP_ENDPOINT, [store.read_call(urls[i]) for i in missing], use_cache=False, deadline=deadline)
+    for i, result in zip(missing, fetched):
+        try:
+            results[i] = store.window_of(store.ingest(urls[i], result), 0, max_length)
+        except UpstreamToolError as ue:
+            print("[ASK_READ_FAILURE]", {"urls": [urls[i]], "error": str(ue)[:2000]})
+    return results
+
+
+def _build_source_corpus(builder: CorpusBuilder, used: List[Dict[str, str]]) -> Corpus:
+    """
+    token 予算内に収まるよう、各ソースに公平に枠を配って詰める。
+    予算の SHARED_CORPUS_SHARE までは質問に依らない部分（prompt cache 用）、残りは質問に近い段落。
+    """
+    corpus = builder.build_split(
+        MAX_TOKENS_FOR_SUMMARY,
+        int(MAX_TOKENS_FOR_SUMMARY * SHARED_CORPUS_SHARE),
+        orders=[r["_order"] for r in used],
+    )
 
-    return json.dumps(read_result, ensure_ascii=False)
+    # 最終的な安全弁（文字数）。削るのは質問ごとの部分から
+    shared, related = corpus
+    if len(shared) > MAX_CHARS_FOR_SUMMARY:
+        return Corpus(shared[:MAX_CHARS_FOR_SUMMARY] + "\n\n...(truncated)...")
+    room = MAX_CHARS_FOR_SUMMARY - len(shared)
+    if len(related) > room:
+        related = related[:room] + "\n\n...(truncated)..."
+    return Corpus(shared, related)
 
 
-def _build_source_corpus(search_phrase: str, refs: List[Dict[str, str]], read_texts: List[Tuple[Dict[str, str], str]]) -> str:
-    chunks: List[str] = [f"# Question\n{search_phrase}"]
-    for ref, text in read_texts:
-        title = ref.get("title", "")
-        url = ref.get("url", "")
-        if not text:
-            continue
-        chunks.append(f"\n\n## {title}\nURL: {url}\n{text}")
-    corpus = "\n".join(chunks).strip()
+def _ref(hit: Hit) -> Dict[str, str]:
+    return {"title": hit.title, "url": hit.url}
 
-    if len(corpus) > MAX_CHARS_FOR_SUMMARY:
-        corpus = corpus[:MAX_CHARS_FOR_SUMMARY] + "\n\n...(truncated)..."
-    return corpus
 
+def _planned_refs(plan: ReadPlan) -> List[Dict[str, str]]:
+    return [_ref(h) for h in (plan.snippets or plan.reads)]
 
-def _summarize_with_bedrock(search_phrase: str, corpus: str, refs: List[Dict[str, str]]) -> str:
-    if not BEDROCK_MODEL_ID:
-        raise ValueError("BEDROCK_MODEL_ID is empty")
 
-    # --- system (top-level) ---
-    system_text = (
-        "あなたはAWS公式ドキュメントの要約アシスタントです。"
-        "必ず日本語で、事実に基づいて簡潔にまとめてください。推測はしない。"
-        "不明な点は不明と書く。"
-        "引用元のURLは最後に箇条書きで列挙する。"
-    )
+def _plan(args: Dict[str, Any], search_result: Any) -> ReadPlan:
+    """
+    search の結果を re-rank し、read するページ（または snippet だけで答えるか）を決める。
+    """
+    with stage("rerank"):
+        hits = rank_hits(args["search_phrase"], _search_items(search_result))
+        plan = plan_reads(args["search_phrase"], hits, args["read_top_k"], max(0, SPECULATIVE_READS), ADAPTIVE_READS)
+    incr("reads_planned", len(plan.reads))
+    if args["read_top_k"] > len(plan.reads):
+        incr("reads_skipped", args["read_top_k"] - len(plan.reads))
+    print("[ASK_PLAN]", {
+        "hits": len(hits),
+        "reads": [h.url for h in plan.reads],
+        "snippets_only": bool(plan.snippets) and args["read_top_k"] > 0,
+    })
+    return plan
+
+
+def _gather_corpus(args: Dict[str, Any], plan: ReadPlan, deadline: Deadline) -> Tuple[List[Dict[str, str]], Corpus]:
+    """
+    返り値: (refs, corpus)
+    refs は実際に corpus に入ったページ。1件も読めなかった場合は plan の read 対象。
+    """
+    builder = CorpusBuilder(args["search_phrase"])
+    if plan.snippets:
+        # search の snippet で足りる: read しない
+        for h in plan.snippets:
+            builder.add(h.order, h.title, h.url, h.context)
+        used = [dict(_ref(h), _order=h.order) for h in plan.snippets]
+    else:
+        candidates = [_ref(h) for h in plan.reads + plan.spares]
+        used = _read_into_corpus(candidates, len(plan.reads), args["read_max_length"], deadline, builder)
+    corpus = _build_source_corpus(builder, used)
+    refs = [{"title": r.get("title", ""), "url": r["url"]} for r in used] or _planned_refs(plan)
+    return refs, corpus
+
+
+SYSTEM_TEXT = (
+    "あなたはAWS公式ドキュメントの要約アシスタントです。"
+    "必ず日本語で、事実に基づいて簡潔にまとめてください。推測はしない。"
+    "不明な点は不明と書く。"
+    "引用元のURLは最後に箇条書きで列挙する。"
+    """
 
+出力形式:
+- 結論（1〜3行）
+- 要点（箇条書き 3〜7個）
+- 注意点（あれば）
+- 参考URL（箇条書き）
+"""
+)
+SUMMARY_TEMPERATURE = 0.2
+
+# (max_tokens, prompt cache) -> 固定部分をシリアライズ済みのテンプレート
+_TEMPLATES: Dict[Tuple[int, bool], PromptTemplate] = {}
+
+
+def _template(max_tokens: int) -> PromptTemplate:
+    key = (max_tokens, prompt_cache_enabled())
+    t = _TEMPLATES.get(key)
+    if t is None:
+        t = _TEMPLATES[key] = PromptTemplate(SYSTEM_TEXT, max_tokens, SUMMARY_TEMPERATURE, cache=key[1])
+    return t
+
+
+def _build_bedrock_body(search_phrase: str, corpus: Corpus, refs: List[Dict[str, str]], max_tokens: int) -> bytes:
+    """
+    system / 出力形式 → 参考情報（corpus.shared）→ 関連箇所（corpus.related）→ 質問 の順
+    （前の方ほど別の呼び出しと共通で、cache されやすい）。
+    cache checkpoint は shared の後ろ: 質問で選んだ部分はその後に置く（同じページなら質問が違っても prefix を共有できる）。
+    """
     ref_lines = "\n".join(
         f"- {r.get('title','')}: {r.get('url','')}"
         for r in (refs or [])
         if isinstance(r, dict) and r.get("url")
     )
 
-    user_text = f"""ユーザーの質問:
-{search_phrase}
+    document = f"""参考情報（readした本文中心）:
+---
+{corpus.shared}
+---
+""" if corpus.shared else ""
 
-参考情報（readした本文中心）:
+    related = f"""質問に関連する箇所（同じ参考情報から）:
 ---
-{corpus}
+{corpus.related}
 ---
 
+""" if corpus.related else ""
+
+    user_text = related + f"""ユーザーの質問:
+{search_phrase}
+
 候補URL:
 {ref_lines if ref_lines else "(なし)"}
-
-出力形式:
-- 結論（1〜3行）
-- 要点（箇条書き 3〜7個）
-- 注意点（あれば）
-- 参考URL（箇条書き）
 """
 
-    body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "system": system_text,  # ★messages内にsystem roleを入れない
-        "max_tokens": 800,
-        "temperature": 0.2,
-        "messages": [
-            {"role": "user", "content": user_text},
-        ],
-    }
+    return _template(max_tokens).render(document, user_text)
 
-    r = bedrock.invoke_model(
-        modelId=BEDROCK_MODEL_ID,
-        body=json.dumps(body, ensure_ascii=False).encode("utf-8"),
-        accept="application/json",
-        contentType="application/json",
-    )
-    payload = json.loads(r["body"].read())
+
+def _invoke_model(fn: Any, model: Model, search_phrase: str, corpus: Corpus, refs: List[Dict[str, str]]) -> Any:
+    """
+    fn(body=...) を呼ぶ。モデルが prompt caching を受け付けなければ cache なしで送り直す。
+    """
+    kwargs = {"modelId": model.model_id, "accept": "application/json", "contentType": "application/json"}
+    try:
+        return fn(body=_build_bedrock_body(search_phrase, corpus, refs, model.max_tokens), **kwargs)
+    except Exception as ex:
+        if not prompt_cache_enabled() or not prompt_cache_rejected(ex):
+            raise
+        disable_prompt_cache(str(ex))
+        return fn(body=_build_bedrock_body(search_phrase, corpus, refs, model.max_tokens), **kwargs)
+
+
+def _route(search_phrase: str, corpus: Corpus) -> Route:
+    route = default_router().route(search_phrase, corpus.tokens())
+    annotate("modelRoute", route.reason)
+    return route
+
+
+def _with_fallback(route: Route, call: Callable[[Model], Any]) -> Tuple[Model, Any]:
+    """
+    route の順に call(model) を試す。throttling なら次のモデルへ（それ以外の失敗はそのまま投げる）。
+    成功した試行の時間を bedrock_<tier> に記録する。
+    """
+    router = default_router()
+    for i, model in enumerate(route.models):
+        if i > 0:
+            incr("model_fallbacks")
+        t0 = time.perf_counter()
+        try:
+            out = call(model)
+        except DeadlineExceeded:
+            raise
+        except Exception as ex:
+            if not should_fall_back(ex):
+                raise
+            incr("bedrock_throttles")
+            router.mark_throttled(model.model_id)
+            print("[BEDROCK_THROTTLED]", {"model": model.model_id, "tier": model.tier, "error": str(ex)[:500]})
+            continue
+        record(f"bedrock_{model.tier}", (time.perf_counter() - t0) * 1000.0)
+        annotate("model", model.model_id)
+        annotate("modelTier", model.tier)
+        return model, out
+    raise ModelsThrottled(f"all Bedrock models are throttled: {', '.join(m.model_id for m in route.models)}")
+
+
+# botocore.exceptions を import せずに判定する（boto3 の import は最初の呼び出しまで遅らせている）
+_BOTO_TIMEOUTS = frozenset({"ReadTimeoutError", "ConnectTimeoutError"})
+
+
+def _bedrock_within(deadline: Deadline) -> Any:
+    """
+    残り時間（BEDROCK_READ_TIMEOUT_S まで）を read_timeout にした client。残りが無ければ DeadlineExceeded。
+    """
+    return _bedrock_client(max(1, int(deadline.timeout(BEDROCK_READ_TIMEOUT_S)))).get()
+
+
+def _summarize_with_bedrock(search_phrase: str, corpus: Corpus, refs: List[Dict[str, str]], deadline: Deadline) -> str:
+    if not BEDROCK_MODEL_ID:
+        raise ValueError("BEDROCK_MODEL_ID is empty")
+
+    def invoke(model: Model) -> Dict[str, Any]:
+        try:
+            r = _invoke_model(lambda **kw: _bedrock_within(deadline).invoke_model(**kw), model, search_phrase, corpus, refs)
+            return json.loads(r["body"].read())
+        except Exception as ex:
+            # botocore の timeout（read_timeout = 残り時間）は deadline 切れとして扱う
+            if type(ex).__name__ in _BOTO_TIMEOUTS:
+                raise DeadlineExceeded(f"Bedrock call did not finish in time: {str(ex)[:500]}") from ex
+            raise
+
+    route = _route(search_phrase, corpus)
+    incr("bedrock_calls")
+    with stage("bedrock_invoke"):
+        _, payload = _with_fallback(route, invoke)
+    record_usage(payload.get("usage"))
 
     # content: [{ "type": "text", "text": "..." }, ...]
     content = payload.get("content") or []
@@ -200,8 +509,21 @@ def _summarize_with_bedrock(search_phrase: str, corpus: str, refs: List[Dict[str
     return json.dumps(payload, ensure_ascii=False)
 
 
+def _search(args: Dict[str, Any], deadline: Deadline) -> Any:
+    search_args = {"search_phrase": args["search_phrase"], "limit": 10}
+    if "topics" in args:
+        search_args["topics"] = args["topics"]
+    return mcp_tools_call(MCP_ENDPOINT, TOOL_SEARCH, search_args, deadline=deadline)
+
+
+@traced("ask")
+@compressible
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    # deadline に間に合わなかった場合に 504 と一緒に返す途中結果
+    partial: Dict[str, Any] = {}
+    args: Dict[str, Any] = {}
     try:
+        deadline = Deadline.from_context(context)
         method = (event.get("requestContext", {}).get("http", {}).get("method") or event.get("httpMethod") or "").upper()
         raw_path = event.get("rawPath") or event.get("path") or ""
 
@@ -215,42 +537,65 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if method != "POST" or not raw_path.endswith("/api/ask"):
             return response(404, {"message": "Not Found"})
 
-        body = event.get("body") or ""
-        if event.get("isBase64Encoded"):
-            body = base64.b64decode(body).decode("utf-8", errors="replace")
+        with stage("body_decode"):
+            body = event.get("body") or ""
+            if event.get("isBase64Encoded"):
+                body = base64.b64decode(body).decode("utf-8", errors="replace")
+            req = json.loads(body) if body else {}
 
-        req = json.loads(body) if body else {}
         params = req.get("params") or req
-        args = _validate_args(params)
-
-        # 1) search
-        search_args = {"search_phrase": args["search_phrase"], "limit": 10}
-        if "topics" in args:
-            search_args["topics"] = args["topics"]
-        search_result = mcp_tools_call(MCP_ENDPOINT, TOOL_SEARCH, search_args)
-
-        # 2) pick URLs & read top-K
-        refs = _pick_urls_from_search(search_result, k=args["read_top_k"])
-        read_texts: List[Tuple[Dict[str, str], str]] = []
-
-        for ref in refs:
-            url = ref.get("url", "")
-            if not url:
-                continue
-            read_args = {"url": url, "max_length": args["read_max_length"], "start_index": 0}
-            read_result = mcp_tools_call(MCP_ENDPOINT, TOOL_READ, read_args)
-            text = _extract_text_from_read(read_result)
-            read_texts.append((ref, text))
-
-        corpus = _build_source_corpus(args["search_phrase"], refs, read_texts)
-        summary = _summarize_with_bedrock(args["search_phrase"], corpus, refs)
-
-        return response(200, {
-            "summary": summary,
-            "refs": refs,
-            "search": search_result,   # デバッグ用（不要なら削除OK）
-        })
-
+        with stage("validate"):
+            args = _validate_args(params)
+
+        # 0) 同じ（or 言い換えの）質問なら過去の回答を返す
+        answer_cache = default_answer_cache()
+        match, cached = answer_cache.get(args)
+        if cached is not None:
+            incr("cache_hits")
+            return response(200, project({**cached, "cache": match}, args["fields"]))
+
+        def answer_question() -> Dict[str, Any]:
+            # 1) search
+            search_result = _search(args, deadline)
+            partial["search"] = search_result
+
+            # 2) re-rank & read what the question needs (parallel, pipelined into the corpus builder)
+            plan = _plan(args, search_result)
+            partial["refs"] = _planned_refs(plan)
+            refs, corpus = _gather_corpus(args, plan, deadline)
+            partial["refs"] = refs
+            summary = _summarize_with_bedrock(args["search_phrase"], corpus, refs, deadline)
+
+            answer = {
+                "summary": summary,
+                "refs": refs,
+                "search": search_result,   # デバッグ用（不要なら削除OK）
+            }
+            answer_cache.put(args, answer)
+            return answer
+
+        def lookup() -> Tuple[bool, Any]:
+            _, found = answer_cache.get(args)
+            return found is not None, found
+
+        # 同じ質問が同時に来た場合、search/read/Bedrock は先行の 1 件だけが行い、残りはその回答を待つ
+        answer = coalesce(
+            ANSWER_TOOL,
+            normalize_args(args),
+            answer_question,
+            cache=answer_cache.store if answer_cache.enabled else None,
+            lookup=lookup,
+            deadline=deadline,
+            lease_ttl_s=ASK_LEASE_TTL_S,
+        )
+        return response(200, project(answer, args["fields"]))
+
+    except ModelsThrottled as mt:
+        print("[ASK_MODELS_THROTTLED]", {"error": str(mt)[:2000], "stages": sorted(partial)})
+        return response(503, project({"message": "Service Unavailable (Bedrock is throttling, retry later)", "partial": True, **partial}, args.get("fields")))
+    except DeadlineExceeded as de:
+        print("[ASK_DEADLINE_EXCEEDED]", {"error": str(de), "stages": sorted(partial)})
+        return response(504, project({"message": "Gateway Timeout", "partial": True, **partial}, args.get("fields")))
     except ValueError as ve:
         return response(400, {"message": str(ve)})
     except Exception as e:
@@ -285,10 +630,10 @@ def _unwrap_tool_json(tool_result: Any) -> Any:
         return None
 
 
-def _pick_urls_from_search(search_result: Any, k: int) -> List[Dict[str, str]]:
-    if k <= 0:
-        return []
-
+def _search_items(search_result: Any) -> List[Dict[str, str]]:
+    """
+    返り値: [{"title": "...", "url": "...", "context": "..."}, ...]（search の順、URL 重複なし）
+    """
     # まず tool result の text を JSON として解釈してみる
     inner = _unwrap_tool_json(search_result)
 
@@ -301,20 +646,21 @@ def _pick_urls_from_search(search_result: Any, k: int) -> List[Dict[str, str]]:
         if isinstance(maybe, dict) and isinstance(maybe.get("result"), list):
             items = maybe["result"]
 
-    refs: List[Dict[str, str]] = []
+    out: List[Dict[str, str]] = []
+    seen = set()
     if isinstance(items, list):
         for it in items:
             if not isinstance(it, dict):
                 continue
             url = str(it.get("url") or it.get("link") or "").strip()
-            if not url:
+            if not url or url in seen:
                 continue
+            seen.add(url)
             title = str(it.get("title") or it.get("name") or "").strip()
-            refs.append({"title": title, "url": url})
-            if len(refs) >= k:
-                break
+            context = str(it.get("context") or it.get("snippet") or "").strip()
+            out.append({"title": title, "url": url, "context": context})
 
-    return refs
+    return out
 
 
 def _extract_text_from_read(read_result: Any) -> str:
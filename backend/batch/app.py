@@ -0,0 +1,194 @@
+"""
+BatchFunction: POST /api/batch
+Runs several tool calls in one request.
+
+Request:
+  {"items": [{"tool": "aws___list_regions", "params": {}}, ...]}   (max 20)
+Response (always 200 unless the envelope itself is invalid):
+  {"results": [{"index": 0, "tool": "...", "ok": true, "status": 200, "result": {...}},
+               {"index": 1, "tool": "...", "ok": false, "status": 400, "message": "..."}],
+   "succeeded": 1, "failed": 1}
+
+A malformed item (non-object params, an unexpected exception) only fails that
+item (400 / 500); the other items are still returned. Every upstream call of an
+item is bounded by the invocation deadline; items not started by then are
+cancelled (504) and the running ones are awaited before the response is sent.
+
+Each item is validated by the same _validate_args as its single-tool function
+(backend/<tool>/app.py) and executed concurrently through mcp_tools_call
+(read items through the same document cache as /api/read).
+"""
+
+from __future__ import annotations
+
+import os
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List
+
+from mcp_proxy_lib.deadline import Deadline, DeadlineExceeded
+from mcp_proxy_lib.docstore import DEFAULT_WINDOW_CHARS, TOOL_READ, UpstreamToolError, default_document_store
+from mcp_proxy_lib.http_client import mcp_tools_call
+from mcp_proxy_lib.routes import TOOL_FUNCTIONS, load_function_module
+from mcp_proxy_lib.metrics import stage, traced
+from mcp_proxy_lib.security import compressible, response, verify_origin
+
+MCP_ENDPOINT = os.environ.get("MCP_ENDPOINT", "https://knowledge-mcp.global.api.aws").strip()
+ORIGIN_VERIFY_SECRET = (os.environ.get("ORIGIN_VERIFY_SECRET") or "").strip()
+
+MAX_ITEMS = 20
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY") or "8")
+# deadline の後、走行中の item の終了をさらに待つ上限（Deadline の reserve の範囲内）
+ITEM_SETTLE_GRACE_S = 1.0
+
+# backend/ （この関数は backend/ 全体を CodeUri にしている）
+FUNCTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _validate_items(req: Dict[str, Any]) -> List[Dict[str, Any]]:
+    items = req.get("items")
+    if not isinstance(items, list) or not items:
+        raise ValueError("items must be a non-empty array")
+    if len(items) > MAX_ITEMS:
+        raise ValueError(f"items must have at most {MAX_ITEMS} entries")
+    return items
+
+
+def _read_window(args: Dict[str, Any], deadline: Deadline) -> Any:
+    try:
+        return default_document_store(MCP_ENDPOINT).window(
+            args["url"],
+            args.get("start_index", 0),
+            args.get("max_length", DEFAULT_WINDOW_CHARS),
+            deadline=deadline,
+            version=args.get("version"),
+        )
+    except UpstreamToolError as ue:
+        return ue.result
+
+
+def _run_item(index: int, item: Any, deadline: Deadline) -> Dict[str, Any]:
+    tool = str(item.get("tool") or "") if isinstance(item, dict) else ""
+    out: Dict[str, Any] = {"index": index, "tool": tool}
+
+    if tool not in TOOL_FUNCTIONS:
+        return {**out, "ok": False, "status": 400, "message": f"unsupported tool: {tool or '(empty)'}"}
+
+    params = item.get("params")
+    if params is None:
+        params = {}
+    if not isinstance(params, dict):
+        return {**out, "ok": False, "status": 400, "message": "params must be an object"}
+
+    try:
+        mod = load_function_module(FUNCTIONS_DIR, TOOL_FUNCTIONS[tool])
+        args = mod._validate_args(params)
+    except ValueError as ve:
+        return {**out, "ok": False, "status": 400, "message": str(ve)}
+
+    try:
+        if mod.TOOL_NAME == TOOL_READ:
+            result = _read_window(args, deadline)
+        else:
+            result = mcp_tools_call(MCP_ENDPOINT, mod.TOOL_NAME, args, deadline=deadline)
+    except DeadlineExceeded:
+        return {**out, "ok": False, "status": 504, "message": "Timed out"}
+    except Exception as e:
+        print("[BATCH_ITEM_ERROR]", {"index": index, "tool": tool, "error": str(e)[:2000]})
+        return {**out, "ok": False, "status": 502, "message": str(e)[:2000]}
+
+    return {**out, "ok": True, "status": 200, "result": result}
+
+
+def _run_item_safe(index: int, item: Any, deadline: Deadline) -> Dict[str, Any]:
+    """
+    1 件の想定外の例外で batch 全体を 500 にしない。
+    """
+    try:
+        return _run_item(index, item, deadline)
+    except Exception as e:
+        import traceback
+        print("[BATCH_ITEM_ERROR]", {"index": index, "error": traceback.format_exc()[-2000:]})
+        tool = str(item.get("tool") or "") if isinstance(item, dict) else ""
+        return {"index": index, "tool": tool, "ok": False, "status": 500, "message": str(e)[:2000] or type(e).__name__}
+
+
+def _preload(items: List[Any]) -> None:
+    # 並列実行の前に使うツールのモジュールを 1 回ずつ読み込んでおく（失敗は item ごとに報告する）
+    tools = {it.get("tool") for it in items if isinstance(it, dict) and isinstance(it.get("tool"), str)}
+    for name in {TOOL_FUNCTIONS[t] for t in tools if t in TOOL_FUNCTIONS}:
+        try:
+            load_function_module(FUNCTIONS_DIR, name)
+        except Exception as e:
+            print("[BATCH_LOAD_ERROR]", {"function": name, "error": str(e)[:2000]})
+
+
+def _run_items(items: List[Any], deadline: Deadline) -> List[Dict[str, Any]]:
+    _preload(items)
+    pool = ThreadPoolExecutor(max_workers=max(1, min(BATCH_CONCURRENCY, len(items))))
+    futures = [pool.submit(_run_item_safe, i, it, deadline) for i, it in enumerate(items)]
+    try:
+        wait(futures, timeout=deadline.remaining())
+    finally:
+        # 未着手の item は取り消し、走行中のものは終わるのを待つ
+        # （upstream の各 attempt の timeout は deadline までなので長くは待たない。
+        #   待たずに返すと、凍結後の次の呼び出しで接続やメトリクスを使い続ける）
+        pool.shutdown(wait=False, cancel_futures=True)
+        running = [f for f in futures if not f.done()]
+        if running:
+            _, still = wait(running, timeout=deadline.remaining() + ITEM_SETTLE_GRACE_S)
+            if still:
+                print("[BATCH_ITEM_NOT_SETTLED]", {"indices": [futures.index(f) for f in still]})
+
+    results: List[Dict[str, Any]] = []
+    for i, (fut, it) in enumerate(zip(futures, items)):
+        if fut.done() and not fut.cancelled():
+            results.append(fut.result())
+        else:
+            tool = str(it.get("tool") or "") if isinstance(it, dict) else ""
+            results.append({"index": i, "tool": tool, "ok": False, "status": 504, "message": "Timed out"})
+    return results
+
+
+@traced("batch")
+@compressible
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    try:
+        deadline = Deadline.from_context(context)
+        method = (event.get("requestContext", {}).get("http", {}).get("method") or event.get("httpMethod") or "").upper()
+        raw_path = event.get("rawPath") or event.get("path") or ""
+
+        if method == "OPTIONS":
+            return response(200, {"ok": True})
+
+        headers = event.get("headers") or {}
+        if not verify_origin(headers, ORIGIN_VERIFY_SECRET):
+            return response(403, {"message": "Forbidden"})
+
+        if method != "POST" or not raw_path.endswith("/api/batch"):
+            return response(404, {"message": "Not Found"})
+
+        with stage("body_decode"):
+            body = event.get("body") or ""
+            if event.get("isBase64Encoded"):
+                body = base64.b64decode(body).decode("utf-8", errors="replace")
+            req = json.loads(body) if body else {}
+
+        with stage("validate"):
+            items = _validate_items(req.get("params") or req)
+
+        results = _run_items(items, deadline)
+        succeeded = sum(1 for r in results if r["ok"])
+        return response(200, {
+            "results": results,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+        })
+
+    except ValueError as ve:
+        return response(400, {"message": str(ve)})
+    except Exception as e:
+        import traceback
+        print("[HANDLER_ERROR]", traceback.format_exc())
+        return response(500, {"message": "Internal Server Error", "error": str(e)[:2000]})
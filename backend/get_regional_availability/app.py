@@ -1,6 +1,13 @@
 """
 RegionalAvailabilityFunction: POST /api/get_regional_availability
 Upstream tool: aws___get_regional_availability  (※必要なら変更)
+
+Matrix mode ("mode": "matrix") answers names x regions in one request:
+  {"mode": "matrix", "resource_type": "product", "names": ["AWS Lambda", ...], "regions": ["ap-northeast-1", ...]}
+  -> {"mode": "matrix", "names": [...], "regions": [...], "matrix": [[true, false, null], ...], ...}
+  matrix[i][j] は names[i] が regions[j] で使えるか（null = 判定できなかった）。regions を省略すると全 region。
+Cells come from the availability index (mcp_proxy_lib.availability); misses are
+fetched upstream per region, concurrently.
 """
 
 from __future__ import annotations
@@ -8,16 +15,23 @@ from __future__ import annotations
 import os
 import base64
 import json
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
+from mcp_proxy_lib.availability import default_availability_index
+from mcp_proxy_lib.deadline import Deadline, DeadlineExceeded
 from mcp_proxy_lib.http_client import mcp_tools_call
-from mcp_proxy_lib.security import response, verify_origin
+from mcp_proxy_lib.metrics import stage, traced
+from mcp_proxy_lib.security import compressible, response, verify_origin
 
 MCP_ENDPOINT = os.environ.get("MCP_ENDPOINT", "https://knowledge-mcp.global.api.aws").strip()
 ORIGIN_VERIFY_SECRET = (os.environ.get("ORIGIN_VERIFY_SECRET") or "").strip()
 
 TOOL_NAME = "aws___get_regional_availability"
 
+RESOURCE_TYPES = ("product", "api", "cfn")
+MAX_MATRIX_NAMES = 50
+MAX_MATRIX_REGIONS = 40
+
 
 def _as_str(v: Any) -> Optional[str]:
     if v is None:
@@ -34,6 +48,8 @@ def _validate_args(params: Dict[str, Any]) -> Dict[str, Any]:
     params = params or {}
     if not isinstance(params, dict):
         raise ValueError("body must be a JSON object")
+    if params.get("mode") == "matrix":
+        raise ValueError("mode=matrix is only supported by /api/get_regional_availability")
 
     out: Dict[str, Any] = {}
 
@@ -66,8 +82,64 @@ def _validate_args(params: Dict[str, Any]) -> Dict[str, Any]:
     return out
 
 
+def _str_list(v: Any, field: str, limit: int) -> List[str]:
+    """
+    配列 or カンマ区切り文字列 -> 重複を除いた文字列のリスト（順序は保つ）。
+    """
+    if v is None:
+        return []
+    if isinstance(v, str):
+        v = v.split(",")
+    if not isinstance(v, list):
+        raise ValueError(f"{field} must be an array of strings")
+    out = list(dict.fromkeys(s for s in (_as_str(x) for x in v if isinstance(x, (str, int, float))) if s))
+    if len(out) > limit:
+        raise ValueError(f"{field} must have at most {limit} entries")
+    return out
+
+
+def _validate_matrix_args(params: Dict[str, Any]) -> Dict[str, Any]:
+    resource_type = _as_str(params.get("resource_type")) or "product"
+    if resource_type not in RESOURCE_TYPES:
+        raise ValueError(f"resource_type must be one of {', '.join(RESOURCE_TYPES)}")
+    # names の別名として services / filters も受け付ける
+    raw_names = next((params[k] for k in ("names", "services", "filters") if params.get(k)), None)
+    names = _str_list(raw_names, "names", MAX_MATRIX_NAMES)
+    if not names:
+        raise ValueError("names is required")
+    return {
+        "resource_type": resource_type,
+        "names": names,
+        "regions": _str_list(params.get("regions"), "regions", MAX_MATRIX_REGIONS),
+    }
+
+
+def _matrix(args: Dict[str, Any], deadline: Deadline) -> Dict[str, Any]:
+    index = default_availability_index(MCP_ENDPOINT)
+    regions = args["regions"] or index.refresh_regions(deadline)[:MAX_MATRIX_REGIONS]
+    if not regions:
+        raise ValueError("regions is required (list_regions returned no regions)")
+    names = args["names"]
+    m = index.matrix(args["resource_type"], names, regions, deadline)
+    return {
+        "mode": "matrix",
+        "resource_type": args["resource_type"],
+        "names": names,
+        "regions": regions,
+        "matrix": [[m.cells[n][r] for r in regions] for n in names],
+        "missing": [[n, r] for n, r in m.missing],
+        # 使ったセルのうち最も古い観測時刻（epoch 秒）
+        "as_of": int(m.oldest_at) if m.oldest_at else None,
+        "upstream_calls": m.upstream_calls,
+        "errors": m.errors or {},
+    }
+
+
+@traced(TOOL_NAME)
+@compressible
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
+        deadline = Deadline.from_context(context)
         method = (
             (event.get("requestContext", {}).get("http", {}).get("method")
              or event.get("httpMethod") or "")
@@ -85,17 +157,28 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if method != "POST" or not raw_path.endswith("/api/get_regional_availability"):
             return response(404, {"message": "Not Found"})
 
-        body = event.get("body") or ""
-        if event.get("isBase64Encoded"):
-            body = base64.b64decode(body).decode("utf-8", errors="replace")
+        with stage("body_decode"):
+            body = event.get("body") or ""
+            if event.get("isBase64Encoded"):
+                body = base64.b64decode(body).decode("utf-8", errors="replace")
+            req = json.loads(body) if body else {}
 
-        req = json.loads(body) if body else {}
         params = req.get("params") or req
-        args = _validate_args(params)
+        if isinstance(params, dict) and params.get("mode") == "matrix":
+            with stage("validate"):
+                matrix_args = _validate_matrix_args(params)
+            return response(200, _matrix(matrix_args, deadline))
+
+        with stage("validate"):
+            args = _validate_args(params)
 
-        result = mcp_tools_call(MCP_ENDPOINT, TOOL_NAME, args)
+        result = mcp_tools_call(MCP_ENDPOINT, TOOL_NAME, args, deadline=deadline)
+        # 結果は可用性の索引にも取り込む（matrix 問い合わせで再利用）
+        default_availability_index(MCP_ENDPOINT).observe_call(args, result)
         return response(200, result)
 
+    except DeadlineExceeded:
+        return response(504, {"message": "Gateway Timeout"})
     except ValueError as ve:
         return response(400, {"message": str(ve)})
     except Exception as e:
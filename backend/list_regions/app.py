@@ -10,8 +10,10 @@ import base64
 import json
 from typing import Any, Dict
 
+from mcp_proxy_lib.deadline import Deadline, DeadlineExceeded
 from mcp_proxy_lib.http_client import mcp_tools_call
-from mcp_proxy_lib.security import response, verify_origin
+from mcp_proxy_lib.metrics import stage, traced
+from mcp_proxy_lib.security import compressible, response, verify_origin
 
 MCP_ENDPOINT = os.environ.get("MCP_ENDPOINT", "https://knowledge-mcp.global.api.aws").strip()
 ORIGIN_VERIFY_SECRET = (os.environ.get("ORIGIN_VERIFY_SECRET") or "").strip()
@@ -28,8 +30,11 @@ def _validate_args(params: Dict[str, Any]) -> Dict[str, Any]:
     return {}
 
 
+@traced(TOOL_NAME)
+@compressible
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
+        deadline = Deadline.from_context(context)
         method = (
             (event.get("requestContext", {}).get("http", {}).get("method")
              or event.get("httpMethod") or "")
@@ -47,17 +52,21 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if method != "POST" or not raw_path.endswith("/api/list_regions"):
             return response(404, {"message": "Not Found"})
 
-        body = event.get("body") or ""
-        if event.get("isBase64Encoded"):
-            body = base64.b64decode(body).decode("utf-8", errors="replace")
+        with stage("body_decode"):
+            body = event.get("body") or ""
+            if event.get("isBase64Encoded"):
+                body = base64.b64decode(body).decode("utf-8", errors="replace")
+            req = json.loads(body) if body else {}
 
-        req = json.loads(body) if body else {}
         params = req.get("params") or req
-        args = _validate_args(params)
+        with stage("validate"):
+            args = _validate_args(params)
 
-        result = mcp_tools_call(MCP_ENDPOINT, TOOL_NAME, args)
+        result = mcp_tools_call(MCP_ENDPOINT, TOOL_NAME, args, deadline=deadline)
         return response(200, result)
 
+    except DeadlineExceeded:
+        return response(504, {"message": "Gateway Timeout"})
     except ValueError as ve:
         return response(400, {"message": str(ve)})
     except Exception as e:
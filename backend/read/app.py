@@ -1,6 +1,9 @@
 """
 ReadFunction: POST /api/read
 Upstream tool: aws___read_documentation
+
+The document is fetched once into mcp_proxy_lib.docstore and windows
+(start_index/max_length or an opaque cursor) are served from that cache.
 """
 
 from __future__ import annotations
@@ -10,8 +13,11 @@ import base64
 import json
 from typing import Any, Dict
 
-from mcp_proxy_lib.http_client import mcp_tools_call
-from mcp_proxy_lib.security import response, verify_origin
+from mcp_proxy_lib.deadline import Deadline, DeadlineExceeded
+from mcp_proxy_lib.docstore import DEFAULT_WINDOW_CHARS, UpstreamToolError, decode_cursor, default_document_store
+from mcp_proxy_lib.metrics import stage, traced
+from mcp_proxy_lib.popularity import record_access
+from mcp_proxy_lib.security import compressible, response, verify_origin
 
 MCP_ENDPOINT = os.environ.get("MCP_ENDPOINT", "https://knowledge-mcp.global.api.aws").strip()
 ORIGIN_VERIFY_SECRET = (os.environ.get("ORIGIN_VERIFY_SECRET") or "").strip()
@@ -21,6 +27,12 @@ TOOL_NAME = "aws___read_documentation"
 
 def _validate_args(params: Dict[str, Any]) -> Dict[str, Any]:
     params = params or {}
+
+    # cursor は前回レスポンスの pagination.next_cursor / prev_cursor（url 等より優先）
+    cursor = params.get("cursor")
+    if isinstance(cursor, str) and cursor.strip():
+        return decode_cursor(cursor.strip())
+
     url = (params.get("url") or "").strip()
     if not url:
         raise ValueError("url is required")
@@ -42,8 +54,11 @@ def _validate_args(params: Dict[str, Any]) -> Dict[str, Any]:
     return out
 
 
+@traced(TOOL_NAME)
+@compressible
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
+        deadline = Deadline.from_context(context)
         method = (event.get("requestContext", {}).get("http", {}).get("method") or event.get("httpMethod") or "").upper()
         raw_path = event.get("rawPath") or event.get("path") or ""
 
@@ -57,17 +72,35 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if method != "POST" or not raw_path.endswith("/api/read"):
             return response(404, {"message": "Not Found"})
 
-        body = event.get("body") or ""
-        if event.get("isBase64Encoded"):
-            body = base64.b64decode(body).decode("utf-8", errors="replace")
+        with stage("body_decode"):
+            body = event.get("body") or ""
+            if event.get("isBase64Encoded"):
+                body = base64.b64decode(body).decode("utf-8", errors="replace")
+            req = json.loads(body) if body else {}
 
-        req = json.loads(body) if body else {}
         params = req.get("params") or req
-        args = _validate_args(params)
+        with stage("validate"):
+            args = _validate_args(params)
 
-        result = mcp_tools_call(MCP_ENDPOINT, TOOL_NAME, args)
+        try:
+            result = default_document_store(MCP_ENDPOINT).window(
+                args["url"],
+                args.get("start_index", 0),
+                args.get("max_length", DEFAULT_WINDOW_CHARS),
+                deadline=deadline,
+                version=args.get("version"),
+            )
+        except UpstreamToolError as ue:
+            # upstream のエラー結果はこれまで通りそのまま返す
+            result = ue.result
+        else:
+            # 文書を開いたとき（先頭ページ）だけ数える。warmer が上位 URL を先読みする
+            if not args.get("start_index"):
+                record_access(TOOL_NAME, args["url"])
         return response(200, result)
 
+    except DeadlineExceeded:
+        return response(504, {"message": "Gateway Timeout"})
     except ValueError as ve:
         return response(400, {"message": str(ve)})
     except Exception as e:
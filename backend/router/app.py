@@ -0,0 +1,57 @@
+"""
+RouterFunction: ANY /api/{proxy+}
+Consolidated deployment (DeploymentMode=router): one function serves every
+endpoint by dispatching to the per-tool handlers (backend/<name>/app.py)
+through mcp_proxy_lib.routes.ROUTES.
+
+All routes share one warm container, so the keep-alive connection pool,
+the tool/answer caches and the circuit breakers are shared across tools.
+Function modules are imported on first use (or all at once before a
+SnapStart snapshot).
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Any, Dict
+
+from mcp_proxy_lib.routes import ROUTES, load_function_module, route_for
+from mcp_proxy_lib.security import response, verify_origin
+from mcp_proxy_lib.snapstart import prime
+
+ORIGIN_VERIFY_SECRET = (os.environ.get("ORIGIN_VERIFY_SECRET") or "").strip()
+
+# backend/ （この関数は backend/ 全体を CodeUri にしている）
+FUNCTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_all() -> None:
+    for name in sorted(set(ROUTES.values())):
+        load_function_module(FUNCTIONS_DIR, name)
+
+
+prime(_load_all)
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    try:
+        method = (event.get("requestContext", {}).get("http", {}).get("method") or event.get("httpMethod") or "").upper()
+        raw_path = event.get("rawPath") or event.get("path") or ""
+
+        if method == "OPTIONS":
+            return response(200, {"ok": True})
+
+        name = route_for(method, raw_path)
+        if name is None:
+            headers = event.get("headers") or {}
+            if not verify_origin(headers, ORIGIN_VERIFY_SECRET):
+                return response(403, {"message": "Forbidden"})
+            return response(404, {"message": "Not Found"})
+
+        # origin 検証・body 解析・エラー応答は各 handler 側で行う
+        return load_function_module(FUNCTIONS_DIR, name).handler(event, context)
+
+    except Exception as e:
+        import traceback
+        print("[HANDLER_ERROR]", traceback.format_exc())
+        return response(500, {"message": "Internal Server Error", "error": str(e)[:2000]})
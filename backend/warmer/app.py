@@ -0,0 +1,141 @@
+"""
+WarmerFunction: EventBridge schedule (EnableWarmer=true, requires EnableSharedCache=true)
+Refreshes the shared cache ahead of user requests:
+
+- aws___list_regions
+- aws___get_regional_availability for WARM_REGIONS x WARM_AVAILABILITY
+  ({"<resource_type>": ["<filter>", ...]}, one filter per call, the same
+  arguments the UI sends); the results also rebuild the availability index
+  (mcp_proxy_lib.availability), whose snapshot is published for every container
+- the first window of the most-read documents (mcp_proxy_lib.popularity, plus
+  WARM_READ_URLS) and aws___recommend for the most-recommended URLs
+
+Every call bypasses the cache on read and overwrites it, so entries are
+renewed before their TTL runs out as long as the schedule is shorter than the
+TTLs (read/recommend 1h).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from mcp_proxy_lib.availability import default_availability_index, parse_regions
+from mcp_proxy_lib.cache import default_cache
+from mcp_proxy_lib.deadline import Deadline, DeadlineExceeded
+from mcp_proxy_lib.docstore import TOOL_READ, default_document_store
+from mcp_proxy_lib.http_client import mcp_tools_call
+from mcp_proxy_lib.popularity import top_urls
+
+MCP_ENDPOINT = os.environ.get("MCP_ENDPOINT", "https://knowledge-mcp.global.api.aws").strip()
+
+TOOL_LIST_REGIONS = "aws___list_regions"
+TOOL_AVAILABILITY = "aws___get_regional_availability"
+TOOL_RECOMMEND = "aws___recommend"
+
+WARM_TOP_N = int(os.environ.get("WARM_TOP_N") or 20)
+WARM_STATS_DAYS = int(os.environ.get("WARM_STATS_DAYS") or 7)
+WARM_CONCURRENCY = int(os.environ.get("WARM_CONCURRENCY") or 4)
+WARM_REGIONS = [r.strip() for r in (os.environ.get("WARM_REGIONS") or "ap-northeast-1,us-east-1").split(",") if r.strip()]
+WARM_READ_URLS = [u.strip() for u in (os.environ.get("WARM_READ_URLS") or "").split(",") if u.strip()]
+
+DEFAULT_WARM_AVAILABILITY: Dict[str, List[str]] = {
+    "cfn": [
+        "AWS::Lambda::Function",
+        "AWS::S3::Bucket",
+        "AWS::DynamoDB::Table",
+        "AWS::EC2::Instance",
+        "AWS::RDS::DBInstance",
+        "AWS::ECS::Service",
+        "AWS::Bedrock::Agent",
+    ],
+}
+
+Job = Tuple[str, Callable[[], Any]]
+
+
+def _warm_availability() -> Dict[str, List[str]]:
+    raw = (os.environ.get("WARM_AVAILABILITY") or "").strip()
+    if not raw:
+        return DEFAULT_WARM_AVAILABILITY
+    try:
+        return {str(k): [str(f) for f in v] for k, v in json.loads(raw).items()}
+    except Exception as ex:
+        print("[WARMER_CONFIG_ERROR]", {"WARM_AVAILABILITY": raw[:500], "error": str(ex)})
+        return DEFAULT_WARM_AVAILABILITY
+
+
+def _top(tool: str) -> List[str]:
+    try:
+        return top_urls(tool, WARM_TOP_N, WARM_STATS_DAYS)
+    except Exception as ex:
+        print("[WARMER_STATS_ERROR]", {"tool": tool, "error": str(ex)[:500]})
+        return []
+
+
+def _tool_job(tool: str, args: Dict[str, Any], deadline: Deadline) -> Job:
+    def run() -> Any:
+        result = mcp_tools_call(MCP_ENDPOINT, tool, args, deadline=deadline, refresh=True)
+        if not isinstance(result, dict) or result.get("isError"):
+            raise RuntimeError("upstream returned an error result")
+        if tool == TOOL_AVAILABILITY:
+            default_availability_index(MCP_ENDPOINT).observe_call(args, result)
+        elif tool == TOOL_LIST_REGIONS:
+            default_availability_index(MCP_ENDPOINT).index.set_regions(parse_regions(result))
+        return result
+    return f"{tool} {json.dumps(args, ensure_ascii=False, sort_keys=True)}", run
+
+
+def _read_job(url: str, deadline: Deadline) -> Job:
+    return f"{TOOL_READ} {url}", lambda: default_document_store(MCP_ENDPOINT).refresh(url, deadline=deadline)
+
+
+def _jobs(deadline: Deadline) -> List[Job]:
+    jobs: List[Job] = [_tool_job(TOOL_LIST_REGIONS, {}, deadline)]
+    for resource_type, filters in _warm_availability().items():
+        for region in WARM_REGIONS:
+            for f in filters:
+                jobs.append(_tool_job(TOOL_AVAILABILITY, {"region": region, "resource_type": resource_type, "filters": [f]}, deadline))
+
+    # 設定した URL を優先し、残りをアクセス数の多い順で埋める
+    read_urls = list(dict.fromkeys(WARM_READ_URLS + _top(TOOL_READ)))[:max(WARM_TOP_N, len(WARM_READ_URLS))]
+    jobs.extend(_read_job(url, deadline) for url in read_urls)
+    jobs.extend(_tool_job(TOOL_RECOMMEND, {"url": url}, deadline) for url in _top(TOOL_RECOMMEND))
+    return jobs
+
+
+def _run(name: str, fn: Callable[[], Any], deadline: Deadline) -> str:
+    if deadline.expired():
+        return "skipped"
+    try:
+        fn()
+        return "ok"
+    except DeadlineExceeded:
+        return "skipped"
+    except Exception as e:
+        print("[WARMER_JOB_ERROR]", {"job": name[:500], "error": str(e)[:500]})
+        return "failed"
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    if default_cache().shared is None:
+        # 共有キャッシュが無いと温めてもこのコンテナ以外に効かない
+        print("[WARMER_SKIPPED]", {"reason": "MCP_CACHE_TABLE is not set"})
+        return {"skipped": True}
+
+    deadline = Deadline.from_context(context)
+    jobs = _jobs(deadline)
+    with ThreadPoolExecutor(max_workers=max(1, WARM_CONCURRENCY)) as pool:
+        outcomes = list(pool.map(lambda job: _run(job[0], job[1], deadline), jobs))
+
+    summary = {k: outcomes.count(k) for k in ("ok", "failed", "skipped")}
+    index = default_availability_index(MCP_ENDPOINT)
+    # 前回のスナップショットに今回の観測を重ねて公開する
+    index.reload(force=True)
+    summary["index_published"] = index.publish()
+    summary["index_regions"] = len(index.index.regions)
+    summary["jobs"] = len(jobs)
+    print("[WARMER]", summary)
+    return summary
@@ -0,0 +1,253 @@
+"""
+bench/fake_bedrock.py
+
+Local stand-in for the bedrock-runtime InvokeModel / InvokeModelWithResponseStream
+REST API (Anthropic messages format), used by bench/run.py.
+
+boto3 is pointed at it with AWS_ENDPOINT_URL_BEDROCK_RUNTIME, so the real
+botocore serializer, SigV4 signer and event-stream parser stay in the
+measured path.
+
+- latency_ms: time to first token (and the whole think time for invoke).
+- output_tokens / token_delay_ms: number of text deltas in the stream and the
+  gap between them.
+- Streaming responses use the binary application/vnd.amazon.eventstream
+  framing (prelude + headers + payload, CRC32 checksums).
+- Prompt caching: a prefix ending at a cache_control block that was sent
+  before is reported as cache_read_input_tokens (otherwise
+  cache_creation_input_tokens) and shortens the time to first token in
+  proportion (cached_prefix_speedup).
+- throttle_models: model ids answered with 429 ThrottlingException (to
+  exercise model fallback).
+
+Run standalone:  python bench/fake_bedrock.py --port 8766 --latency-ms 400
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import json
+import re
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_PATH_RE = re.compile(r"^/model/(?P<model>[^/]+)/(?P<op>invoke|invoke-with-response-stream)$")
+_TOKEN_TEXT = "Lambda の設定は関数ごとにメモリとタイムアウトを指定します。"
+
+
+@dataclass
+class FakeBedrockConfig:
+    latency_ms: float = 300.0
+    output_tokens: int = 60
+    token_delay_ms: float = 5.0
+    # cache から読んだ入力の割合 x に対して latency を (1 - x * speedup) 倍にする
+    cached_prefix_speedup: float = 0.5
+    throttle_models: Tuple[str, ...] = ()
+
+
+def _string_header(name: str, value: str) -> bytes:
+    n = name.encode("utf-8")
+    v = value.encode("utf-8")
+    # header value type 7 = string
+    return struct.pack("!B", len(n)) + n + struct.pack("!BH", 7, len(v)) + v
+
+
+def encode_event(payload: Dict[str, Any], event_type: str = "chunk") -> bytes:
+    """
+    1 イベント分の eventstream メッセージ。payload は {"bytes": base64(json)} で包む。
+    """
+    headers = (
+        _string_header(":event-type", event_type)
+        + _string_header(":content-type", "application/json")
+        + _string_header(":message-type", "event")
+    )
+    inner = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    body = json.dumps({"bytes": base64.b64encode(inner).decode("ascii")}).encode("utf-8")
+    total = 12 + len(headers) + len(body) + 4
+    prelude = struct.pack("!II", total, len(headers))
+    prelude += struct.pack("!I", zlib.crc32(prelude))
+    message = prelude + headers + body
+    return message + struct.pack("!I", zlib.crc32(message))
+
+
+def _deltas(n: int) -> List[str]:
+    return [_TOKEN_TEXT[i % len(_TOKEN_TEXT)] for i in range(max(0, n))]
+
+
+def _input_tokens(req: Dict[str, Any]) -> int:
+    return len(json.dumps(req, ensure_ascii=False)) // 3
+
+
+def _blocks(req: Dict[str, Any]) -> List[Any]:
+    system = req.get("system")
+    out: List[Any] = list(system) if isinstance(system, list) else [system or ""]
+    for m in req.get("messages") or []:
+        content = m.get("content")
+        out.extend(content if isinstance(content, list) else [content or ""])
+    return out
+
+
+def _usage(req: Dict[str, Any], seen: Dict[str, int]) -> Dict[str, int]:
+    """
+    cache_control の付いたブロックまでの prefix を checkpoint とみなす（最長一致で cache read）。
+    """
+    total = _input_tokens(req)
+    h = hashlib.sha256()
+    tokens = 0
+    read = write = 0
+    for b in _blocks(req):
+        raw = json.dumps(b, ensure_ascii=False, sort_keys=True)
+        h.update(raw.encode("utf-8"))
+        tokens += len(raw) // 3
+        if isinstance(b, dict) and b.get("cache_control"):
+            key = h.hexdigest()
+            if key in seen:
+                read, write = tokens, 0
+            else:
+                seen[key] = tokens
+                write = tokens - read
+    read = min(read, total)
+    write = min(write, total - read)
+    return {"input_tokens": total - read - write, "cache_read_input_tokens": read, "cache_creation_input_tokens": write}
+
+
+def _stream_events(req: Dict[str, Any], cfg: FakeBedrockConfig, usage: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+    usage = dict(usage, output_tokens=0)
+    yield {"type": "message_start", "message": {"role": "assistant", "content": [], "usage": usage}}
+    yield {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}
+    deltas = _deltas(cfg.output_tokens)
+    for text in deltas:
+        yield {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}
+    yield {"type": "content_block_stop", "index": 0}
+    yield {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": len(deltas)}}
+    yield {"type": "message_stop"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeBedrockServer"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, obj: Any, extra: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (extra or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        cfg = self.server.config
+        n = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(n)
+        m = _PATH_RE.match(self.path.split("?", 1)[0])
+        if not m:
+            self._send_json(404, {"message": f"Unknown operation {self.path}"}, {"x-amzn-ErrorType": "UnknownOperationException"})
+            return
+        try:
+            req = json.loads(raw or b"{}")
+        except ValueError:
+            self._send_json(400, {"message": "Malformed input request"}, {"x-amzn-ErrorType": "ValidationException"})
+            return
+        self.server.count_request()
+        if m.group("model") in cfg.throttle_models:
+            self._send_json(429, {"message": "Too many requests, please wait before trying again."}, {"x-amzn-ErrorType": "ThrottlingException"})
+            return
+        usage = self.server.usage(req)
+
+        if cfg.latency_ms > 0:
+            cached = usage["cache_read_input_tokens"] / max(1, sum(usage.values()))
+            time.sleep(cfg.latency_ms * (1.0 - cached * cfg.cached_prefix_speedup) / 1000.0)
+
+        if m.group("op") == "invoke":
+            # 非ストリームでも生成時間はトークン数に比例させる
+            if cfg.token_delay_ms > 0:
+                time.sleep(cfg.output_tokens * cfg.token_delay_ms / 1000.0)
+            text = "".join(_deltas(cfg.output_tokens))
+            self._send_json(200, {
+                "id": "msg_bench",
+                "type": "message",
+                "role": "assistant",
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "usage": dict(usage, output_tokens=cfg.output_tokens),
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("X-Amzn-Bedrock-Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for ev in _stream_events(req, cfg, usage):
+            frame = encode_event(ev)
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+            self.wfile.flush()
+            if ev.get("type") == "content_block_delta" and cfg.token_delay_ms > 0:
+                time.sleep(cfg.token_delay_ms / 1000.0)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeBedrockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], config: FakeBedrockConfig) -> None:
+        super().__init__(address, _Handler)
+        self.config = config
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._prompt_cache: Dict[str, int] = {}
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def usage(self, req: Dict[str, Any]) -> Dict[str, int]:
+        with self._lock:
+            return _usage(req, self._prompt_cache)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start(config: FakeBedrockConfig, host: str = "127.0.0.1", port: int = 0) -> FakeBedrockServer:
+    server = FakeBedrockServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name="fake-bedrock", daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    p = argparse.ArgumentParser(description="Fake bedrock-runtime (InvokeModel / InvokeModelWithResponseStream)")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8766)
+    p.add_argument("--latency-ms", type=float, default=300.0)
+    p.add_argument("--output-tokens", type=int, default=60)
+    p.add_argument("--token-delay-ms", type=float, default=5.0)
+    p.add_argument("--throttle-models", default="", help="comma-separated model ids to answer with ThrottlingException")
+    a = p.parse_args(argv)
+    cfg = FakeBedrockConfig(
+        latency_ms=a.latency_ms,
+        output_tokens=a.output_tokens,
+        token_delay_ms=a.token_delay_ms,
+        throttle_models=tuple(m.strip() for m in a.throttle_models.split(",") if m.strip()),
+    )
+    server = FakeBedrockServer((a.host, a.port), cfg)
+    print(f"fake bedrock-runtime listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+bench/fake_mcp.py
+
+Local stand-in for the AWS Knowledge MCP Server (Streamable HTTP, JSON-RPC
+"tools/call"), used by bench/run.py.
+
+- Answers every tool the proxy calls with synthetic but realistically shaped
+  results (search hits as a JSON array in a text block, markdown pages, ...).
+- latency_ms: server think time before the first byte (per HTTP request).
+- payload_bytes: size of the read/recommend text. A read URL may carry
+  "?chars=N" to make that document N characters long instead.
+- aws___read_documentation pages like the real server: start_index /
+  max_length (default 5000) cut the document, every segment starts with
+  "AWS Documentation from <url>:" and a cut segment ends with the
+  "<e>Content truncated. ... start_index=N ...</e>" hint.
+- sse_chunk_bytes / chunk_delay_ms: the SSE body is written with chunked
+  transfer encoding in pieces of this size, optionally spaced out, so the
+  incremental decoder is exercised the way a real stream would.
+- sse=False answers application/json instead of text/event-stream.
+- JSON-RPC batches are answered unless batch=False (then 400 like a server
+  that does not support batching).
+
+Run standalone:  python bench/fake_mcp.py --port 8765 --latency-ms 80
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+_PARAGRAPH = (
+    "AWS Lambda runs your code on a high-availability compute infrastructure and performs "
+    "all of the administration of the compute resources, including server and operating system "
+    "maintenance, capacity provisioning and automatic scaling, and logging. "
+    "Lambda の関数は設定したメモリ量に比例して CPU が割り当てられます。\n\n"
+)
+
+
+@dataclass
+class FakeMCPConfig:
+    latency_ms: float = 50.0
+    payload_bytes: int = 16 * 1024
+    sse: bool = True
+    sse_chunk_bytes: int = 4096
+    chunk_delay_ms: float = 0.0
+    search_hits: int = 10
+    batch: bool = True
+
+
+def _search_result(args: Dict[str, Any], hits: int) -> str:
+    phrase = str(args.get("search_phrase") or "")
+    items = [
+        {
+            "rank_order": i + 1,
+            "title": f"Bench Developer Guide - page {i}",
+            "url": f"https://docs.aws.amazon.com/bench/latest/dg/page-{i}.html",
+            "context": f"{phrase}: {_PARAGRAPH[:160]}",
+        }
+        for i in range(hits)
+    ]
+    return json.dumps(items, ensure_ascii=False)
+
+
+def _document(args: Dict[str, Any], size: int) -> str:
+    head = f"# {args.get('url', 'document')}\n\n"
+    body = (_PARAGRAPH * (size // len(_PARAGRAPH) + 1))[:max(0, size - len(head))]
+    return head + body
+
+
+def _read_result(args: Dict[str, Any], size: int) -> str:
+    url = str(args.get("url") or "")
+    try:
+        size = int(parse_qs(urlsplit(url).query).get("chars", [size])[0])
+    except ValueError:
+        pass
+    content = _document(args, size)
+    start = int(args.get("start_index") or 0)
+    length = int(args.get("max_length") or 5000)
+    head = f"AWS Documentation from {url}:\n\n"
+    if start >= len(content):
+        return head + "<e>No more content available.</e>"
+    piece = content[start:start + length]
+    if start + len(piece) < len(content):
+        piece += (
+            f"\n\n<e>Content truncated. Call the read_documentation tool with start_index={start + len(piece)} "
+            "to get more content.</e>"
+        )
+    return head + piece
+
+
+def _tool_text(name: str, args: Dict[str, Any], cfg: FakeMCPConfig) -> str:
+    if name == "aws___search_documentation":
+        return _search_result(args, cfg.search_hits)
+    if name == "aws___read_documentation":
+        return _read_result(args, cfg.payload_bytes)
+    if name == "aws___recommend":
+        return _document(args, cfg.payload_bytes)
+    if name == "aws___list_regions":
+        regions = ["us-east-1", "us-east-2", "us-west-2", "eu-west-1", "eu-central-1", "ap-northeast-1", "ap-southeast-1"]
+        return json.dumps([{"region_id": r, "region_long_name": r} for r in regions])
+    if name == "aws___get_regional_availability":
+        return json.dumps({"service": args.get("service"), "region": args.get("region"), "isAvailableIn": True})
+    raise KeyError(name)
+
+
+def _answer(req: Dict[str, Any], cfg: FakeMCPConfig) -> Dict[str, Any]:
+    params = req.get("params") or {}
+    name = params.get("name") or ""
+    try:
+        text = _tool_text(name, params.get("arguments") or {}, cfg)
+    except KeyError:
+        return {"jsonrpc": "2.0", "id": req.get("id"), "error": {"code": -32602, "message": f"Unknown tool: {name}"}}
+    return {"jsonrpc": "2.0", "id": req.get("id"), "result": {"content": [{"type": "text", "text": text}], "isError": False}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeMCPServer"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, ctype: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        cfg = self.server.config
+        n = int(self.headers.get("Content-Length") or 0)
+        try:
+            req = json.loads(self.rfile.read(n) or b"null")
+        except ValueError:
+            self._send(400, "application/json", b'{"jsonrpc":"2.0","id":null,"error":{"code":-32700,"message":"Parse error"}}')
+            return
+        self.server.count_request()
+
+        if isinstance(req, list):
+            if not cfg.batch:
+                self._send(400, "application/json", b'{"jsonrpc":"2.0","id":null,"error":{"code":-32600,"message":"batch not supported"}}')
+                return
+            msgs = [_answer(r, cfg) for r in req if isinstance(r, dict)]
+        elif isinstance(req, dict):
+            msgs = [_answer(req, cfg)]
+        else:
+            self._send(400, "application/json", b'{"jsonrpc":"2.0","id":null,"error":{"code":-32600,"message":"Invalid Request"}}')
+            return
+
+        if cfg.latency_ms > 0:
+            time.sleep(cfg.latency_ms / 1000.0)
+
+        if not cfg.sse:
+            body = json.dumps(msgs if isinstance(req, list) else msgs[0], ensure_ascii=False).encode("utf-8")
+            self._send(200, "application/json", body)
+            return
+
+        body = "".join(f"event: message\ndata: {json.dumps(m, ensure_ascii=False)}\n\n" for m in msgs).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        step = max(1, cfg.sse_chunk_bytes)
+        for i in range(0, len(body), step):
+            piece = body[i:i + step]
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+            self.wfile.flush()
+            if cfg.chunk_delay_ms > 0:
+                time.sleep(cfg.chunk_delay_ms / 1000.0)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeMCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], config: FakeMCPConfig) -> None:
+        super().__init__(address, _Handler)
+        self.config = config
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+
+def start(config: FakeMCPConfig, host: str = "127.0.0.1", port: int = 0) -> FakeMCPServer:
+    """
+    別スレッドで起動して返す（port=0 なら空きポート）。止めるときは shutdown()。
+    """
+    server = FakeMCPServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name="fake-mcp", daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    p = argparse.ArgumentParser(description="Fake AWS Knowledge MCP Server (Streamable HTTP)")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--latency-ms", type=float, default=50.0)
+    p.add_argument("--payload-bytes", type=int, default=16 * 1024)
+    p.add_argument("--sse-chunk-bytes", type=int, default=4096)
+    p.add_argument("--chunk-delay-ms", type=float, default=0.0)
+    p.add_argument("--json", action="store_true", help="answer application/json instead of SSE")
+    p.add_argument("--no-batch", action="store_true", help="reject JSON-RPC batches")
+    a = p.parse_args(argv)
+    cfg = FakeMCPConfig(
+        latency_ms=a.latency_ms,
+        payload_bytes=a.payload_bytes,
+        sse=not a.json,
+        sse_chunk_bytes=a.sse_chunk_bytes,
+        chunk_delay_ms=a.chunk_delay_ms,
+        batch=not a.no_batch,
+    )
+    server = FakeMCPServer((a.host, a.port), cfg)
+    print(f"fake MCP listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
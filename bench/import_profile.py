@@ -0,0 +1,140 @@
+"""
+bench/import_profile.py
+
+Import-time (INIT) profile for each function.
+
+Runs `python -X importtime -c "import app"` for every backend/<name>/ with the
+layer on sys.path (the same layout as the Lambda runtime: /var/task +
+/opt/python), several times in fresh interpreters, and reports per function:
+
+- median total import time of app (module-level code included, e.g. client
+  construction), which is what INIT duration is made of
+- the heaviest direct imports of app and the heaviest modules by self time
+
+  python bench/import_profile.py                  # all functions
+  python bench/import_profile.py --only ask -r 7 --top 15
+  python bench/import_profile.py --prime          # PRIME_ON_INIT=true (what SnapStart/PC snapshots)
+
+Results depend on what is installed locally (boto3 should match the runtime).
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+LAYER_DIR = os.path.join(ROOT_DIR, "layer", "python")
+
+# "import time:       414 |      83137 |   mcp_proxy_lib.cache"
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+# (self_us, cumulative_us, depth, module)
+Row = Tuple[int, int, int, str]
+
+
+class Profile(NamedTuple):
+    total_ms: float
+    direct_ms: Dict[str, float]
+    self_ms: Dict[str, float]
+
+
+def _functions() -> List[str]:
+    return sorted(
+        d for d in os.listdir(BACKEND_DIR)
+        if os.path.isfile(os.path.join(BACKEND_DIR, d, "app.py"))
+    )
+
+
+def _profile_once(name: str, prime: bool) -> List[Row]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([os.path.join(BACKEND_DIR, name), LAYER_DIR])
+    env.setdefault("AWS_REGION", "us-east-1")
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    env["METRICS_ENABLED"] = "false"
+    if prime:
+        env["PRIME_ON_INIT"] = "true"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        env=env,
+        cwd=os.path.join(BACKEND_DIR, name),
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        tail = proc.stderr.strip().splitlines()[-1:] or ["(no output)"]
+        raise RuntimeError(f"{name}: import failed: {tail[0]}")
+    rows: List[Row] = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            # 階層は module 名前のスペース数（2 個で 1 段）
+            rows.append((int(m.group(1)), int(m.group(2)), (len(m.group(3)) - 1) // 2, m.group(4)))
+    return rows
+
+
+def _direct_imports(rows: List[Row]) -> Dict[str, int]:
+    """
+    app が直接 import したモジュール（depth 1）の cumulative。
+    """
+    return {mod: cum for _, cum, depth, mod in rows if depth == 1}
+
+
+def profile(name: str, runs: int, prime: bool) -> Profile:
+    totals: List[int] = []
+    direct: Dict[str, List[int]] = {}
+    selfs: Dict[str, List[int]] = {}
+    # 1 回目は .pyc の生成を含むので捨てる
+    _profile_once(name, prime)
+    for _ in range(runs):
+        rows = _profile_once(name, prime)
+        totals.append(next((cum for _, cum, depth, mod in rows if mod == "app" and depth == 0), 0))
+        for mod, cum in _direct_imports(rows).items():
+            direct.setdefault(mod, []).append(cum)
+        for self_us, _, _, mod in rows:
+            selfs.setdefault(mod, []).append(self_us)
+    return Profile(
+        total_ms=statistics.median(totals) / 1000.0,
+        direct_ms={m: statistics.median(v) / 1000.0 for m, v in direct.items()},
+        self_ms={m: statistics.median(v) / 1000.0 for m, v in selfs.items()},
+    )
+
+
+def _print_top(title: str, values: Dict[str, float], top: int) -> None:
+    print(f"  {title}")
+    for mod, ms in sorted(values.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"    {ms:9.2f} ms  {mod}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    p = argparse.ArgumentParser(description="Import-time (INIT) profile per function")
+    p.add_argument("--only", default="", help="comma separated function dirs (default: all)")
+    p.add_argument("-r", "--runs", type=int, default=5)
+    p.add_argument("--top", type=int, default=8)
+    p.add_argument("--prime", action="store_true", help="run SnapStart/provisioned-concurrency primers at import")
+    a = p.parse_args(argv)
+
+    names = [s.strip() for s in a.only.split(",") if s.strip()] or _functions()
+    summary: List[Tuple[str, float]] = []
+    for name in names:
+        r = profile(name, max(1, a.runs), a.prime)
+        summary.append((name, r.total_ms))
+        print(f"== {name}: {r.total_ms:.2f} ms (median of {a.runs})")
+        _print_top("direct imports of app (cumulative):", r.direct_ms, a.top)
+        _print_top("heaviest modules (self):", r.self_ms, a.top)
+        print()
+
+    print(f"{'function':<28}{'import ms':>12}")
+    for name, ms in summary:
+        print(f"{name:<28}{ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+bench/run.py
+
+Offline benchmark for the backend handlers.
+
+Starts bench/fake_mcp.py and bench/fake_bedrock.py as subprocesses (so their
+threads and allocations stay out of the measurement), points the functions at
+them through the same environment variables the Lambdas use, and drives each
+backend/<name>/app.py::handler with synthetic API Gateway (HTTP API v2) events.
+
+Per scenario it reports:
+- throughput (requests/s, wall clock over all workers)
+- latency p50 / p90 / p99 / max (ms)
+- allocations: peak traced memory per request and retained growth over the
+  run (tracemalloc, measured in a separate sequential pass)
+- median response size on the wire (--accept-encoding "gzip, br" to measure
+  compressed responses)
+
+Caches are disabled by default so every request pays the upstream path; use
+--cache to measure warm-cache behaviour. --save writes the numbers as JSON and
+--baseline prints the change against a previous --save.
+
+  python bench/run.py                         # all scenarios, 50 requests each
+  python bench/run.py --only ask -n 20 --mcp-latency-ms 120
+  python bench/run.py --save before.json      # ...change code...
+  python bench/run.py --baseline before.json
+  python bench/run.py --router                # every scenario through backend/router/app.py
+  python bench/run.py --only ask --bedrock-throttle   # primary model throttled, answered by the fallback
+
+Requires boto3 (as in the Lambda runtime) for the ask scenarios.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import contextlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+LAYER_DIR = os.path.join(ROOT_DIR, "layer", "python")
+
+BENCH_MODEL_ID = "bench.fake-model-v1"
+BENCH_FALLBACK_MODEL_ID = "bench.fake-model-fallback-v1"
+
+# scenario -> (backend/<dir>, path, params(i))
+SCENARIOS: Dict[str, Tuple[str, str, Callable[[int], Dict[str, Any]]]] = {
+    "search": ("search", "/api/search", lambda i: {"search_phrase": f"lambda timeout {i}"}),
+    "read": ("read", "/api/read", lambda i: {"url": f"https://docs.aws.amazon.com/bench/page-{i}.html", "max_length": 5000}),
+    # 複数セグメントにまたがる文書（fake_mcp は ?chars=N の長さで返す）
+    "read_paged": ("read", "/api/read", lambda i: {"url": f"https://docs.aws.amazon.com/bench/paged-{i}.html?chars=240000", "start_index": 45000, "max_length": 10000}),
+    "read_deep": ("read", "/api/read", lambda i: {"url": f"https://docs.aws.amazon.com/bench/deep-{i}.html?chars=240000", "start_index": 150000, "max_length": 5000}),
+    "recommend": ("recommend", "/api/recommend", lambda i: {"url": f"https://docs.aws.amazon.com/bench/page-{i}.html"}),
+    "list_regions": ("list_regions", "/api/list_regions", lambda i: {}),
+    "get_regional_availability": (
+        "get_regional_availability", "/api/get_regional_availability",
+        lambda i: {"service": f"service-{i}", "region": "us-east-1"},
+    ),
+    "batch": ("batch", "/api/batch", lambda i: {"items": [
+        {"tool": "aws___search_documentation", "params": {"search_phrase": f"s3 encryption {i}"}},
+        {"tool": "aws___read_documentation", "params": {"url": f"https://docs.aws.amazon.com/bench/batch-{i}.html"}},
+        {"tool": "aws___list_regions", "params": {}},
+    ]}),
+    "ask": ("ask", "/api/ask", lambda i: {"search_phrase": f"Lambda のタイムアウト設定 {i}", "read_top_k": 3}),
+}
+
+
+class _Context:
+    """
+    Lambda context の代わり（get_remaining_time_in_millis は実時間で減る）。
+    """
+
+    def __init__(self, function_name: str, timeout_ms: int) -> None:
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self._deadline = time.monotonic() + timeout_ms / 1000.0
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+def _event(path: str, params: Dict[str, Any], accept_encoding: str = "") -> Dict[str, Any]:
+    headers = {"content-type": "application/json"}
+    if accept_encoding:
+        headers["accept-encoding"] = accept_encoding
+    return {
+        "version": "2.0",
+        "rawPath": path,
+        "requestContext": {"http": {"method": "POST", "path": path}},
+        "headers": headers,
+        "body": json.dumps({"params": params}, ensure_ascii=False),
+        "isBase64Encoded": False,
+    }
+
+
+def _ok(resp: Dict[str, Any]) -> bool:
+    status = resp.get("statusCode") or 0
+    return 200 <= status < 300
+
+
+def _body_bytes(resp: Dict[str, Any]) -> bytes:
+    # API Gateway がクライアントに送るバイト列（isBase64Encoded ならデコード後）
+    body = resp.get("body") or ""
+    if resp.get("isBase64Encoded"):
+        return base64.b64decode(body)
+    return str(body).encode("utf-8")
+
+
+def _percentile(sorted_ms: List[float], p: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    k = max(0, min(len(sorted_ms) - 1, int(round(p / 100.0 * len(sorted_ms) + 0.5)) - 1))
+    return sorted_ms[k]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_listening(port: int, timeout_s: float = 10.0) -> None:
+    end = time.monotonic() + timeout_s
+    while time.monotonic() < end:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"stub server did not start on port {port}")
+
+
+def _spawn(script: str, port: int, args: List[str]) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, script), "--port", str(port), *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    _wait_listening(port)
+    return proc
+
+
+def _configure_env(mcp_port: int, bedrock_port: int, a: argparse.Namespace) -> None:
+    os.environ.update({
+        "MCP_ENDPOINT": f"http://127.0.0.1:{mcp_port}/",
+        "AWS_ENDPOINT_URL_BEDROCK_RUNTIME": f"http://127.0.0.1:{bedrock_port}",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_REGION": "us-east-1",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_EC2_METADATA_DISABLED": "true",
+        "BEDROCK_MODEL_ID": BENCH_MODEL_ID,
+        "BEDROCK_FALLBACK_MODEL_IDS": BENCH_FALLBACK_MODEL_ID,
+        "METRICS_ENABLED": "true" if a.metrics else "false",
+    })
+    os.environ.pop("ORIGIN_VERIFY_SECRET", None)
+    os.environ.pop("MCP_CACHE_TABLE", None)
+    if a.batch_reads:
+        os.environ["MCP_JSONRPC_BATCH"] = "true"
+    if not a.cache:
+        os.environ["MCP_CACHE_TTLS"] = json.dumps({
+            "aws___search_documentation": 0,
+            "aws___read_documentation": 0,
+            "aws___recommend": 0,
+            "aws___list_regions": 0,
+            "aws___get_regional_availability": 0,
+        })
+        os.environ["ASK_CACHE_TTL_S"] = "0"
+    if LAYER_DIR not in sys.path:
+        sys.path.insert(0, LAYER_DIR)
+
+
+def _load_handler(name: str) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    from mcp_proxy_lib.routes import load_function_module
+    return load_function_module(BACKEND_DIR, name).handler
+
+
+def _run_scenario(name: str, a: argparse.Namespace) -> Dict[str, Any]:
+    fn_dir, path, params = SCENARIOS[name]
+    handler = _load_handler("router" if a.router else fn_dir)
+    counter = iter(range(1 << 30))
+    lock = threading.Lock()
+
+    def one() -> Tuple[float, bool, int]:
+        with lock:
+            i = next(counter)
+        ev = _event(path, params(i), a.accept_encoding)
+        t0 = time.perf_counter()
+        resp = handler(ev, _Context(fn_dir, a.timeout_ms))
+        return (time.perf_counter() - t0) * 1000.0, _ok(resp), len(_body_bytes(resp))
+
+    sink = open(os.devnull, "w")
+    try:
+        with contextlib.redirect_stdout(sink):
+            for _ in range(a.warmup):
+                one()
+
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=a.concurrency) as pool:
+                samples = list(pool.map(lambda _: one(), range(a.requests)))
+            wall_s = time.perf_counter() - t0
+
+            # allocation pass: 逐次実行（tracemalloc は全スレッドを追うので並列だと混ざる）
+            tracemalloc.start()
+            base, _ = tracemalloc.get_traced_memory()
+            peaks: List[int] = []
+            for _ in range(a.alloc_requests):
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+                one()
+                _, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - before)
+            retained, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        sink.close()
+
+    latencies = sorted(ms for ms, _, _ in samples)
+    errors = sum(1 for _, ok, _ in samples if not ok)
+    sizes = sorted(n for _, _, n in samples)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / wall_s, 2) if wall_s > 0 else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p90_ms": round(_percentile(latencies, 90), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "peak_kib_per_req": round(sorted(peaks)[len(peaks) // 2] / 1024.0, 1) if peaks else 0.0,
+        "retained_kib": round((retained - base) / 1024.0, 1),
+        "resp_kib": round(sizes[len(sizes) // 2] / 1024.0, 1) if sizes else 0.0,
+    }
+
+
+_COLUMNS = [
+    ("throughput_rps", "req/s"),
+    ("p50_ms", "p50 ms"),
+    ("p90_ms", "p90 ms"),
+    ("p99_ms", "p99 ms"),
+    ("max_ms", "max ms"),
+    ("peak_kib_per_req", "peak KiB/req"),
+    ("retained_kib", "retained KiB"),
+    ("resp_kib", "resp KiB"),
+]
+
+
+def _print_table(results: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]]) -> None:
+    header = f"{'scenario':<26}{'n':>5}{'err':>5}" + "".join(f"{title:>14}" for _, title in _COLUMNS)
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<26}{r['requests']:>5}{r['errors']:>5}" + "".join(f"{r[key]:>14}" for key, _ in _COLUMNS))
+        old = (baseline or {}).get(name)
+        if old:
+            cells = []
+            for key, _ in _COLUMNS:
+                prev = old.get(key) or 0
+                cells.append(f"{(r[key] - prev) / prev * 100:+13.1f}%" if prev else f"{'-':>14}")
+            print(f"{'  vs baseline':<36}" + "".join(cells))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    p = argparse.ArgumentParser(description="Offline benchmark for backend/*/app.py handlers")
+    p.add_argument("--only", default="", help=f"comma separated scenarios ({', '.join(SCENARIOS)})")
+    p.add_argument("-n", "--requests", type=int, default=50)
+    p.add_argument("-c", "--concurrency", type=int, default=1, help="concurrent handler calls (a Lambda container runs 1)")
+    p.add_argument("--warmup", type=int, default=3)
+    p.add_argument("--alloc-requests", type=int, default=10, help="requests traced with tracemalloc")
+    p.add_argument("--timeout-ms", type=int, default=30000, help="simulated Lambda timeout")
+    p.add_argument("--cache", action="store_true", help="keep the tool/answer caches enabled")
+    p.add_argument("--batch-reads", action="store_true", help="MCP_JSONRPC_BATCH=true for ask")
+    p.add_argument("--router", action="store_true", help="call every route through the consolidated router function")
+    p.add_argument("--accept-encoding", default="", help='request header, e.g. "gzip, br" (response size is measured on the wire)')
+    p.add_argument("--metrics", action="store_true", help="keep EMF metrics enabled (printed lines are discarded)")
+    p.add_argument("--mcp-latency-ms", type=float, default=50.0)
+    p.add_argument("--mcp-payload-bytes", type=int, default=16 * 1024)
+    p.add_argument("--mcp-sse-chunk-bytes", type=int, default=4096)
+    p.add_argument("--mcp-chunk-delay-ms", type=float, default=0.0)
+    p.add_argument("--mcp-json", action="store_true", help="fake MCP answers application/json instead of SSE")
+    p.add_argument("--bedrock-latency-ms", type=float, default=300.0)
+    p.add_argument("--bedrock-output-tokens", type=int, default=60)
+    p.add_argument("--bedrock-token-delay-ms", type=float, default=5.0)
+    p.add_argument("--bedrock-throttle", action="store_true", help="fake Bedrock throttles the primary model (exercises the fallback)")
+    p.add_argument("--save", help="write results as JSON")
+    p.add_argument("--baseline", help="compare with a JSON file written by --save")
+    a = p.parse_args(argv)
+
+    names = [s.strip() for s in a.only.split(",") if s.strip()] or list(SCENARIOS)
+    unknown = [s for s in names if s not in SCENARIOS]
+    if unknown:
+        p.error(f"unknown scenario: {', '.join(unknown)}")
+
+    mcp_port, bedrock_port = _free_port(), _free_port()
+    mcp_args = [
+        "--latency-ms", str(a.mcp_latency_ms),
+        "--payload-bytes", str(a.mcp_payload_bytes),
+        "--sse-chunk-bytes", str(a.mcp_sse_chunk_bytes),
+        "--chunk-delay-ms", str(a.mcp_chunk_delay_ms),
+    ] + (["--json"] if a.mcp_json else [])
+    bedrock_args = [
+        "--latency-ms", str(a.bedrock_latency_ms),
+        "--output-tokens", str(a.bedrock_output_tokens),
+        "--token-delay-ms", str(a.bedrock_token_delay_ms),
+    ] + (["--throttle-models", BENCH_MODEL_ID] if a.bedrock_throttle else [])
+    procs = [_spawn("fake_mcp.py", mcp_port, mcp_args), _spawn("fake_bedrock.py", bedrock_port, bedrock_args)]
+    try:
+        _configure_env(mcp_port, bedrock_port, a)
+        results: Dict[str, Dict[str, Any]] = {}
+        for name in names:
+            results[name] = _run_scenario(name, a)
+            print(f"[bench] {name}: {results[name]['p50_ms']} ms p50", file=sys.stderr)
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait(timeout=5)
+
+    baseline = None
+    if a.baseline:
+        with open(a.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results")
+    _print_table(results, baseline)
+
+    if a.save:
+        with open(a.save, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(a), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
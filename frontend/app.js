@@ -364,6 +364,51 @@ document.addEventListener("DOMContentLoaded", () => {
     `;
   }
 
+  function renderAvailabilityMatrix(apiJson) {
+    const names = Array.isArray(apiJson.names) ? apiJson.names : [];
+    const regions = Array.isArray(apiJson.regions) ? apiJson.regions : [];
+    const matrix = Array.isArray(apiJson.matrix) ? apiJson.matrix : [];
+
+    const cell = (v) => {
+      if (v === true) return `<td class="px-2 py-1 text-center text-green-700 bg-green-50" title="isAvailableIn">✓</td>`;
+      if (v === false) return `<td class="px-2 py-1 text-center text-red-700 bg-red-50" title="isNotAvailableIn / isPlannedIn">✗</td>`;
+      return `<td class="px-2 py-1 text-center text-slate-400" title="不明">?</td>`;
+    };
+
+    const head = regions.map(r => `<th class="px-2 py-1 text-xs font-semibold text-slate-700 whitespace-nowrap">${escapeHtml(String(r))}</th>`).join("");
+    const rows = names.map((n, i) => {
+      const row = Array.isArray(matrix[i]) ? matrix[i] : [];
+      return `
+        <tr class="border-t border-slate-200">
+          <th class="px-2 py-1 text-left text-sm font-semibold text-slate-900 whitespace-nowrap">${escapeHtml(String(n))}</th>
+          ${regions.map((_, j) => cell(row[j])).join("")}
+        </tr>
+      `;
+    }).join("");
+
+    const asOf = apiJson.as_of ? new Date(apiJson.as_of * 1000).toLocaleString() : "";
+    const errors = Object.entries(apiJson.errors || {});
+
+    renderEl.innerHTML = `
+      <div class="space-y-3">
+        <div class="overflow-x-auto rounded-xl border border-slate-200 bg-white shadow-sm">
+          <table class="min-w-full text-sm">
+            <thead class="bg-slate-50"><tr><th class="px-2 py-1"></th>${head}</tr></thead>
+            <tbody>${rows}</tbody>
+          </table>
+        </div>
+        <div class="text-xs text-slate-500">
+          resource_type: ${escapeHtml(String(apiJson.resource_type || ""))}
+          ${asOf ? ` / 最も古いデータの取得時刻: ${escapeHtml(asOf)}` : ""}
+          / upstream 呼び出し: ${escapeHtml(String(apiJson.upstream_calls ?? 0))}
+        </div>
+        ${errors.length > 0 ? `
+          <div class="text-sm text-amber-800 bg-amber-50 border border-amber-200 rounded-lg p-2 whitespace-pre-wrap">${escapeHtml(errors.map(([r, m]) => `${r}: ${m}`).join("\n"))}</div>
+        ` : ""}
+      </div>
+    `;
+  }
+
   copyBtn.addEventListener("click", async () => {
     try {
       await navigator.clipboard.writeText(lastReadMarkdown || "");
@@ -416,6 +461,16 @@ document.addEventListener("DOMContentLoaded", () => {
     const filters = parseCommaList(document.getElementById("gaFilters").value || "");
     const nextToken = (document.getElementById("gaNextToken").value || "").trim();
 
+    // 複数 region → matrix モード（filters × regions を 1 リクエストで）
+    const regions = parseCommaList(region);
+    if (regions.length > 1) {
+      params.mode = "matrix";
+      params.regions = regions;
+      if (resourceType) params.resource_type = resourceType;
+      if (filters.length > 0) params.names = filters;
+      return params;
+    }
+
     if (region) params.region = region;
     if (resourceType) params.resource_type = resourceType;
     if (filters.length > 0) params.filters = filters;
@@ -437,6 +492,12 @@ document.addEventListener("DOMContentLoaded", () => {
   function validateAvailabilityParams(params) {
     const missing = [];
     if (!params || typeof params !== "object") return ["region", "resource_type"];
+    if (params.mode === "matrix") {
+      const names = params.names || params.services || params.filters;
+      if (!Array.isArray(names) || names.length === 0) missing.push("filters");
+      if (!params.resource_type) missing.push("resource_type");
+      return missing;
+    }
     if (!params.region) missing.push("region");
     if (!params.resource_type) missing.push("resource_type");
     return missing;
@@ -529,6 +590,13 @@ document.addEventListener("DOMContentLoaded", () => {
         return;
       }
 
+      if (tool === "aws___get_regional_availability" && apiJson.mode === "matrix") {
+        renderAvailabilityMatrix(apiJson);
+        setStatus("完了");
+        setTimeout(() => setStatus(""), 1200);
+        return;
+      }
+
       const inner = getMcpInnerResult(apiJson);
 
       if (inner === null && tool === "aws___get_regional_availability") {
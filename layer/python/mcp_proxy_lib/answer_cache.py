@@ -0,0 +1,178 @@
+"""
+mcp_proxy_lib.answer_cache
+
+Answer cache for /api/ask.
+
+- Exact tier: key = normalized (search_phrase, topics, read_top_k, read_max_length),
+  stored through ToolCache (in-memory LRU + optional shared store).
+- Near-duplicate tier (optional): MinHash over character 3-gram shingles of
+  the normalized phrase. Paraphrased questions with the same topics/read
+  options reuse a prior answer when the estimated Jaccard similarity is
+  above the threshold. The signature index is per container.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from mcp_proxy_lib.cache import LRUCache, ToolCache, canonical_json, default_cache
+
+ANSWER_TOOL = "ask"
+
+DEFAULT_TTL_S = 3600
+DEFAULT_NUM_PERM = 64
+DEFAULT_INDEX_SIZE = 512
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WS_RE = re.compile(r"\s+")
+_EDGE_PUNCT = "?？!！。.、,，"
+
+
+def normalize_phrase(phrase: str) -> str:
+    """
+    NFKC（全角/半角の揺れ吸収）→ 小文字化 → 空白の正規化 → 末尾の句読点除去。
+    """
+    s = unicodedata.normalize("NFKC", phrase or "").lower()
+    s = _WS_RE.sub(" ", s).strip()
+    return s.strip(_EDGE_PUNCT).strip()
+
+
+def normalize_args(args: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "q": normalize_phrase(args.get("search_phrase", "")),
+        "topics": sorted(str(t) for t in (args.get("topics") or [])),
+        "read_top_k": int(args.get("read_top_k") or 0),
+        "read_max_length": int(args.get("read_max_length") or 0),
+    }
+
+
+def shingles(text: str, k: int = SHINGLE_SIZE) -> List[str]:
+    # 日本語は空白で区切られないので文字 n-gram を使う
+    s = text.replace(" ", "")
+    if len(s) <= k:
+        return [s] if s else []
+    return sorted({s[i:i + k] for i in range(len(s) - k + 1)})
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, seed: int = 1) -> None:
+        self.num_perm = num_perm
+        params: List[Tuple[int, int]] = []
+        for i in range(num_perm):
+            digest = hashlib.blake2b(f"{seed}:{i}".encode("utf-8"), digest_size=16).digest()
+            a = int.from_bytes(digest[:8], "little") % (_MERSENNE_PRIME - 1) + 1
+            b = int.from_bytes(digest[8:], "little") % _MERSENNE_PRIME
+            params.append((a, b))
+        self._params = params
+
+    def signature(self, tokens: List[str]) -> Tuple[int, ...]:
+        if not tokens:
+            return tuple([_MERSENNE_PRIME] * self.num_perm)
+        hashes = [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little") for t in tokens]
+        return tuple(
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+            for a, b in self._params
+        )
+
+    @staticmethod
+    def similarity(sig1: Tuple[int, ...], sig2: Tuple[int, ...]) -> float:
+        if not sig1 or len(sig1) != len(sig2):
+            return 0.0
+        return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+
+class AnswerCache:
+    def __init__(self, store: ToolCache, near_dup_threshold: float = 0.0, index_size: int = DEFAULT_INDEX_SIZE) -> None:
+        self.store = store
+        self.near_dup_threshold = near_dup_threshold
+        self._hasher = MinHasher()
+        # (scope, signature, normalized args)
+        self._index: Deque[Tuple[str, Tuple[int, ...], Dict[str, Any]]] = deque(maxlen=index_size)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.store.ttl_for(ANSWER_TOOL) > 0
+
+    @staticmethod
+    def _scope(norm: Dict[str, Any]) -> str:
+        # 近似一致でも topics / read 条件は一致しているものだけ対象
+        return canonical_json([norm["topics"], norm["read_top_k"], norm["read_max_length"]])
+
+    def get(self, args: Dict[str, Any]) -> Tuple[Optional[str], Any]:
+        """
+        返り値: (match, answer)  match は "exact" / "near" / None
+        """
+        if not self.enabled:
+            return None, None
+        norm = normalize_args(args)
+        hit, answer = self.store.get(ANSWER_TOOL, norm)
+        if hit:
+            return "exact", answer
+
+        if self.near_dup_threshold <= 0:
+            return None, None
+
+        sig = self._hasher.signature(shingles(norm["q"]))
+        scope = self._scope(norm)
+        best: Optional[Dict[str, Any]] = None
+        best_sim = 0.0
+        with self._lock:
+            candidates = list(self._index)
+        for c_scope, c_sig, c_norm in candidates:
+            if c_scope != scope:
+                continue
+            sim = MinHasher.similarity(sig, c_sig)
+            if sim >= self.near_dup_threshold and sim > best_sim:
+                best, best_sim = c_norm, sim
+        if best is None:
+            return None, None
+
+        hit, answer = self.store.get(ANSWER_TOOL, best)
+        if not hit:
+            return None, None
+        print("[ASK_CACHE_NEAR_HIT]", {"q": norm["q"][:200], "matched": best["q"][:200], "similarity": round(best_sim, 3)})
+        return "near", answer
+
+    def put(self, args: Dict[str, Any], answer: Any) -> None:
+        if not self.enabled:
+            return
+        norm = normalize_args(args)
+        self.store.put(ANSWER_TOOL, norm, answer)
+        if self.near_dup_threshold > 0:
+            sig = self._hasher.signature(shingles(norm["q"]))
+            with self._lock:
+                self._index.append((self._scope(norm), sig, norm))
+
+
+_DEFAULT_ANSWER_CACHE: Optional[AnswerCache] = None
+_DEFAULT_ANSWER_CACHE_LOCK = threading.Lock()
+
+
+def default_answer_cache() -> AnswerCache:
+    """
+    ASK_CACHE_TTL_S (0 で無効), ASK_NEAR_DUP_THRESHOLD (0 で近似一致を無効, 例: 0.85)。
+    共有ストアは tool cache と同じもの（MCP_CACHE_TABLE）を使う。
+    """
+    global _DEFAULT_ANSWER_CACHE
+    if _DEFAULT_ANSWER_CACHE is None:
+        with _DEFAULT_ANSWER_CACHE_LOCK:
+            if _DEFAULT_ANSWER_CACHE is None:
+                ttl_s = int(os.environ.get("ASK_CACHE_TTL_S") or DEFAULT_TTL_S)
+                store = ToolCache(
+                    local=LRUCache(max_entries=int(os.environ.get("ASK_CACHE_MAX_ENTRIES") or 256)),
+                    shared=default_cache().shared,
+                    ttls={ANSWER_TOOL: ttl_s},
+                )
+                _DEFAULT_ANSWER_CACHE = AnswerCache(
+                    store,
+                    near_dup_threshold=float(os.environ.get("ASK_NEAR_DUP_THRESHOLD") or 0.0),
+                )
+    return _DEFAULT_ANSWER_CACHE
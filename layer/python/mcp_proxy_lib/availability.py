@@ -0,0 +1,446 @@
+"""
+mcp_proxy_lib.availability
+
+In-memory regional-availability index built from aws___list_regions and
+aws___get_regional_availability results.
+
+- Regions are bit positions; each (resource_type, name) has a `known` and an
+  `available` bitset, so a services x regions matrix is answered with bit
+  tests. resource_type ("product" / "api" / "cfn") keeps services, APIs and
+  CloudFormation resources in separate sub-indexes.
+- Every cell carries the time it was observed. Cells older than
+  AVAILABILITY_INDEX_MAX_AGE_S count as misses, and misses are fetched
+  upstream (one call per region for up to MAX_FILTERS_PER_CALL missing
+  names, AVAILABILITY_MATRIX_CONCURRENCY calls at a time) and fed back in.
+- Handlers feed every upstream result in (observe). The warmer publishes a
+  snapshot to the tool cache ("availability_index"). Containers merge it in
+  at most every AVAILABILITY_INDEX_RELOAD_S seconds; newer cells win.
+- The upstream response format is not fixed, so results are parsed loosely:
+  any record carrying one of the requested names (in a non-status field) plus
+  an availability flag or status ("isAvailableIn", "isPlannedIn",
+  "isNotAvailableIn", true/false). A record naming another region is skipped,
+  and a record that does not name the resource is never attributed to it.
+- Only names the upstream answered for are indexed, only regions from
+  aws___list_regions once those are known, and at most
+  AVAILABILITY_INDEX_MAX_NAMES names (expired ones are pruned first). A
+  snapshot whose compressed size would exceed the DynamoDB item limit is
+  logged and not published.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from mcp_proxy_lib.cache import ToolCache, canonical_json, default_cache
+from mcp_proxy_lib.deadline import Deadline, DeadlineExceeded
+from mcp_proxy_lib.http_client import mcp_tools_call
+
+TOOL_LIST_REGIONS = "aws___list_regions"
+TOOL_AVAILABILITY = "aws___get_regional_availability"
+SNAPSHOT_TOOL = "availability_index"
+
+MAX_AGE_S = int(os.environ.get("AVAILABILITY_INDEX_MAX_AGE_S") or 6 * 3600)
+RELOAD_INTERVAL_S = int(os.environ.get("AVAILABILITY_INDEX_RELOAD_S") or 300)
+# 1 回の upstream 呼び出しにまとめる filters の数
+MAX_FILTERS_PER_CALL = 20
+MATRIX_CONCURRENCY = int(os.environ.get("AVAILABILITY_MATRIX_CONCURRENCY") or 8)
+MAX_NAMES = int(os.environ.get("AVAILABILITY_INDEX_MAX_NAMES") or 5000)
+# 索引が一杯のときに期限切れの名前を掃除する間隔
+PRUNE_INTERVAL_S = 60
+# DynamoDB の 1 項目は 400 KB まで（キー・属性名の分を残す）
+MAX_SNAPSHOT_BYTES = 380 * 1024
+
+_NAME_KEYS = ("name", "product", "service", "resource", "resource_id", "identifier", "filter", "api", "id")
+_REGION_KEYS = ("region_id", "region", "code", "id")
+
+
+class Cell(NamedTuple):
+    available: Optional[bool]
+    observed_at: float
+
+
+class Matrix(NamedTuple):
+    # cells[name][region] = True / False / None（未観測・期限切れ）
+    cells: Dict[str, Dict[str, Optional[bool]]]
+    missing: List[Tuple[str, str]]
+    # 使ったセルのうち最も古い観測時刻（1 つも無ければ None）
+    oldest_at: Optional[float]
+    # matrix() のみ: upstream 呼び出し回数と、失敗した region -> 理由
+    upstream_calls: int = 0
+    errors: Optional[Dict[str, str]] = None
+
+
+def _tool_json(result: Any) -> Any:
+    if not isinstance(result, dict) or result.get("isError"):
+        return None
+    for c in result.get("content") or []:
+        if isinstance(c, dict) and c.get("type") == "text" and isinstance(c.get("text"), str):
+            try:
+                return json.loads(c["text"])
+            except ValueError:
+                return None
+    return None
+
+
+def _walk_dicts(obj: Any) -> Iterator[Dict[str, Any]]:
+    if isinstance(obj, dict):
+        yield obj
+        for v in obj.values():
+            yield from _walk_dicts(v)
+    elif isinstance(obj, list):
+        for v in obj:
+            yield from _walk_dicts(v)
+
+
+def _status(value: Any) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    if not isinstance(value, str):
+        return None
+    s = value.replace(" ", "").replace("_", "").lower()
+    if "not" in s or "unavailable" in s or "planned" in s:
+        return False
+    if "available" in s or s in ("ga", "true", "yes"):
+        return True
+    return None
+
+
+def _is_status_key(key: str) -> bool:
+    lk = key.replace("_", "").lower()
+    return "status" in lk or "avail" in lk or "planned" in lk
+
+
+def _record_status(record: Dict[str, Any]) -> Optional[bool]:
+    for k, v in record.items():
+        lk = k.replace("_", "").lower()
+        if "status" in lk or lk == "availability":
+            st = _status(v)
+            if st is not None:
+                return st
+        elif "avail" in lk or "planned" in lk:
+            # {"isAvailableIn": ...} / {"isNotAvailableIn": ...} / {"isPlannedIn": ...}: 値が空でないキーが状態
+            if not v:
+                continue
+            return not ("not" in lk or "unavail" in lk or "planned" in lk)
+    return None
+
+
+def parse_regions(result: Any) -> List[str]:
+    out: List[str] = []
+    for d in _walk_dicts(_tool_json(result)):
+        for k in _REGION_KEYS:
+            v = d.get(k)
+            if isinstance(v, str) and v.count("-") >= 2:
+                out.append(v)
+                break
+    return list(dict.fromkeys(out))
+
+
+def _record_region(record: Dict[str, Any]) -> Optional[str]:
+    for k in _REGION_KEYS:
+        v = record.get(k)
+        if isinstance(v, str) and v.count("-") >= 2:
+            return v
+    return None
+
+
+def parse_availability(result: Any, filters: List[str], region: Optional[str] = None) -> Dict[str, Optional[bool]]:
+    """
+    filters ごとの可否。判定できなかったもの・名前が返ってこなかったものは含めない。
+    region を渡すと、別の region を名乗るレコードは読み飛ばす。
+    """
+    data = _tool_json(result)
+    if data is None:
+        return {}
+    wanted = {f.lower(): f for f in filters}
+    out: Dict[str, Optional[bool]] = {}
+    for d in _walk_dicts(data):
+        st = _record_status(d)
+        if st is None:
+            continue
+        rec_region = _record_region(d)
+        if region is not None and rec_region is not None and rec_region != region:
+            continue
+        # 状態の値（"available" 等）を名前と取り違えないように、状態以外のキーだけ見る
+        names = [v for k, v in d.items() if isinstance(v, str) and v != rec_region and not _is_status_key(k)]
+        if filters:
+            name = next((wanted[v.lower()] for v in names if v.lower() in wanted), None)
+        else:
+            name = next((d[k] for k in _NAME_KEYS if isinstance(d.get(k), str) and d[k] != rec_region), None)
+        if name is not None and name not in out:
+            out[name] = st
+    return out
+
+
+class _Entry:
+    __slots__ = ("known", "available", "stamps")
+
+    def __init__(self) -> None:
+        self.known = 0
+        self.available = 0
+        # region bit -> 観測時刻
+        self.stamps: Dict[int, float] = {}
+
+
+class RegionIndex:
+    def __init__(self, max_age_s: float = MAX_AGE_S, max_names: int = MAX_NAMES) -> None:
+        self.max_age_s = max_age_s
+        self.max_names = max_names
+        self.regions: List[str] = []
+        self._bit: Dict[str, int] = {}
+        self._entries: Dict[Tuple[str, str], _Entry] = {}
+        self.updated_at = 0.0
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+
+    def _region_bit(self, region: str) -> int:
+        bit = self._bit.get(region)
+        if bit is None:
+            bit = self._bit[region] = len(self.regions)
+            self.regions.append(region)
+        return bit
+
+    def set_regions(self, regions: List[str]) -> None:
+        with self._lock:
+            for r in regions:
+                self._region_bit(r)
+
+    def _has_room_locked(self) -> bool:
+        if len(self._entries) < self.max_names:
+            return True
+        now = time.time()
+        if now - self._pruned_at < PRUNE_INTERVAL_S:
+            return False
+        self._pruned_at = now
+        # どの region も期限切れの名前を捨てる
+        expired = [k for k, e in self._entries.items() if all(now - at > self.max_age_s for at in e.stamps.values())]
+        for k in expired:
+            del self._entries[k]
+        if len(self._entries) >= self.max_names:
+            print("[AVAILABILITY_INDEX_FULL]", {"names": len(self._entries), "max_names": self.max_names})
+            return False
+        return True
+
+    def record(self, resource_type: str, name: str, region: str, available: Optional[bool], observed_at: Optional[float] = None) -> None:
+        at = time.time() if observed_at is None else observed_at
+        with self._lock:
+            entry = self._entries.get((resource_type, name))
+            if entry is None:
+                if not self._has_room_locked():
+                    return
+                entry = self._entries[(resource_type, name)] = _Entry()
+            bit = self._region_bit(region)
+            if entry.stamps.get(bit, 0.0) > at:
+                return
+            mask = 1 << bit
+            entry.stamps[bit] = at
+            if available is None:
+                entry.known &= ~mask
+                entry.available &= ~mask
+                return
+            entry.known |= mask
+            if available:
+                entry.available |= mask
+            else:
+                entry.available &= ~mask
+            self.updated_at = max(self.updated_at, at)
+
+    def observe(self, region: str, resource_type: str, filters: List[str], result: Any) -> int:
+        """
+        upstream の結果を取り込む。取り込んだセル数を返す。
+        region 一覧が分かっていれば、それ以外の region（利用者の入力そのまま）は取り込まない。
+        """
+        with self._lock:
+            if self._bit and region not in self._bit:
+                return 0
+        parsed = parse_availability(result, filters, region)
+        for name, st in parsed.items():
+            self.record(resource_type, name, region, st)
+        return len(parsed)
+
+    def lookup(self, resource_type: str, name: str, region: str) -> Optional[Cell]:
+        with self._lock:
+            entry = self._entries.get((resource_type, name))
+            bit = self._bit.get(region)
+            if entry is None or bit is None or not entry.known >> bit & 1:
+                return None
+            at = entry.stamps.get(bit, 0.0)
+            if time.time() - at > self.max_age_s:
+                return None
+            return Cell(bool(entry.available >> bit & 1), at)
+
+    def query(self, resource_type: str, names: List[str], regions: List[str]) -> Matrix:
+        cells: Dict[str, Dict[str, Optional[bool]]] = {}
+        missing: List[Tuple[str, str]] = []
+        oldest: Optional[float] = None
+        for name in names:
+            row: Dict[str, Optional[bool]] = {}
+            for region in regions:
+                cell = self.lookup(resource_type, name, region)
+                if cell is None:
+                    row[region] = None
+                    missing.append((name, region))
+                else:
+                    row[region] = cell.available
+                    oldest = cell.observed_at if oldest is None else min(oldest, cell.observed_at)
+            cells[name] = row
+        return Matrix(cells, missing, oldest)
+
+    def available_in(self, resource_type: str, region: str) -> List[str]:
+        """
+        region -> その region で使える名前（観測済み・期限内のもの）。
+        """
+        now = time.time()
+        with self._lock:
+            bit = self._bit.get(region)
+            if bit is None:
+                return []
+            return sorted(
+                name for (rt, name), e in self._entries.items()
+                if rt == resource_type and e.available >> bit & 1 and now - e.stamps.get(bit, 0.0) <= self.max_age_s
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            types: Dict[str, Dict[str, List[Any]]] = {}
+            for (rt, name), e in self._entries.items():
+                types.setdefault(rt, {})[name] = [e.known, e.available, {str(b): int(t) for b, t in e.stamps.items()}]
+            return {"regions": list(self.regions), "updated_at": self.updated_at, "types": types}
+
+    def merge(self, snap: Dict[str, Any]) -> None:
+        regions = [str(r) for r in snap.get("regions") or []]
+        self.set_regions(regions)
+        for rt, names in (snap.get("types") or {}).items():
+            for name, (known, available, stamps) in names.items():
+                for b, at in stamps.items():
+                    bit = int(b)
+                    if bit >= len(regions):
+                        continue
+                    mask = 1 << bit
+                    st = bool(available & mask) if known & mask else None
+                    self.record(rt, name, regions[bit], st, float(at))
+
+
+class AvailabilityIndex:
+    """
+    RegionIndex + 共有キャッシュ上のスナップショット + upstream へのフォールバック。
+    """
+
+    def __init__(self, endpoint: str, cache: ToolCache, index: Optional[RegionIndex] = None) -> None:
+        self.endpoint = endpoint
+        self.cache = cache
+        self.index = index or RegionIndex()
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def reload(self, force: bool = False) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._loaded_at and now - self._loaded_at < RELOAD_INTERVAL_S:
+                return
+            self._loaded_at = now
+        hit, snap = self.cache.get(SNAPSHOT_TOOL, {})
+        if hit and isinstance(snap, dict):
+            try:
+                self.index.merge(snap)
+            except Exception as ex:
+                print("[AVAILABILITY_INDEX_ERROR]", {"op": "merge", "error": str(ex)[:500]})
+
+    def observe_call(self, args: Dict[str, Any], result: Any) -> int:
+        """
+        aws___get_regional_availability の 1 回分（args と結果）を取り込む。
+        region / resource_type / filters 以外で絞り込んだ問い合わせは対象外。
+        """
+        region, resource_type, filters = args.get("region"), args.get("resource_type"), args.get("filters") or []
+        if not isinstance(region, str) or not isinstance(resource_type, str) or set(args) - {"region", "resource_type", "filters", "next_token"}:
+            return 0
+        if not isinstance(filters, list) or not all(isinstance(f, str) for f in filters):
+            return 0
+        try:
+            return self.index.observe(region, resource_type, filters, result)
+        except Exception as ex:
+            # 索引は best-effort（応答は upstream の結果をそのまま返す）
+            print("[AVAILABILITY_INDEX_ERROR]", {"op": "observe", "error": str(ex)[:500]})
+            return 0
+
+    def publish(self) -> bool:
+        """
+        スナップショットを共有キャッシュに書く。共有側の 1 項目に収まらなければ書かずに False。
+        """
+        snap = self.index.snapshot()
+        size = len(zlib.compress(canonical_json(snap).encode("utf-8")))
+        if size > MAX_SNAPSHOT_BYTES:
+            print("[AVAILABILITY_INDEX_SNAPSHOT_TOO_LARGE]", {"bytes": size, "max_bytes": MAX_SNAPSHOT_BYTES, "names": sum(len(v) for v in snap["types"].values())})
+            return False
+        self.cache.put(SNAPSHOT_TOOL, {}, snap)
+        return True
+
+    def refresh_regions(self, deadline: Optional[Deadline] = None) -> List[str]:
+        regions = parse_regions(mcp_tools_call(self.endpoint, TOOL_LIST_REGIONS, {}, deadline=deadline))
+        self.index.set_regions(regions)
+        return regions
+
+    def fetch(self, region: str, resource_type: str, names: List[str], deadline: Optional[Deadline] = None) -> int:
+        args = {"region": region, "resource_type": resource_type, "filters": names}
+        return self.index.observe(region, resource_type, names, mcp_tools_call(self.endpoint, TOOL_AVAILABILITY, args, deadline=deadline))
+
+    def matrix(self, resource_type: str, names: List[str], regions: List[str], deadline: Optional[Deadline] = None, concurrency: int = MATRIX_CONCURRENCY) -> Matrix:
+        """
+        索引で答え、足りないセルだけ region ごとに upstream へ並列に問い合わせる。
+        失敗した region のセルは None のまま errors に理由を入れて返す。
+        """
+        self.reload()
+        m = self.index.query(resource_type, names, regions)
+        if not m.missing:
+            return m
+
+        by_region: Dict[str, List[str]] = {}
+        for name, region in m.missing:
+            by_region.setdefault(region, []).append(name)
+        calls = [
+            (region, missing_names[i:i + MAX_FILTERS_PER_CALL])
+            for region, missing_names in by_region.items()
+            for i in range(0, len(missing_names), MAX_FILTERS_PER_CALL)
+        ]
+        errors: Dict[str, str] = {}
+
+        def run(call: Tuple[str, List[str]]) -> None:
+            region, chunk = call
+            try:
+                self.fetch(region, resource_type, chunk, deadline)
+            except DeadlineExceeded:
+                errors[region] = "Timed out"
+            except Exception as e:
+                print("[AVAILABILITY_FETCH_ERROR]", {"region": region, "error": str(e)[:500]})
+                errors[region] = str(e)[:500]
+
+        if len(calls) == 1:
+            run(calls[0])
+        else:
+            # concurrent.futures の import は upstream に行くときだけ払う
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(calls)))) as pool:
+                list(pool.map(run, calls))
+
+        m = self.index.query(resource_type, names, regions)
+        return m._replace(upstream_calls=len(calls), errors=errors or None)
+
+
+_DEFAULT_INDEXES: Dict[str, AvailabilityIndex] = {}
+_DEFAULT_INDEXES_LOCK = threading.Lock()
+
+
+def default_availability_index(endpoint: str) -> AvailabilityIndex:
+    idx = _DEFAULT_INDEXES.get(endpoint)
+    if idx is None:
+        with _DEFAULT_INDEXES_LOCK:
+            idx = _DEFAULT_INDEXES.get(endpoint)
+            if idx is None:
+                idx = _DEFAULT_INDEXES[endpoint] = AvailabilityIndex(endpoint, default_cache())
+    return idx
@@ -0,0 +1,86 @@
+"""
+mcp_proxy_lib.bm25
+
+Small BM25 (Okapi) scorer for Japanese/English mixed text.
+
+- ASCII words are lower-cased word tokens.
+- CJK runs are split into character bigrams (no morphological analyzer in Lambda).
+- IDF comes from the scored documents, or from a fixed table when the documents
+  are too few to estimate it (e.g. 10 search snippets; see mcp_proxy_lib.rerank).
+"""
+
+from __future__ import annotations
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import List, Mapping, Optional, Sequence
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9_\-\.]*[a-z0-9]|[a-z0-9]|[぀-ヿ㐀-鿿豈-﫿]+")
+_CJK_RE = re.compile(r"[぀-ヿ㐀-鿿豈-﫿]")
+
+# 英語の機能語だけ落とす（日本語は bigram なので助詞も混ざるが IDF で薄まる）
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or that the this to was what when "
+    "where which who why with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    out: List[str] = []
+    for m in _TOKEN_RE.finditer(unicodedata.normalize("NFKC", text or "").lower()):
+        tok = m.group(0)
+        if _CJK_RE.match(tok):
+            if len(tok) == 1:
+                out.append(tok)
+            else:
+                out.extend(tok[i:i + 2] for i in range(len(tok) - 1))
+        elif tok not in STOPWORDS:
+            out.append(tok)
+    return out
+
+
+class BM25:
+    def __init__(
+        self,
+        docs: Sequence[List[str]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        idf: Optional[Mapping[str, float]] = None,
+        unseen_idf: float = 0.0,
+    ) -> None:
+        """
+        idf を渡すとそれを使う（表に無い語は unseen_idf）。
+        """
+        self.k1 = k1
+        self.b = b
+        self.doc_tf = [Counter(d) for d in docs]
+        self.doc_len = [len(d) for d in docs]
+        self.avgdl = (sum(self.doc_len) / len(docs)) if docs else 0.0
+        self.unseen_idf = unseen_idf
+        if idf is not None:
+            self.idf: Mapping[str, float] = idf
+            return
+        df: Counter = Counter()
+        for tf in self.doc_tf:
+            df.update(tf.keys())
+        n = len(docs)
+        self.idf = {
+            t: math.log(1.0 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()
+        }
+
+    def score(self, query: List[str], i: int) -> float:
+        tf = self.doc_tf[i]
+        dl = self.doc_len[i]
+        norm = self.k1 * (1.0 - self.b + self.b * (dl / self.avgdl if self.avgdl else 0.0))
+        s = 0.0
+        for t in set(query):
+            f = tf.get(t)
+            if not f:
+                continue
+            s += self.idf.get(t, self.unseen_idf) * (f * (self.k1 + 1.0)) / (f + norm)
+        return s
+
+    def scores(self, query: List[str]) -> List[float]:
+        return [self.score(query, i) for i in range(len(self.doc_tf))]
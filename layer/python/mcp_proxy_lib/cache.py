@@ -0,0 +1,361 @@
+"""
+mcp_proxy_lib.cache
+
+Response cache for idempotent MCP tool calls.
+
+- Tier 1: per-container in-memory LRU with TTL (bounded by entries and bytes).
+  Entries are sized by their uncompressed canonical JSON, which is close to
+  what the decoded object holds in memory.
+- Tier 2 (optional): shared store. DynamoDB when MCP_CACHE_TABLE is set;
+  InMemorySharedStore is a local stand-in with the same interface. Values are
+  zlib-compressed only for this tier. A shared hit is kept in tier 1 for the
+  rest of the shared entry's TTL, not a fresh full TTL.
+- Keys are sha256 of the canonical JSON of (tool, arguments).
+- TTLs are per tool; tools without a TTL are never cached.
+- Shared stores also hold short-lived leases ("lease#<key>") used by
+  mcp_proxy_lib.singleflight to coalesce identical calls across containers.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from mcp_proxy_lib.lazy import LazyClient
+from mcp_proxy_lib.snapstart import prime
+
+# ほぼ静的なツールだけキャッシュする（search は対象外）
+DEFAULT_TOOL_TTLS_S: Dict[str, int] = {
+    "aws___list_regions": 24 * 3600,
+    "aws___get_regional_availability": 6 * 3600,
+    "aws___read_documentation": 3600,
+    "aws___recommend": 3600,
+    # mcp_proxy_lib.docstore: URL -> 版（manifest）と、版 -> 本文（content-addressed）
+    "read_document": 3600,
+    "read_document_blob": 24 * 3600,
+    # mcp_proxy_lib.availability: warmer が公開する索引のスナップショット
+    "availability_index": 24 * 3600,
+}
+
+LEASE_PREFIX = "lease#"
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def canonical_json(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def cache_key(tool: str, arguments: Dict[str, Any]) -> str:
+    return hashlib.sha256(canonical_json([tool, arguments or {}]).encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """
+    スレッドセーフな LRU + TTL。値は呼び出し側で共有されるので変更しないこと。
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at, size = entry
+            if now >= expires_at:
+                del self._data[key]
+                self._bytes -= size
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value: Any, ttl_s: float, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + ttl_s
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class InMemorySharedStore:
+    """
+    DynamoDBSharedStore のローカル代替（テスト・ベンチ用）。値は bytes で保持する。
+    """
+
+    def __init__(self) -> None:
+        self._data: Dict[str, Tuple[bytes, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        found = self.get_with_expiry(key)
+        return found[0] if found is not None else None
+
+    def get_with_expiry(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """
+        返り値: (blob, expires_at（epoch 秒）)
+        """
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or time.time() >= entry[1]:
+            return None
+        return entry
+
+    def put(self, key: str, blob: bytes, ttl_s: float) -> None:
+        with self._lock:
+            self._data[key] = (blob, time.time() + ttl_s)
+
+    def acquire_lease(self, key: str, token: str, ttl_s: float) -> bool:
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(LEASE_PREFIX + key)
+            if entry is not None and now < entry[1]:
+                return False
+            self._data[LEASE_PREFIX + key] = (token.encode("utf-8"), now + ttl_s)
+            return True
+
+    def release_lease(self, key: str, token: str) -> None:
+        with self._lock:
+            entry = self._data.get(LEASE_PREFIX + key)
+            if entry is not None and entry[0] == token.encode("utf-8"):
+                del self._data[LEASE_PREFIX + key]
+
+
+class DynamoDBSharedStore:
+    """
+    DynamoDB テーブル（PK: k (S), TTL 属性: expires_at）を共有キャッシュとして使う。
+    TTL による削除は遅延するので、読み出し時にも expires_at を確認する。
+    """
+
+    def __init__(self, table_name: str, client: Any = None) -> None:
+        self.table_name = table_name
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            self._client = LazyClient("dynamodb")
+        return self._client
+
+    def get(self, key: str) -> Optional[bytes]:
+        found = self.get_with_expiry(key)
+        return found[0] if found is not None else None
+
+    def get_with_expiry(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """
+        返り値: (blob, expires_at（epoch 秒）)
+        """
+        r = self.client.get_item(TableName=self.table_name, Key={"k": {"S": key}})
+        item = r.get("Item")
+        if not item:
+            return None
+        expires_at = float(item.get("expires_at", {}).get("N", "0"))
+        blob = item.get("v", {}).get("B")
+        if expires_at <= time.time() or blob is None:
+            return None
+        return blob, expires_at
+
+    def put(self, key: str, blob: bytes, ttl_s: float) -> None:
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "k": {"S": key},
+                "v": {"B": blob},
+                "expires_at": {"N": str(int(time.time() + ttl_s))},
+            },
+        )
+
+    def acquire_lease(self, key: str, token: str, ttl_s: float) -> bool:
+        """
+        条件付き PutItem。lease が無いか期限切れなら取得できる。
+        """
+        now = time.time()
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "k": {"S": LEASE_PREFIX + key},
+                    "owner": {"S": token},
+                    "expires_at": {"N": f"{now + ttl_s:.3f}"},
+                },
+                ConditionExpression="attribute_not_exists(k) OR expires_at < :now",
+                ExpressionAttributeValues={":now": {"N": f"{now:.3f}"}},
+            )
+        except Exception as ex:
+            if _error_code(ex) == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def release_lease(self, key: str, token: str) -> None:
+        # 期限切れ後に他の呼び出しが取り直した lease は消さない
+        try:
+            self.client.delete_item(
+                TableName=self.table_name,
+                Key={"k": {"S": LEASE_PREFIX + key}},
+                ConditionExpression="#o = :token",
+                ExpressionAttributeNames={"#o": "owner"},
+                ExpressionAttributeValues={":token": {"S": token}},
+            )
+        except Exception as ex:
+            if _error_code(ex) != "ConditionalCheckFailedException":
+                raise
+
+
+def _error_code(ex: Exception) -> str:
+    # botocore.exceptions.ClientError を import せずに判定する
+    return str((getattr(ex, "response", None) or {}).get("Error", {}).get("Code") or "")
+
+
+def _decode(blob: bytes) -> Tuple[Any, int]:
+    """
+    返り値: (value, 展開後の JSON のバイト数)
+    """
+    raw = zlib.decompress(blob)
+    return json.loads(raw.decode("utf-8")), len(raw)
+
+
+class ToolCache:
+    def __init__(self, local: LRUCache, shared: Any = None, ttls: Optional[Dict[str, int]] = None) -> None:
+        self.local = local
+        self.shared = shared
+        self.ttls = dict(DEFAULT_TOOL_TTLS_S if ttls is None else ttls)
+        self._counters = {"hits_local": 0, "hits_shared": 0, "misses": 0, "stores": 0, "shared_errors": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def ttl_for(self, tool: str) -> int:
+        return int(self.ttls.get(tool) or 0)
+
+    def get(self, tool: str, arguments: Dict[str, Any]) -> Tuple[bool, Any]:
+        key = cache_key(tool, arguments)
+        hit, value = self.local.get(key)
+        if hit:
+            self._count("hits_local")
+            return True, value
+
+        if self.shared is not None:
+            try:
+                found = self.shared.get_with_expiry(key)
+            except Exception as ex:
+                self._count("shared_errors")
+                print("[CACHE_SHARED_ERROR]", {"op": "get", "tool": tool, "error": str(ex)[:500]})
+                found = None
+            if found is not None:
+                blob, expires_at = found
+                value, size = _decode(blob)
+                # L1 にも載せる（共有側の残り TTL まで。L1 だけ延命すると共有側の更新より古い値を返し続ける）
+                ttl_s = min(self.ttl_for(tool), expires_at - time.time())
+                if ttl_s > 0:
+                    self.local.set(key, value, ttl_s, size)
+                self._count("hits_shared")
+                return True, value
+
+        self._count("misses")
+        return False, None
+
+    def put(self, tool: str, arguments: Dict[str, Any], value: Any) -> None:
+        ttl_s = self.ttl_for(tool)
+        if ttl_s <= 0:
+            return
+        key = cache_key(tool, arguments)
+        # L1 は展開済みのオブジェクトを持つので、圧縮後ではなく JSON の長さで数える
+        raw = canonical_json(value).encode("utf-8")
+        self.local.set(key, value, ttl_s, len(raw))
+        self._count("stores")
+        if self.shared is not None:
+            try:
+                self.shared.put(key, zlib.compress(raw), ttl_s)
+            except Exception as ex:
+                self._count("shared_errors")
+                print("[CACHE_SHARED_ERROR]", {"op": "put", "tool": tool, "error": str(ex)[:500]})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._counters)
+        out["local_entries"] = len(self.local)
+        out["shared"] = type(self.shared).__name__ if self.shared is not None else None
+        return out
+
+
+def _ttls_from_env() -> Dict[str, int]:
+    """
+    MCP_CACHE_TTLS='{"aws___read_documentation": 600}' で既定 TTL を上書き（0 で無効化）。
+    """
+    ttls = dict(DEFAULT_TOOL_TTLS_S)
+    raw = (os.environ.get("MCP_CACHE_TTLS") or "").strip()
+    if raw:
+        try:
+            for k, v in json.loads(raw).items():
+                ttls[str(k)] = int(v)
+        except Exception as ex:
+            print("[CACHE_CONFIG_ERROR]", {"MCP_CACHE_TTLS": raw[:500], "error": str(ex)})
+    return ttls
+
+
+_DEFAULT_CACHE: Optional[ToolCache] = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def default_cache() -> ToolCache:
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        with _DEFAULT_CACHE_LOCK:
+            if _DEFAULT_CACHE is None:
+                table = (os.environ.get("MCP_CACHE_TABLE") or "").strip()
+                _DEFAULT_CACHE = ToolCache(
+                    local=LRUCache(
+                        max_entries=int(os.environ.get("MCP_CACHE_MAX_ENTRIES") or DEFAULT_MAX_ENTRIES),
+                        max_bytes=int(os.environ.get("MCP_CACHE_MAX_BYTES") or DEFAULT_MAX_BYTES),
+                    ),
+                    shared=DynamoDBSharedStore(table) if table else None,
+                    ttls=_ttls_from_env(),
+                )
+    return _DEFAULT_CACHE
+
+
+def _prime_shared_store() -> None:
+    shared = default_cache().shared
+    if isinstance(shared, DynamoDBSharedStore):
+        shared.client.get()
+
+
+if (os.environ.get("MCP_CACHE_TABLE") or "").strip():
+    prime(_prime_shared_store)
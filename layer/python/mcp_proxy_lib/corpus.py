@@ -0,0 +1,300 @@
+"""
+mcp_proxy_lib.corpus
+
+Token-budget-aware corpus packer for Bedrock summarization.
+
+- Estimates tokens (CJK ~1 token/char, other text ~4 chars/token).
+- Splits each source into paragraph chunks and drops boilerplate/navigation.
+- Gives every source a fair share of the budget (water-filling: sources that
+  need less than their share return the remainder to the others).
+- Inside a source, keeps the chunks most relevant to the question (BM25),
+  emitted in original document order.
+- CorpusBuilder accepts sources one at a time (chunking/tokenizing happens on
+  add), so callers can prepare pages while other reads are still in flight,
+  and ask how much question-relevant text a source holds (relevant_tokens).
+- The built corpus holds only the sources, not the question: callers put the
+  question after it, so the corpus can be a cached prompt prefix.
+- build_split() returns a Corpus of two parts: `shared`, picked without the
+  question (leading chunks of each source, sources in URL order), so the same
+  pages give the same bytes whatever was asked and a prompt cache checkpoint
+  after it can hit; and `related`, the question's BM25 picks from the rest of
+  the budget, which goes after the checkpoint.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from mcp_proxy_lib.bm25 import BM25, tokenize
+from mcp_proxy_lib.rerank import coverage
+
+_CJK_CHAR_RE = re.compile(r"[぀-ヿ㐀-鿿豈-﫿＀-￯]")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n")
+_MD_LINK_RE = re.compile(r"\[[^\]]*\]\([^)]*\)")
+
+MAX_CHUNK_CHARS = 1200
+MIN_CHUNK_CHARS = 200
+OMITTED_MARK = "…"
+
+# AWS ドキュメントのナビゲーション/フッター由来の定型文
+_BOILERPLATE_PATTERNS = [
+    re.compile(p, re.IGNORECASE)
+    for p in [
+        r"^skip to main content",
+        r"did this page help you\?",
+        r"thanks for letting us know",
+        r"javascript is disabled or is unavailable",
+        r"^document conventions",
+        r"^(previous|next) topic",
+        r"©\s*\d{4}.*amazon web services",
+        r"^<e>content truncated",
+        r"このページは役に立ちましたか",
+        r"^ドキュメントの表記規則",
+    ]
+]
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    cjk = len(_CJK_CHAR_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _is_boilerplate(chunk: str) -> bool:
+    s = chunk.strip()
+    if not s:
+        return True
+    if any(p.search(s) for p in _BOILERPLATE_PATTERNS):
+        return True
+    # リンクだらけの段落はナビゲーション
+    link_chars = sum(len(m.group(0)) for m in _MD_LINK_RE.finditer(s))
+    if link_chars > 0.6 * len(s):
+        return True
+    return not any(c.isalnum() for c in s)
+
+
+def _split_long(paragraph: str) -> List[str]:
+    if len(paragraph) <= MAX_CHUNK_CHARS:
+        return [paragraph]
+    out: List[str] = []
+    buf = ""
+    for line in paragraph.split("\n"):
+        while len(line) > MAX_CHUNK_CHARS:
+            if buf:
+                out.append(buf)
+                buf = ""
+            out.append(line[:MAX_CHUNK_CHARS])
+            line = line[MAX_CHUNK_CHARS:]
+        if buf and len(buf) + 1 + len(line) > MAX_CHUNK_CHARS:
+            out.append(buf)
+            buf = line
+        else:
+            buf = f"{buf}\n{line}" if buf else line
+    if buf:
+        out.append(buf)
+    return out
+
+
+def _is_heading_only(s: str) -> bool:
+    return all(line.lstrip().startswith("#") for line in s.split("\n"))
+
+
+def split_chunks(text: str) -> List[str]:
+    """
+    空行区切りの段落を基本単位に、見出しは次の段落に付け、短すぎる段落はまとめる。
+    """
+    chunks: List[str] = []
+    buf = ""
+    for para in _BLANK_LINES_RE.split((text or "").replace("\r\n", "\n")):
+        para = para.strip()
+        if not para or _is_boilerplate(para):
+            continue
+        for piece in _split_long(para):
+            too_big = len(buf) + len(piece) > MAX_CHUNK_CHARS
+            if buf and (too_big or (len(buf) >= MIN_CHUNK_CHARS and not _is_heading_only(buf))):
+                chunks.append(buf)
+                buf = piece
+            else:
+                buf = f"{buf}\n\n{piece}" if buf else piece
+    if buf:
+        chunks.append(buf)
+    return chunks
+
+
+def _header(title: str, url: str) -> str:
+    return f"## {title}\nURL: {url}\n"
+
+
+def _rank(scores: List[float]) -> List[int]:
+    # 先頭チャンク（概要であることが多い）は少しだけ優遇
+    return sorted(range(len(scores)), key=lambda i: (-(scores[i] + (0.5 if i == 0 else 0.0)), i))
+
+
+def _select(scores: List[float], costs: List[int], budget: int, picked: Set[int]) -> int:
+    """
+    スコア順に budget 内で picked に追加し、使った token 数を返す。
+    """
+    used = 0
+    for i in _rank(scores):
+        if i in picked or used + costs[i] > budget:
+            continue
+        picked.add(i)
+        used += costs[i]
+    return used
+
+
+class Corpus(NamedTuple):
+    # 質問に依らない部分（prompt cache の checkpoint はこの後ろ）
+    shared: str
+    # 質問に合わせて足した部分（checkpoint の後、質問の前に置く）
+    related: str = ""
+
+    def tokens(self) -> int:
+        return estimate_tokens(self.shared) + estimate_tokens(self.related)
+
+
+class _Source:
+    def __init__(self, title: str, url: str, text: str) -> None:
+        self.url = url
+        self.header = _header(title, url)
+        self.header_cost = estimate_tokens(self.header)
+        self.chunks = split_chunks(text)
+        self.tokens = [tokenize(c) for c in self.chunks]
+        self.costs = [estimate_tokens(c) + 1 for c in self.chunks]
+
+
+class CorpusBuilder:
+    def __init__(self, question: str) -> None:
+        self.question = question
+        self.query = tokenize(question)
+        self._sources: Dict[int, _Source] = {}
+
+    def add(self, order: int, title: str, url: str, text: str) -> None:
+        """
+        order: ソースの優先順（小さいほど優先）。スレッドごとに異なる order なら並行に呼んでよい。
+        """
+        self._sources[order] = _Source(title, url, text)
+
+    def relevant_tokens(self, order: int, weights: Dict[str, float], min_coverage: float) -> int:
+        """
+        order のソースのうち、質問の語（weights）を min_coverage 以上含むチャンクの token 数。
+        """
+        src = self._sources.get(order)
+        if src is None:
+            return 0
+        return sum(cost for toks, cost in zip(src.tokens, src.costs) if coverage(weights, toks) >= min_coverage)
+
+    def _sources_for(self, orders: Optional[Sequence[int]]) -> List[_Source]:
+        keys = sorted(self._sources) if orders is None else [o for o in orders if o in self._sources]
+        return [self._sources[k] for k in keys if self._sources[k].chunks]
+
+    def _scores(self, sources: List[_Source]) -> List[List[float]]:
+        bm25 = BM25([t for src in sources for t in src.tokens])
+        scores: List[List[float]] = []
+        pos = 0
+        for src in sources:
+            n = len(src.chunks)
+            scores.append([bm25.score(self.query, pos + j) for j in range(n)] if self.query else [0.0] * n)
+            pos += n
+        return scores
+
+    def build(self, token_budget: int, orders: Optional[Sequence[int]] = None) -> str:
+        """
+        質問は含めない（prompt cache の prefix にならなくなるので、呼び出し側で本文の後に置く）。
+        """
+        sources = self._sources_for(orders)
+        if not sources:
+            return ""
+        picked: List[Set[int]] = [set() for _ in sources]
+        _fill(sources, self._scores(sources), max(0, token_budget), picked)
+        return _render(sources, picked)
+
+    def build_split(self, token_budget: int, shared_budget: int, orders: Optional[Sequence[int]] = None) -> Corpus:
+        """
+        shared: 質問を見ずに shared_budget まで詰めた部分（同じページなら質問が違っても同じ文字列）。
+        related: 残りの予算で、質問に近いチャンクを shared に入らなかったものから足した部分。
+        """
+        sources = self._sources_for(orders)
+        if not sources:
+            return Corpus("")
+        budget = max(0, token_budget)
+        # shared の並びと中身は本文だけで決める（読んだ順・質問で変わらないように URL 順）
+        by_url = sorted(range(len(sources)), key=lambda i: sources[i].url)
+        shared: List[Set[int]] = [set() for _ in sources]
+        used = _fill(
+            [sources[i] for i in by_url],
+            [[0.0] * len(sources[i].chunks) for i in by_url],
+            min(budget, max(0, shared_budget)),
+            [shared[i] for i in by_url],
+        )
+        picked = [set(p) for p in shared]
+        _fill(sources, self._scores(sources), budget - used, picked)
+        return Corpus(
+            _render([sources[i] for i in by_url], [shared[i] for i in by_url]),
+            _render(sources, [p - q for p, q in zip(picked, shared)]),
+        )
+
+
+def _fill(sources: List[_Source], scores: List[List[float]], budget: int, picked: List[Set[int]]) -> int:
+    """
+    各ソースに公平に枠を配り（water-filling）、スコア順に picked へ追加する。使った token 数を返す。
+    この呼び出しでチャンクを足したソースは見出しの分も数える。
+    """
+    needs = [sum(c for j, c in enumerate(src.costs) if j not in picked[i]) + src.header_cost for i, src in enumerate(sources)]
+    shares = [0] * len(sources)
+    remaining = budget
+    active = list(range(len(sources)))
+    for i in sorted(active, key=lambda j: needs[j]):
+        share = remaining // max(1, len(active))
+        shares[i] = min(needs[i], share)
+        remaining -= shares[i]
+        active.remove(i)
+
+    added = [False] * len(sources)
+    leftover = budget
+    for i, src in enumerate(sources):
+        used = _select(scores[i], src.costs, shares[i] - src.header_cost, picked[i])
+        if used:
+            added[i] = True
+            leftover -= used + src.header_cost
+
+    # 枠の端数（チャンク境界で使い切れなかった分）は優先順に再配分
+    for i, src in enumerate(sources):
+        if leftover <= 0:
+            break
+        header_cost = 0 if added[i] else src.header_cost
+        used = _select(scores[i], src.costs, leftover - header_cost, picked[i])
+        if used:
+            added[i] = True
+            leftover -= used + header_cost
+    return budget - leftover
+
+
+def _render(sources: List[_Source], picked: List[Set[int]]) -> str:
+    parts: List[str] = []
+    for i, src in enumerate(sources):
+        if not picked[i]:
+            continue
+        body: List[str] = []
+        prev = -1
+        for j in sorted(picked[i]):
+            if j != prev + 1:
+                body.append(OMITTED_MARK)
+            body.append(src.chunks[j])
+            prev = j
+        if prev != len(src.chunks) - 1:
+            body.append(OMITTED_MARK)
+        parts.append(src.header + "\n\n".join(body))
+    return "\n\n".join(parts)
+
+
+def pack_corpus(question: str, sources: Sequence[Tuple[str, str, str]], token_budget: int) -> str:
+    """
+    sources: [(title, url, text), ...]（優先順）
+    """
+    builder = CorpusBuilder(question)
+    for i, (title, url, text) in enumerate(sources):
+        builder.add(i, title, url, text)
+    return builder.build(token_budget)
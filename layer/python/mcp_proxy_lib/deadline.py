@@ -0,0 +1,65 @@
+"""
+mcp_proxy_lib.deadline
+
+Invocation deadline derived from the Lambda context.
+
+- Based on time.monotonic() so it is safe against wall-clock adjustments.
+- Keeps a small reserve so the handler still has time to build its response.
+- Passed down through mcp_tools_call / call_with_retry / Bedrock calls so each
+  attempt's timeout shrinks to fit; DeadlineExceeded lets handlers answer 504
+  with partial results instead of being killed by the Lambda timeout.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any
+
+DEFAULT_BUDGET_S = 25.0
+DEFAULT_RESERVE_MS = 1500
+# これより短い timeout で upstream を呼んでも意味がない
+MIN_TIMEOUT_S = 0.5
+
+
+class DeadlineExceeded(RuntimeError):
+    pass
+
+
+class Deadline:
+    def __init__(self, expires_at: float) -> None:
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + max(0.0, seconds))
+
+    @classmethod
+    def from_context(cls, context: Any, reserve_ms: int = DEFAULT_RESERVE_MS, default_s: float = DEFAULT_BUDGET_S) -> "Deadline":
+        """
+        context.get_remaining_time_in_millis() から deadline を作る。
+        ローカル実行などで context が無い場合は default_s を使う。
+        """
+        getter = getattr(context, "get_remaining_time_in_millis", None)
+        if callable(getter):
+            try:
+                remaining_ms = int(getter())
+                return cls.after((remaining_ms - reserve_ms) / 1000.0)
+            except Exception:
+                pass
+        return cls.after(default_s)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, cap_s: float) -> float:
+        """
+        1 回の upstream 呼び出しに使う timeout（cap_s と残り時間の小さい方）。
+        残りが MIN_TIMEOUT_S 未満なら DeadlineExceeded。
+        """
+        remaining = self.remaining()
+        if remaining < MIN_TIMEOUT_S:
+            raise DeadlineExceeded(f"deadline exceeded (remaining {remaining:.3f}s)")
+        return min(cap_s, remaining)
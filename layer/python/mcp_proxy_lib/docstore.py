@@ -0,0 +1,314 @@
+"""
+mcp_proxy_lib.docstore
+
+Read engine for aws___read_documentation: fetch a document once, serve any
+window of it from cache.
+
+- Documents are fetched upstream in large segments (READ_FETCH_SEGMENT_CHARS),
+  following the "<e>Content truncated. ... start_index=N ...</e>" continuation
+  hint, only as far as the requested window needs (up to READ_MAX_DOC_CHARS).
+  The "AWS Documentation from <url>:" preamble the server puts on every
+  segment is stripped, so offsets in the stored text are upstream offsets.
+- A window that starts a whole segment or more past the cached prefix is
+  served from the segment(s) covering it, fetched directly (tool-cached per
+  segment) instead of paging through everything before it.
+- Storage is content-addressed on top of ToolCache (zlib-compressed in the
+  shared tier):
+    read_document       {url}      -> {version}
+    read_document_blob  {version}  -> {text, complete, next_start}   (version = sha256 of the text)
+  Identical content under several URLs is stored once, and a cursor keeps
+  paging through the version it started on while that blob is cached.
+- Windows are sliced locally; cursors are opaque (url, start, length, version)
+  tokens, so page 2..n cost nothing upstream.
+- Concurrent loads of the same uncached document are coalesced
+  (mcp_proxy_lib.singleflight), in the container and across containers.
+- Callers that send several reads in one JSON-RPC batch (ask) use
+  cached_window() first, then read_call() / ingest() for the misses, so their
+  reads land in (and are served from) the same documents the warmer refreshes.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from mcp_proxy_lib.cache import ToolCache, default_cache
+from mcp_proxy_lib.deadline import Deadline
+from mcp_proxy_lib.http_client import mcp_tools_call
+from mcp_proxy_lib.singleflight import coalesce
+
+TOOL_READ = "aws___read_documentation"
+MANIFEST_TOOL = "read_document"
+BLOB_TOOL = "read_document_blob"
+
+FETCH_SEGMENT_CHARS = int(os.environ.get("READ_FETCH_SEGMENT_CHARS") or 50000)
+MAX_DOC_CHARS = int(os.environ.get("READ_MAX_DOC_CHARS") or 500000)
+DEFAULT_WINDOW_CHARS = 5000
+MAX_WINDOW_CHARS = 100000
+
+# upstream が max_length で切ったときに末尾に付ける案内
+# （"... with start_index=N to get more content." / 旧形式 "start_index of N"）
+_TRUNCATED_RE = re.compile(r"\s*<e>\s*Content truncated\..*?start_index(?:\s*=\s*|\s+of\s+)(\d+).*?</e>\s*$", re.IGNORECASE | re.DOTALL)
+# start_index が文書末以降のときの本文
+_NO_MORE_RE = re.compile(r"^\s*<e>\s*No more content available\.?\s*</e>\s*$", re.IGNORECASE)
+# 各セグメントの先頭に付く "AWS Documentation from <url>:\n\n"
+_PREAMBLE_RE = re.compile(r"^AWS Documentation from \S+:\n\n")
+
+
+class Document(NamedTuple):
+    url: str
+    version: str
+    text: str
+    complete: bool
+    next_start: int
+
+
+def _tool_text(result: Any) -> str:
+    if isinstance(result, dict):
+        for c in result.get("content") or []:
+            if isinstance(c, dict) and c.get("type") == "text" and isinstance(c.get("text"), str):
+                return c["text"]
+    return ""
+
+
+def _version(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def encode_cursor(url: str, start: int, length: int, version: str) -> str:
+    raw = json.dumps({"u": url, "s": start, "n": length, "v": version}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        obj = json.loads(raw)
+        out = {"url": str(obj["u"]), "start_index": int(obj["s"]), "max_length": int(obj["n"]), "version": str(obj.get("v") or "")}
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError("cursor is invalid")
+    if not out["url"] or out["start_index"] < 0 or out["max_length"] <= 0:
+        raise ValueError("cursor is invalid")
+    return out
+
+
+def _clamp(start_index: int, max_length: int) -> Tuple[int, int]:
+    return max(0, start_index), max(1, min(max_length, MAX_WINDOW_CHARS))
+
+
+class UpstreamToolError(RuntimeError):
+    """
+    upstream が isError の結果を返した（result をそのまま返せるように保持する）。
+    """
+
+    def __init__(self, result: Any) -> None:
+        super().__init__(_tool_text(result)[:2000] or "read_documentation failed")
+        self.result = result
+
+
+def _parse_segment(result: Any, start: int, url: str = "") -> Tuple[str, int, bool]:
+    """
+    start から取った 1 セグメントの結果。返り値: (本文, 次の start_index, 文書の最後まで読んだか)
+    """
+    if not isinstance(result, dict) or result.get("isError"):
+        raise UpstreamToolError(result)
+    segment = _PREAMBLE_RE.sub("", _tool_text(result), count=1)
+    if _NO_MORE_RE.match(segment):
+        return "", start, True
+    m = _TRUNCATED_RE.search(segment)
+    if not m:
+        return segment, start + len(segment), True
+    segment, next_start = segment[:m.start()], int(m.group(1))
+    if next_start != start + len(segment):
+        # 前置きの形式が変わった等でオフセットがずれている（続きは upstream の案内に従う）
+        print("[READ_DOC_OFFSET_MISMATCH]", {"url": url, "start": start, "chars": len(segment), "next_start": next_start})
+    return segment, next_start, not segment
+
+
+class DocumentStore:
+    def __init__(self, endpoint: str, cache: ToolCache, segment_chars: int = FETCH_SEGMENT_CHARS, max_chars: int = MAX_DOC_CHARS) -> None:
+        self.endpoint = endpoint
+        self.cache = cache
+        self.segment_chars = segment_chars
+        self.max_chars = max_chars
+
+    def _blob(self, url: str, version: str) -> Optional[Document]:
+        hit, blob = self.cache.get(BLOB_TOOL, {"version": version})
+        if not hit or not isinstance(blob, dict) or not isinstance(blob.get("text"), str):
+            return None
+        return Document(url, version, blob["text"], bool(blob.get("complete")), int(blob.get("next_start") or 0))
+
+    def _cached(self, url: str, version: Optional[str] = None) -> Optional[Document]:
+        if version:
+            # cursor の版がまだ残っていればそれを使う（ページ送り中に内容が変わらないように）
+            doc = self._blob(url, version)
+            if doc is not None:
+                return doc
+        hit, manifest = self.cache.get(MANIFEST_TOOL, {"url": url})
+        if not hit or not isinstance(manifest, dict) or not manifest.get("version"):
+            return None
+        return self._blob(url, str(manifest["version"]))
+
+    def _store(self, doc: Document) -> None:
+        self.cache.put(BLOB_TOOL, {"version": doc.version}, {"text": doc.text, "complete": doc.complete, "next_start": doc.next_start})
+        self.cache.put(MANIFEST_TOOL, {"url": doc.url}, {"version": doc.version})
+
+    def _extend(self, doc: Optional[Document], url: str, need_until: int, deadline: Optional[Deadline]) -> Document:
+        """
+        need_until 文字目まで（または文書の最後まで）upstream から取得して追記する。
+        """
+        text = doc.text if doc else ""
+        start = doc.next_start if doc else 0
+        complete = doc.complete if doc else False
+        fetched = False
+        while not complete and len(text) < min(need_until, self.max_chars):
+            _, args = self.read_call(url, start)
+            # セグメント単位ではキャッシュしない（文書単位でこのモジュールが持つ）
+            result = mcp_tools_call(self.endpoint, TOOL_READ, args, use_cache=False, deadline=deadline)
+            segment, start, complete = _parse_segment(result, start, url)
+            text += segment
+            fetched = True
+
+        if doc is not None and not fetched:
+            return doc
+        return self._save(url, text, complete, start)
+
+    def _save(self, url: str, text: str, complete: bool, next_start: int) -> Document:
+        if len(text) >= self.max_chars and not complete:
+            print("[READ_DOC_TRUNCATED]", {"url": url, "max_chars": self.max_chars})
+        out = Document(url, _version(text), text, complete, next_start)
+        self._store(out)
+        return out
+
+    def read_call(self, url: str, start: int = 0) -> Tuple[str, Dict[str, Any]]:
+        """
+        start からの 1 セグメントを取る tools/call の (tool, arguments)。
+        """
+        return TOOL_READ, {"url": url, "max_length": self.segment_chars, "start_index": start}
+
+    def ingest(self, url: str, result: Any) -> Document:
+        """
+        呼び出し側が送った read_call(url) の結果を、先頭セグメントとして文書に保存する。
+        isError なら UpstreamToolError。
+        """
+        segment, next_start, complete = _parse_segment(result, 0, url)
+        return self._save(url, segment, complete, next_start)
+
+    def cached_window(self, url: str, start_index: int = 0, max_length: int = DEFAULT_WINDOW_CHARS) -> Optional[Dict[str, Any]]:
+        """
+        キャッシュ済みの文書で足りれば window() と同じ結果、足りなければ None（upstream は呼ばない）。
+        """
+        start_index, max_length = _clamp(start_index, max_length)
+        doc = self._cached(url)
+        if not self._covers(doc, start_index + max_length + 1):
+            return None
+        return self.window_of(doc, start_index, max_length)
+
+    def _covers(self, doc: Optional[Document], need_until: int) -> bool:
+        return doc is not None and (doc.complete or len(doc.text) >= min(need_until, self.max_chars))
+
+    def load(self, url: str, need_until: int, deadline: Optional[Deadline] = None, version: Optional[str] = None) -> Document:
+        doc = self._cached(url, version)
+        if self._covers(doc, need_until):
+            return doc
+
+        def lookup() -> Tuple[bool, Any]:
+            d = self._cached(url, version)
+            return self._covers(d, need_until), d
+
+        # 同じ文書の取得は 1 回にまとめる（先行側が書き込んだ文書を lookup で拾う）
+        doc = coalesce(
+            MANIFEST_TOOL,
+            {"url": url},
+            lambda: self._extend(self._cached(url, version), url, need_until, deadline),
+            cache=self.cache,
+            lookup=lookup,
+            deadline=deadline,
+        )
+        if not self._covers(doc, need_until):
+            # 先行側の取得範囲が足りなかった（より後ろのページを要求している）
+            doc = self._extend(doc, url, need_until, deadline)
+        return doc
+
+    def refresh(self, url: str, need_until: int = DEFAULT_WINDOW_CHARS + 1, deadline: Optional[Deadline] = None) -> Document:
+        """
+        キャッシュを見ずに先頭から取り直す（warmer 用）。内容が変わっていなければ版も同じ。
+        """
+        return self._extend(None, url, need_until, deadline)
+
+    def window(self, url: str, start_index: int = 0, max_length: int = DEFAULT_WINDOW_CHARS, deadline: Optional[Deadline] = None, version: Optional[str] = None) -> Dict[str, Any]:
+        """
+        read_documentation と同じ形の結果 + pagination。
+        """
+        start_index, max_length = _clamp(start_index, max_length)
+        # 次ページの有無が分かるように 1 文字先まで確保する
+        need_until = start_index + max_length + 1
+        doc = self._cached(url, version)
+        if not self._covers(doc, need_until) and start_index >= (len(doc.text) if doc else 0) + self.segment_chars:
+            # 手前を順に読むと丸ごと捨てるセグメントが出る → 必要なセグメントだけ取る
+            return self._window_direct(url, start_index, max_length, deadline)
+        doc = self.load(url, need_until, deadline, version)
+        return self.window_of(doc, start_index, max_length)
+
+    def _window_direct(self, url: str, start_index: int, max_length: int, deadline: Optional[Deadline]) -> Dict[str, Any]:
+        """
+        start_index を含むセグメントから need_until までを直接取って window を作る。
+        セグメントは tool cache（引数単位・同時呼び出しはまとめる）に載り、文書としては保存しない。
+        """
+        first = start_index - start_index % self.segment_chars
+        need_until = start_index + max_length + 1
+        text, start, complete = "", first, False
+        while not complete and first + len(text) < need_until:
+            result = mcp_tools_call(self.endpoint, TOOL_READ, {"url": url, "max_length": self.segment_chars, "start_index": start}, deadline=deadline)
+            segment, start, complete = _parse_segment(result, start, url)
+            text += segment
+        total = first + len(text)
+        out = text[start_index - first:start_index - first + max_length]
+        has_more = start_index + len(out) < total or not complete
+        # 先頭からの文書ではないので版は付けない（次ページも同じ経路で読む）
+        # 文書末より後ろから取り始めた場合は全体の長さが分からない
+        known = complete and (text or first == 0)
+        return self._result(url, start_index, max_length, out, has_more, total if known else None, complete, "")
+
+    def window_of(self, doc: Document, start_index: int, max_length: int) -> Dict[str, Any]:
+        """
+        取得済みの doc から window() と同じ形の結果を作る。
+        """
+        start_index, max_length = _clamp(start_index, max_length)
+        text = doc.text[start_index:start_index + max_length]
+        end = start_index + len(text)
+        has_more = end < len(doc.text) or (not doc.complete and len(doc.text) < self.max_chars)
+        return self._result(doc.url, start_index, max_length, text, has_more, len(doc.text) if doc.complete else None, doc.complete, doc.version)
+
+    @staticmethod
+    def _result(url: str, start_index: int, max_length: int, text: str, has_more: bool, total_length: Optional[int], complete: bool, version: str) -> Dict[str, Any]:
+        end = start_index + len(text)
+        prev_start = max(0, start_index - max_length)
+        return {
+            "content": [{"type": "text", "text": text}],
+            "isError": False,
+            "pagination": {
+                "start_index": start_index,
+                "end_index": end,
+                "total_length": total_length,
+                "complete": complete,
+                "version": version,
+                "next_cursor": encode_cursor(url, end, max_length, version) if has_more else None,
+                "prev_cursor": encode_cursor(url, prev_start, max_length, version) if start_index > 0 else None,
+            },
+        }
+
+
+_DEFAULT_STORES: Dict[str, DocumentStore] = {}
+
+
+def default_document_store(endpoint: str) -> DocumentStore:
+    store = _DEFAULT_STORES.get(endpoint)
+    if store is None:
+        store = _DEFAULT_STORES[endpoint] = DocumentStore(endpoint, default_cache())
+    return store
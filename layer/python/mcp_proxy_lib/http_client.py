@@ -7,15 +7,51 @@ Packaged as a Lambda Layer and imported by multiple Lambdas.
 - Uses JSON-RPC "tools/call".
 - Supports "application/json" and "text/event-stream" (SSE).
 - Does not depend on session IDs.
+- Reuses keep-alive connections across warm invocations (see mcp_proxy_lib.pool).
+- Caches results of idempotent tools (see mcp_proxy_lib.cache).
+- Decodes SSE incrementally and stops at the matching response, then drains
+  the short rest of the stream so the connection is reused (see mcp_proxy_lib.sse).
+- mcp_tools_call_many sends several tools/call in one JSON-RPC batch POST and
+  falls back to concurrent single calls if the server rejects batches.
+- Retries with jittered backoff behind a circuit breaker (see mcp_proxy_lib.resilience).
+- Records connect / TTFB / download timings and retry counts into the
+  current trace (see mcp_proxy_lib.metrics).
+- Coalesces identical concurrent tools/call, in the container and across
+  containers through the shared cache (see mcp_proxy_lib.singleflight).
 """
 
 from __future__ import annotations
 
+import http.client
 import json
+import threading
 import time
-import urllib.request
-import urllib.error
-from typing import Any, Dict, List, Optional
+import urllib.parse
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from mcp_proxy_lib.cache import ToolCache, default_cache
+from mcp_proxy_lib.deadline import Deadline, DeadlineExceeded
+from mcp_proxy_lib.metrics import incr, record
+from mcp_proxy_lib.pool import PoolKey, default_pool
+from mcp_proxy_lib.resilience import (
+    MIN_ATTEMPT_S,
+    Backoff,
+    UpstreamConnectionError,
+    UpstreamHTTPError,
+    breaker_for,
+    is_transient,
+    parse_retry_after,
+)
+from mcp_proxy_lib.singleflight import coalesce
+from mcp_proxy_lib.sse import decode_sse_bytes, read_mcp_messages
+
+# keep-alive ソケットが idle 中にサーバ側で閉じられていた場合に出る例外
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+# JSON-RPC batch を拒否した endpoint（コンテナ内で記憶し、以降は最初から単発呼び出し）
+_BATCH_UNSUPPORTED: Set[str] = set()
+_BATCH_UNSUPPORTED_LOCK = threading.Lock()
+BATCH_FALLBACK_CONCURRENCY = 5
 
 
 def json_dumps(obj: Any) -> str:
@@ -27,27 +63,13 @@ def json_loads(s: str) -> Any:
 
 
 def decode_mcp_response(content_type: str, body_bytes: bytes) -> List[Dict[str, Any]]:
+    if "text/event-stream" in (content_type or ""):
+        return decode_sse_bytes(body_bytes)
+
     body = body_bytes.decode("utf-8", errors="replace").strip()
     if not body:
         return []
 
-    if "text/event-stream" in (content_type or ""):
-        msgs: List[Dict[str, Any]] = []
-        for line in body.splitlines():
-            line = line.strip()
-            if not line.startswith("data:"):
-                continue
-            data = line[len("data:"):].strip()
-            if not data:
-                continue
-            try:
-                m = json_loads(data)
-                if isinstance(m, dict):
-                    msgs.append(m)
-            except Exception:
-                continue
-        return msgs
-
     try:
         parsed = json_loads(body)
     except Exception:
@@ -60,69 +82,281 @@ def decode_mcp_response(content_type: str, body_bytes: bytes) -> List[Dict[str,
     return []
 
 
-def http_post_mcp(endpoint: str, payload: Any, timeout_s: int = 25) -> List[Dict[str, Any]]:
+def _request_ids(payload: Any) -> Set[Any]:
+    items = payload if isinstance(payload, list) else [payload]
+    return {m["id"] for m in items if isinstance(m, dict) and m.get("id") is not None}
+
+
+def _pool_key(endpoint: str) -> Tuple[PoolKey, str]:
+    u = urllib.parse.urlsplit(endpoint)
+    scheme = (u.scheme or "https").lower()
+    port = u.port or (443 if scheme == "https" else 80)
+    path = u.path or "/"
+    if u.query:
+        path = f"{path}?{u.query}"
+    return (scheme, u.hostname or "", port), path
+
+
+def http_post_mcp(endpoint: str, payload: Any, timeout_s: float = 25, deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+    if deadline is not None:
+        timeout_s = deadline.timeout(timeout_s)
     data = json_dumps(payload).encode("utf-8")
-    req = urllib.request.Request(endpoint, data=data, method="POST")
-    req.add_header("Accept", "application/json, text/event-stream")
-    req.add_header("Content-Type", "application/json; charset=utf-8")
-    req.add_header("User-Agent", "aws-knowledge-mcp-browser-proxy/1.0")
+    headers = {
+        "Accept": "application/json, text/event-stream",
+        "Content-Type": "application/json; charset=utf-8",
+        "User-Agent": "aws-knowledge-mcp-browser-proxy/1.0",
+        "Connection": "keep-alive",
+    }
+    key, path = _pool_key(endpoint)
+    pool = default_pool()
+    want_ids = _request_ids(payload)
 
-    try:
-        with urllib.request.urlopen(req, timeout=timeout_s) as resp:
-            ctype = resp.headers.get("Content-Type", "")
-            body = resp.read() if resp.length is None or resp.length > 0 else b""
-            return decode_mcp_response(ctype, body)
-    except urllib.error.HTTPError as e:
-        err_body = ""
+    # reused 接続が stale だった場合だけ、新規接続で1回やり直す
+    for fresh in (False, True):
+        conn, reused = pool.acquire(key, timeout_s, fresh=fresh)
+        incr("upstream_requests")
         try:
-            err_body = e.read().decode("utf-8", errors="replace")
-        except Exception:
-            err_body = "<failed to read error body>"
-        print("[MCP_HTTP_ERROR]", {
-            "status": getattr(e, "code", None),
-            "reason": getattr(e, "reason", None),
-            "headers": dict(getattr(e, "headers", {}) or {}),
-            "body": err_body[:4000],
-        })
-        raise RuntimeError(f"MCP HTTPError {e.code}: {err_body[:2000]}")
-    except urllib.error.URLError as e:
-        print("[MCP_URL_ERROR]", str(e))
-        raise RuntimeError(f"MCP URLError: {e}")
-
-
-def call_with_retry(endpoint: str, payload: Any, tool: str, max_retries: int = 3) -> List[Dict[str, Any]]:
-    last_err: Optional[str] = None
+            t0 = time.perf_counter()
+            if conn.sock is None:
+                # TCP/TLS ハンドシェイクを request() の外で行い、connect 時間を分けて計測する
+                conn.connect()
+            t1 = time.perf_counter()
+            conn.request("POST", path, body=data, headers=headers)
+            resp = conn.getresponse()
+            record("upstream_connect", (t1 - t0) * 1000.0)
+            record("upstream_ttfb", (time.perf_counter() - t1) * 1000.0)
+            status = resp.status
+            ctype = resp.getheader("Content-Type", "") or ""
+            if status >= 400:
+                body = resp.read()
+            else:
+                # 欲しい id の応答が揃った時点でデコードをやめ、残りは短時間だけ読み捨てる
+                msgs, drained = read_mcp_messages(resp, ctype, want_ids, sock=conn.sock)
+        except _STALE_CONNECTION_ERRORS as e:
+            pool.discard(conn)
+            if reused and not fresh:
+                continue
+            print("[MCP_URL_ERROR]", str(e))
+            raise UpstreamConnectionError(str(e))
+        except (OSError, http.client.HTTPException) as e:
+            pool.discard(conn)
+            print("[MCP_URL_ERROR]", str(e))
+            raise UpstreamConnectionError(str(e))
+
+        if status >= 400:
+            err_body = body.decode("utf-8", errors="replace")
+            print("[MCP_HTTP_ERROR]", {
+                "status": status,
+                "reason": resp.reason,
+                "headers": dict(resp.getheaders()),
+                "body": err_body[:4000],
+            })
+            if resp.will_close:
+                pool.discard(conn)
+            else:
+                pool.release(key, conn)
+            raise UpstreamHTTPError(status, err_body, retry_after=parse_retry_after(resp.getheader("Retry-After")))
+
+        # 読み残しがある（drain が予算を超えた）接続は再利用できない
+        if resp.will_close or not drained:
+            pool.discard(conn)
+        else:
+            pool.release(key, conn)
+        return msgs
+
+    raise UpstreamConnectionError("connection retry exhausted")
+
+
+def call_with_retry(endpoint: str, payload: Any, tool: str, max_retries: int = 3, deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+    """
+    - 429/5xx/通信エラーだけリトライ（decorrelated jitter、Retry-After を下限として尊重）
+    - endpoint ごとの circuit breaker が open の間は即失敗（CircuitOpenError）
+    - deadline があれば、sleep + 次の試行が収まらないリトライはしない
+    """
+    breaker = breaker_for(endpoint)
+    backoff = Backoff()
+    last_exc: Optional[Exception] = None
     for attempt in range(1, max_retries + 1):
+        breaker.before_call()
         try:
-            return http_post_mcp(endpoint, payload)
+            msgs = http_post_mcp(endpoint, payload, deadline=deadline)
+        except DeadlineExceeded:
+            # half-open の probe のまま残すと以後の呼び出しがすべて CircuitOpenError になる
+            breaker.record_abandoned()
+            raise
         except Exception as ex:
-            last_err = str(ex)
-            transient = ("HTTPError 500" in last_err) or ("URLError" in last_err) or ("timed out" in last_err)
+            last_exc = ex
+            transient = is_transient(ex)
+            # 4xx は upstream 自体は生きているので breaker の失敗には数えない
+            if transient:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
             print("[MCP_CALL_FAILURE]", {
                 "attempt": attempt,
                 "max_retries": max_retries,
                 "tool": tool,
-                "error": last_err[:2000],
+                "error": str(ex)[:2000],
                 "transient": transient,
+                "status": getattr(ex, "status", None),
             })
-            if attempt >= max_retries or not transient:
+            if attempt >= max_retries or not transient or breaker.state == breaker.OPEN:
                 break
-            time.sleep(0.4 * attempt)
-    raise RuntimeError(last_err or "Unknown error")
+            delay = max(backoff.next(), getattr(ex, "retry_after", None) or 0.0)
+            if deadline is not None and deadline.remaining() < delay + MIN_ATTEMPT_S:
+                print("[MCP_RETRY_BUDGET_EXHAUSTED]", {"tool": tool, "remaining_s": round(deadline.remaining(), 3), "delay_s": round(delay, 3)})
+                raise DeadlineExceeded(f"no time left to retry {tool}: {str(ex)[:500]}") from ex
+            incr("retries")
+            time.sleep(delay)
+            continue
+
+        breaker.record_success()
+        return msgs
+
+    if isinstance(last_exc, RuntimeError):
+        raise last_exc
+    raise RuntimeError(str(last_exc) if last_exc else "Unknown error")
 
 
-def mcp_tools_call(endpoint: str, tool_name: str, arguments: Dict[str, Any]) -> Any:
-    payload = {
+def _cache_for(tool_name: str, use_cache: bool) -> Optional[ToolCache]:
+    cache = default_cache() if use_cache else None
+    if cache is not None and cache.ttl_for(tool_name) <= 0:
+        return None
+    return cache
+
+
+def _store(cache: Optional[ToolCache], tool_name: str, arguments: Dict[str, Any], result: Any) -> None:
+    # エラー応答はキャッシュしない
+    if cache is not None and isinstance(result, dict) and not result.get("isError"):
+        cache.put(tool_name, arguments, result)
+
+
+def mcp_tools_call(endpoint: str, tool_name: str, arguments: Dict[str, Any], use_cache: bool = True, deadline: Optional[Deadline] = None, refresh: bool = False) -> Any:
+    """
+    refresh=True: キャッシュは読まずに upstream から取り直して書き込む（warmer 用）。
+    """
+    cache = _cache_for(tool_name, use_cache)
+    if cache is not None and not refresh:
+        hit, cached = cache.get(tool_name, arguments)
+        if hit:
+            incr("cache_hits")
+            return cached
+
+    def fetch() -> Any:
+        result = _mcp_tools_call_uncached(endpoint, tool_name, arguments, deadline)
+        _store(cache, tool_name, arguments, result)
+        return result
+
+    # refresh は共有キャッシュの古い値を待っても意味がないのでコンテナ内だけでまとめる
+    return coalesce(tool_name, arguments, fetch, cache=None if refresh else cache, deadline=deadline)
+
+
+def _tools_call_request(request_id: int, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    return {
         "jsonrpc": "2.0",
-        "id": 1,
+        "id": request_id,
         "method": "tools/call",
         "params": {"name": tool_name, "arguments": arguments},
     }
 
-    msgs = call_with_retry(endpoint, payload, tool=tool_name, max_retries=3)
+
+def _mcp_tools_call_uncached(endpoint: str, tool_name: str, arguments: Dict[str, Any], deadline: Optional[Deadline] = None) -> Any:
+    payload = _tools_call_request(1, tool_name, arguments)
+
+    msgs = call_with_retry(endpoint, payload, tool=tool_name, max_retries=3, deadline=deadline)
 
     for m in msgs:
         if m.get("id") == 1 and "result" in m:
             return m["result"]
 
     return {"isError": True, "content": [{"type": "text", "text": json_dumps(msgs)}]}
+
+
+def mcp_tools_call_many(endpoint: str, calls: List[Tuple[str, Dict[str, Any]]], use_cache: bool = True, deadline: Optional[Deadline] = None) -> List[Any]:
+    """
+    calls: [(tool_name, arguments), ...]
+    返り値は calls と同じ順序の結果（各要素は mcp_tools_call と同じ形）。
+    キャッシュ済みのものは送らず、残りを 1 回の JSON-RPC batch で送る。
+    """
+    results: List[Any] = [None] * len(calls)
+    caches = [_cache_for(tool, use_cache) for tool, _ in calls]
+    pending: List[int] = []
+    for i, (tool, args) in enumerate(calls):
+        cache = caches[i]
+        if cache is not None:
+            hit, cached = cache.get(tool, args)
+            if hit:
+                incr("cache_hits")
+                results[i] = cached
+                continue
+        pending.append(i)
+
+    if not pending:
+        return results
+
+    todo = [calls[i] for i in pending]
+    fetched: Optional[List[Any]] = None
+    if len(todo) > 1 and endpoint not in _BATCH_UNSUPPORTED:
+        fetched = _tools_call_batch(endpoint, todo, deadline)
+    if fetched is None:
+        fetched = _tools_call_concurrent(endpoint, todo, deadline)
+
+    for i, result in zip(pending, fetched):
+        results[i] = result
+        _store(caches[i], calls[i][0], calls[i][1], result)
+    return results
+
+
+def _mark_batch_unsupported(endpoint: str, reason: str) -> None:
+    with _BATCH_UNSUPPORTED_LOCK:
+        _BATCH_UNSUPPORTED.add(endpoint)
+    print("[MCP_BATCH_UNSUPPORTED]", {"endpoint": endpoint, "reason": reason[:500]})
+
+
+def _tools_call_batch(endpoint: str, calls: List[Tuple[str, Dict[str, Any]]], deadline: Optional[Deadline] = None) -> Optional[List[Any]]:
+    """
+    batch を拒否された場合は None（呼び出し側で単発にフォールバック）。
+    """
+    payload = [_tools_call_request(n + 1, tool, args) for n, (tool, args) in enumerate(calls)]
+    try:
+        msgs = call_with_retry(endpoint, payload, tool="batch", max_retries=3, deadline=deadline)
+    except UpstreamHTTPError as ex:
+        # 4xx = batch 自体を受け付けないサーバ。5xx/通信エラーはそのまま上げる
+        if 400 <= ex.status < 500 and ex.status != 429:
+            _mark_batch_unsupported(endpoint, str(ex))
+            return None
+        raise
+
+    by_id = {m.get("id"): m for m in msgs if "result" in m or "error" in m}
+    if not any((n + 1) in by_id for n in range(len(calls))):
+        # 例: {"id": null, "error": {"code": -32600, ...}} だけが返ってきた
+        _mark_batch_unsupported(endpoint, json_dumps(msgs))
+        return None
+
+    out: List[Any] = []
+    missing: List[int] = []
+    for n in range(len(calls)):
+        m = by_id.get(n + 1)
+        if m is None:
+            missing.append(n)
+            out.append(None)
+        elif "result" in m:
+            out.append(m["result"])
+        else:
+            out.append({"isError": True, "content": [{"type": "text", "text": json_dumps(m)}]})
+
+    # 応答に含まれなかった id だけ単発で取り直す
+    if missing:
+        for n, result in zip(missing, _tools_call_concurrent(endpoint, [calls[n] for n in missing], deadline)):
+            out[n] = result
+    return out
+
+
+def _tools_call_concurrent(endpoint: str, calls: List[Tuple[str, Dict[str, Any]]], deadline: Optional[Deadline] = None) -> List[Any]:
+    if len(calls) == 1:
+        return [_mcp_tools_call_uncached(endpoint, calls[0][0], calls[0][1], deadline)]
+    # concurrent.futures（+ logging）の import は batch のフォールバック時だけ払う
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(BATCH_FALLBACK_CONCURRENCY, len(calls))) as pool:
+        return list(pool.map(lambda c: _mcp_tools_call_uncached(endpoint, c[0], c[1], deadline), calls))
@@ -0,0 +1,55 @@
+"""
+mcp_proxy_lib.lazy
+
+Deferred boto3 client construction.
+
+- Importing boto3 and building a client is the largest part of INIT for the
+  functions that use AWS APIs (ask: bedrock-runtime, shared cache: dynamodb).
+- LazyClient imports boto3 / botocore.config and creates the client on first
+  attribute access (thread-safe), so invocations that never reach the API
+  (cache hits, validation errors, OPTIONS) never pay for it.
+- Use .get() to construct it explicitly (e.g. from a SnapStart / provisioned
+  concurrency primer, see mcp_proxy_lib.snapstart).
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Optional
+
+
+class LazyClient:
+    def __init__(self, service_name: str, **config: Any) -> None:
+        """
+        config: botocore.config.Config の引数（connect_timeout / read_timeout / retries など）
+        """
+        self.service_name = service_name
+        self._config: Dict[str, Any] = config
+        self._client: Optional[Any] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        client = self._client
+        if client is not None:
+            return client
+        with self._lock:
+            if self._client is None:
+                import boto3
+
+                kwargs: Dict[str, Any] = {}
+                if self._config:
+                    from botocore.config import Config
+
+                    kwargs["config"] = Config(**self._config)
+                self._client = boto3.client(self.service_name, **kwargs)
+            return self._client
+
+    def reset(self) -> None:
+        with self._lock:
+            self._client = None
+
+    def __getattr__(self, name: str) -> Any:
+        # __init__ 前（copy/pickle など）に _client を探して無限再帰しないように
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
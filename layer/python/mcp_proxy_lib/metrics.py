@@ -0,0 +1,202 @@
+"""
+mcp_proxy_lib.metrics
+
+Per-invocation stage timing emitted as CloudWatch Embedded Metric Format (EMF).
+
+- Handlers are wrapped with @traced(tool); the layer records stages into the
+  current trace: body_decode, validate, upstream_connect, upstream_ttfb,
+  upstream_download, sse_decode, bedrock_invoke, serialize (+ total).
+- Stages hit from worker threads (parallel reads, batch items) are summed, so
+  they can exceed TotalMs; TotalMs is the handler's wall time.
+- One EMF line per invocation with dimension sets [Tool], [Tool, CacheHit]
+  and [Tool, RetryCount]; CloudWatch computes p50/p99 from the raw values.
+- Invocations that never decoded a body (OPTIONS, 403/404, health) are not
+  emitted. Disabled with METRICS_ENABLED=false.
+- annotate(name, value) adds a Logs Insights property to the line (e.g. the
+  Bedrock model that answered), not a metric or dimension.
+- A container serves one invocation at a time, so the current trace is a
+  module global (visible from the handler's worker threads).
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+METRICS_ENABLED = (os.environ.get("METRICS_ENABLED") or "true").strip().lower() not in ("0", "false", "no")
+METRICS_NAMESPACE = (os.environ.get("METRICS_NAMESPACE") or "AwsKnowledgeMcpProxy").strip()
+
+DIMENSION_SETS = [["Tool"], ["Tool", "CacheHit"], ["Tool", "RetryCount"]]
+
+# カウンタ名 -> EMF のメトリクス名
+_COUNTERS = {
+    "upstream_requests": "UpstreamRequests",
+    "retries": "Retries",
+    "cache_hits": "CacheHits",
+    "bedrock_calls": "BedrockCalls",
+    "coalesced": "Coalesced",
+    "lease_waits": "LeaseWaits",
+    "reads_planned": "ReadsPlanned",
+    "reads_skipped": "ReadsSkipped",
+    "input_tokens": "InputTokens",
+    "cache_read_input_tokens": "CacheReadInputTokens",
+    "cache_write_input_tokens": "CacheWriteInputTokens",
+    "output_tokens": "OutputTokens",
+    "bedrock_throttles": "BedrockThrottles",
+    "model_fallbacks": "ModelFallbacks",
+}
+
+
+def _metric_name(stage_name: str) -> str:
+    # "upstream_ttfb" -> "UpstreamTtfbMs"
+    return "".join(p.capitalize() for p in stage_name.split("_")) + "Ms"
+
+
+def _retry_bucket(retries: int) -> str:
+    return str(retries) if retries < 3 else "3+"
+
+
+class Trace:
+    def __init__(self, tool: str, request_id: Optional[str] = None) -> None:
+        self.tool = tool
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.properties: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, ms: float) -> None:
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + ms
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def annotate(self, name: str, value: Any) -> None:
+        with self._lock:
+            self.properties[name] = value
+
+    def cache_hit(self) -> bool:
+        """
+        upstream にも Bedrock にも行かずにキャッシュだけで応答できたか。
+        """
+        c = self.counters
+        return c.get("cache_hits", 0) > 0 and not c.get("upstream_requests") and not c.get("bedrock_calls")
+
+    def to_emf(self, status: Optional[int] = None) -> Dict[str, Any]:
+        with self._lock:
+            timings = dict(self.timings)
+            counters = dict(self.counters)
+            properties = dict(self.properties)
+        timings["total"] = (time.perf_counter() - self.started) * 1000.0
+
+        metrics = [{"Name": _metric_name(k), "Unit": "Milliseconds"} for k in timings]
+        metrics += [{"Name": _COUNTERS[k], "Unit": "Count"} for k in counters if k in _COUNTERS]
+        doc: Dict[str, Any] = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": DIMENSION_SETS,
+                    "Metrics": metrics,
+                }],
+            },
+            "Tool": self.tool,
+            "CacheHit": "true" if self.cache_hit() else "false",
+            "RetryCount": _retry_bucket(counters.get("retries", 0)),
+            # 以下は dimension ではなく Logs Insights 用のプロパティ
+            "status": status,
+            "requestId": self.request_id,
+            **properties,
+        }
+        for k, v in timings.items():
+            doc[_metric_name(k)] = round(v, 3)
+        for k, v in counters.items():
+            if k in _COUNTERS:
+                doc[_COUNTERS[k]] = v
+        return doc
+
+
+_CURRENT: Optional[Trace] = None
+
+
+def current() -> Optional[Trace]:
+    return _CURRENT
+
+
+def record(name: str, ms: float) -> None:
+    trace = _CURRENT
+    if trace is not None:
+        trace.record(name, ms)
+
+
+def incr(name: str, n: int = 1) -> None:
+    trace = _CURRENT
+    if trace is not None:
+        trace.incr(name, n)
+
+
+def annotate(name: str, value: Any) -> None:
+    """
+    EMF 行に Logs Insights 用のプロパティを付ける（metric にも dimension にもならない）。
+    """
+    trace = _CURRENT
+    if trace is not None:
+        trace.annotate(name, value)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    with stage("body_decode"): ...  例外で抜けた場合も計測する。
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - t0) * 1000.0)
+
+
+def start_trace(tool: str, request_id: Optional[str] = None) -> Trace:
+    global _CURRENT
+    _CURRENT = Trace(tool, request_id)
+    return _CURRENT
+
+
+def end_trace(trace: Trace, status: Optional[int] = None) -> None:
+    global _CURRENT
+    if _CURRENT is trace:
+        _CURRENT = None
+    if not METRICS_ENABLED or "body_decode" not in trace.timings:
+        return
+    try:
+        print(json.dumps(trace.to_emf(status), ensure_ascii=False, separators=(",", ":")))
+    except Exception as e:
+        print("[METRICS_ERROR]", str(e)[:500])
+
+
+def traced(tool: str) -> Callable[[Callable[..., Dict[str, Any]]], Callable[..., Dict[str, Any]]]:
+    """
+    Lambda handler 用デコレータ。1 invocation = 1 trace = 1 EMF 行。
+    """
+    def decorator(fn: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+        @functools.wraps(fn)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            trace = start_trace(tool, getattr(context, "aws_request_id", None))
+            status: Optional[int] = None
+            try:
+                out = fn(event, context)
+                if isinstance(out, dict):
+                    status = out.get("statusCode")
+                return out
+            finally:
+                end_trace(trace, status)
+        return wrapper
+    return decorator
@@ -0,0 +1,145 @@
+"""
+mcp_proxy_lib.model_router
+
+Bedrock model selection and fallback for /api/ask.
+
+- Two tiers: "fast" (BEDROCK_FAST_MODEL_ID, a small model) answers short
+  corpora (<= BEDROCK_FAST_MAX_CORPUS_TOKENS) for simple questions, "large"
+  (BEDROCK_MODEL_ID) everything else. Without a fast model every call goes to
+  the large one. Each tier has its own max_tokens.
+- A route lists the chosen model first, then the other tier and
+  BEDROCK_FALLBACK_MODEL_IDS (e.g. the same model through another
+  cross-region inference profile). Callers move down the list when a model
+  is throttled or unavailable (should_fall_back), and raise ModelsThrottled
+  when every model is. Calls are made without SDK retries (a retry would
+  not fit the deadline); models fail over instead of backing off.
+- A throttled model is moved to the end of routes for
+  BEDROCK_THROTTLE_COOLDOWN_S in this container, so at peak the following
+  requests go straight to a model with capacity.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from mcp_proxy_lib.bm25 import tokenize
+
+FALLBACK_CODES = frozenset({
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "InternalServerException",
+})
+
+FAST_MAX_CORPUS_TOKENS = int(os.environ.get("BEDROCK_FAST_MAX_CORPUS_TOKENS") or 2500)
+# これより語数の多い質問は「単純ではない」とみなす
+FAST_MAX_QUESTION_TERMS = 16
+LARGE_MAX_TOKENS = int(os.environ.get("BEDROCK_MAX_TOKENS") or 800)
+FAST_MAX_TOKENS = int(os.environ.get("BEDROCK_FAST_MAX_TOKENS") or 600)
+THROTTLE_COOLDOWN_S = float(os.environ.get("BEDROCK_THROTTLE_COOLDOWN_S") or 10)
+
+# 比較・設計・移行・原因調査などは大きいモデルに回す
+_COMPLEX_RE = re.compile(
+    r"比較|違い|差分|使い分け|設計|移行|構成|ベストプラクティス|トラブル|原因|なぜ|どちらが|選定|"
+    r"\b(?:vs\.?|versus|compare|comparison|difference|differences|migrate|migration|architecture|design|"
+    r"troubleshoot|troubleshooting|why|best practices?|trade-?offs?)\b",
+    re.IGNORECASE,
+)
+
+
+class Model(NamedTuple):
+    tier: str          # fast / large / fallback
+    model_id: str
+    max_tokens: int
+
+
+class Route(NamedTuple):
+    models: List[Model]    # 優先順（先頭が選ばれたモデル、以降はフォールバック）
+    reason: str
+
+
+class ModelsThrottled(RuntimeError):
+    """
+    route のすべてのモデルが throttling（または一時的な不可用）で失敗した。
+    """
+
+
+def should_fall_back(ex: BaseException) -> bool:
+    """
+    別のモデルなら通る見込みのある失敗か（throttling / 一時的な不可用）。
+    """
+    err = (getattr(ex, "response", None) or {}).get("Error") or {}
+    return err.get("Code") in FALLBACK_CODES
+
+
+def is_simple(question: str) -> bool:
+    return len(tokenize(question)) <= FAST_MAX_QUESTION_TERMS and not _COMPLEX_RE.search(question or "")
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        large_model_id: str,
+        fast_model_id: str = "",
+        fallback_model_ids: Sequence[str] = (),
+        fast_max_corpus_tokens: int = FAST_MAX_CORPUS_TOKENS,
+        cooldown_s: float = THROTTLE_COOLDOWN_S,
+    ) -> None:
+        self.large = Model("large", large_model_id, LARGE_MAX_TOKENS) if large_model_id else None
+        self.fast = Model("fast", fast_model_id, FAST_MAX_TOKENS) if fast_model_id else None
+        self.fallbacks = [Model("fallback", m, LARGE_MAX_TOKENS) for m in fallback_model_ids if m]
+        self.fast_max_corpus_tokens = fast_max_corpus_tokens
+        self.cooldown_s = cooldown_s
+        self._cooling: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def route(self, question: str, corpus_tokens: int) -> Route:
+        if self.fast is not None and corpus_tokens <= self.fast_max_corpus_tokens and is_simple(question):
+            primary, reason = [self.fast, self.large], "short corpus, simple question"
+        elif self.fast is not None:
+            # 大きいモデルが throttling のときは、500 より小さいモデルの回答の方がよい
+            primary = [self.large, self.fast]
+            reason = "long corpus" if corpus_tokens > self.fast_max_corpus_tokens else "complex question"
+        else:
+            primary, reason = [self.large], "single model"
+
+        models: List[Model] = []
+        seen = set()
+        for m in primary + self.fallbacks:
+            if m is not None and m.model_id not in seen:
+                seen.add(m.model_id)
+                models.append(m)
+
+        # throttling 直後のモデルは後回し（並べ替えは安定なので、それ以外の順序は保つ）
+        now = time.monotonic()
+        with self._lock:
+            cooling = {m for m, until in self._cooling.items() if until > now}
+        if cooling:
+            models.sort(key=lambda m: m.model_id in cooling)
+            chosen = next((m for m in primary if m is not None), None)
+            if chosen is not None and models[0].model_id != chosen.model_id:
+                reason += ", primary cooling down"
+        return Route(models, reason)
+
+    def mark_throttled(self, model_id: str) -> None:
+        with self._lock:
+            self._cooling[model_id] = time.monotonic() + self.cooldown_s
+
+
+_DEFAULT_ROUTER: Optional[ModelRouter] = None
+
+
+def default_router() -> ModelRouter:
+    global _DEFAULT_ROUTER
+    if _DEFAULT_ROUTER is None:
+        _DEFAULT_ROUTER = ModelRouter(
+            (os.environ.get("BEDROCK_MODEL_ID") or "").strip(),
+            (os.environ.get("BEDROCK_FAST_MODEL_ID") or "").strip(),
+            [m.strip() for m in (os.environ.get("BEDROCK_FALLBACK_MODEL_IDS") or "").split(",") if m.strip()],
+        )
+    return _DEFAULT_ROUTER
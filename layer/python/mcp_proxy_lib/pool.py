@@ -0,0 +1,124 @@
+"""
+mcp_proxy_lib.pool
+
+Keep-alive connection pool for http.client connections.
+
+- Module-level pool survives across warm Lambda invocations, so the TCP+TLS
+  handshake is paid once per container (per concurrent connection).
+- Idle connections are keyed by (scheme, host, port).
+- Stale sockets (idle too long, or closed/readable while idle) are dropped on
+  acquire; callers retry once on a fresh connection if a reused one fails.
+- The TLS trust store is loaded by a primer and pooled sockets are dropped
+  after a SnapStart restore (see mcp_proxy_lib.snapstart).
+"""
+
+from __future__ import annotations
+
+import http.client
+import select
+import ssl
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from mcp_proxy_lib.snapstart import after_restore, prime
+
+DEFAULT_MAX_IDLE_PER_HOST = 8
+# サーバ/中間装置の keep-alive timeout より短めにしておく
+DEFAULT_IDLE_TIMEOUT_S = 50.0
+
+PoolKey = Tuple[str, str, int]
+
+
+def _sock_is_stale(conn: http.client.HTTPConnection) -> bool:
+    """
+    idle 中のソケットが読み取り可能 = サーバが FIN を送った（or 想定外のデータ）ので再利用不可。
+    """
+    sock = conn.sock
+    if sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+class ConnectionPool:
+    def __init__(self, max_idle_per_host: int = DEFAULT_MAX_IDLE_PER_HOST, idle_timeout_s: float = DEFAULT_IDLE_TIMEOUT_S) -> None:
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout_s = idle_timeout_s
+        self._idle: Dict[PoolKey, List[Tuple[http.client.HTTPConnection, float]]] = {}
+        self._lock = threading.Lock()
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    def ssl_context(self) -> ssl.SSLContext:
+        # CA バンドルの読み込みが重いので 1 回だけ
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def _new_connection(self, key: PoolKey, timeout_s: float) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout_s, context=self.ssl_context())
+        return http.client.HTTPConnection(host, port, timeout=timeout_s)
+
+    def acquire(self, key: PoolKey, timeout_s: float, fresh: bool = False) -> Tuple[http.client.HTTPConnection, bool]:
+        """
+        返り値: (connection, reused)
+        fresh=True の場合は idle を使わず必ず新規接続。
+        """
+        if not fresh:
+            now = time.monotonic()
+            while True:
+                with self._lock:
+                    idle = self._idle.get(key)
+                    if not idle:
+                        break
+                    conn, released_at = idle.pop()
+                if now - released_at > self.idle_timeout_s or _sock_is_stale(conn):
+                    conn.close()
+                    continue
+                conn.timeout = timeout_s
+                try:
+                    conn.sock.settimeout(timeout_s)
+                except Exception:
+                    conn.close()
+                    continue
+                return conn, True
+
+        return self._new_connection(key, timeout_s), False
+
+    def release(self, key: PoolKey, conn: http.client.HTTPConnection) -> None:
+        if conn.sock is None:
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def discard(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def clear(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                self.discard(conn)
+
+
+_DEFAULT_POOL = ConnectionPool()
+prime(_DEFAULT_POOL.ssl_context)
+# snapshot 時点のソケットは復元後の環境では使えない（複数環境で共有もされる）
+after_restore(_DEFAULT_POOL.clear)
+
+
+def default_pool() -> ConnectionPool:
+    return _DEFAULT_POOL
@@ -0,0 +1,146 @@
+"""
+mcp_proxy_lib.popularity
+
+Access stats used by the scheduled warmer (backend/warmer).
+
+- record_access(tool, url) counts in memory and flushes to the shared cache
+  table (MCP_CACHE_TABLE) at most every ACCESS_STATS_FLUSH_S seconds: one
+  UpdateItem per tool and day, item "stats#<tool>#<YYYY-MM-DD>" with one
+  counter attribute per URL ("u:<url>", ADD). The flush runs on a background
+  thread (one at a time), never on the request path, and is best-effort: if
+  the container is frozen mid-flush it completes on a later invocation.
+- read, recommend and the reads of ask are counted (ask reads as
+  aws___read_documentation, the documents the warmer refreshes).
+- top_urls(tool, n, days) returns the n most accessed URLs over the last
+  `days` days (one BatchGetItem).
+- Without MCP_CACHE_TABLE nothing is recorded. Counts still buffered when a
+  container is shut down are lost; they are only used for ranking.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from mcp_proxy_lib.cache import DynamoDBSharedStore, default_cache
+
+FLUSH_INTERVAL_S = float(os.environ.get("ACCESS_STATS_FLUSH_S") or 30)
+RETENTION_DAYS = 14
+
+_ATTR_PREFIX = "u:"
+# UpdateExpression は 4KB まで（プレースホルダで 1 件 ~15 文字）
+_MAX_ATTRS_PER_UPDATE = 100
+
+
+def _day(ts: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
+
+
+def _item_key(tool: str, day: str) -> str:
+    return f"stats#{tool}#{day}"
+
+
+class AccessStats:
+    def __init__(self, table_name: str, client: Any, flush_interval_s: float = FLUSH_INTERVAL_S) -> None:
+        self.table_name = table_name
+        self.client = client
+        self.flush_interval_s = flush_interval_s
+        self._pending: Dict[str, Counter] = {}
+        self._last_flush = time.monotonic()
+        self._flushing = False
+        self._lock = threading.Lock()
+
+    def record(self, tool: str, url: str) -> None:
+        with self._lock:
+            self._pending.setdefault(tool, Counter())[url] += 1
+            due = not self._flushing and time.monotonic() - self._last_flush >= self.flush_interval_s
+            if due:
+                self._flushing = True
+        if due:
+            # UpdateItem をリクエストの処理時間に含めない
+            threading.Thread(target=self._flush_in_background, name="access-stats-flush", daemon=True).start()
+
+    def _flush_in_background(self) -> None:
+        try:
+            self.flush()
+        except Exception as ex:
+            print("[ACCESS_STATS_ERROR]", {"op": "flush", "error": str(ex)[:500]})
+        finally:
+            with self._lock:
+                self._flushing = False
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        now = time.time()
+        for tool, counts in pending.items():
+            items = list(counts.items())
+            for i in range(0, len(items), _MAX_ATTRS_PER_UPDATE):
+                try:
+                    self._add(_item_key(tool, _day(now)), items[i:i + _MAX_ATTRS_PER_UPDATE], now)
+                except Exception as ex:
+                    # 集計は best-effort（リクエストは失敗させない）
+                    print("[ACCESS_STATS_ERROR]", {"op": "flush", "tool": tool, "error": str(ex)[:500]})
+
+    def _add(self, key: str, items: List[Any], now: float) -> None:
+        names = {"#e": "expires_at"}
+        values: Dict[str, Any] = {":e": {"N": str(int(now + (RETENTION_DAYS + 1) * 86400))}}
+        adds: List[str] = []
+        for n, (url, count) in enumerate(items):
+            names[f"#u{n}"] = _ATTR_PREFIX + url
+            values[f":n{n}"] = {"N": str(count)}
+            adds.append(f"#u{n} :n{n}")
+        self.client.update_item(
+            TableName=self.table_name,
+            Key={"k": {"S": key}},
+            UpdateExpression="SET #e = :e ADD " + ", ".join(adds),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+
+    def top_urls(self, tool: str, n: int, days: int = 7) -> List[str]:
+        now = time.time()
+        keys = [{"k": {"S": _item_key(tool, _day(now - d * 86400))}} for d in range(max(1, min(days, RETENTION_DAYS)))]
+        r = self.client.batch_get_item(RequestItems={self.table_name: {"Keys": keys}})
+        totals: Counter = Counter()
+        for item in (r.get("Responses") or {}).get(self.table_name) or []:
+            for name, value in item.items():
+                if name.startswith(_ATTR_PREFIX) and "N" in value:
+                    totals[name[len(_ATTR_PREFIX):]] += int(value["N"])
+        return [url for url, _ in totals.most_common(n)]
+
+
+_DEFAULT_STATS: Optional[AccessStats] = None
+_DEFAULT_STATS_LOCK = threading.Lock()
+
+
+def default_access_stats() -> Optional[AccessStats]:
+    """
+    共有キャッシュ（DynamoDB）のテーブルとクライアントを使う。無ければ None。
+    """
+    global _DEFAULT_STATS
+    if _DEFAULT_STATS is None:
+        shared = default_cache().shared
+        if not isinstance(shared, DynamoDBSharedStore):
+            return None
+        with _DEFAULT_STATS_LOCK:
+            if _DEFAULT_STATS is None:
+                _DEFAULT_STATS = AccessStats(shared.table_name, shared.client)
+    return _DEFAULT_STATS
+
+
+def record_access(tool: str, url: str) -> None:
+    stats = default_access_stats()
+    if stats is not None and url:
+        stats.record(tool, url)
+
+
+def top_urls(tool: str, n: int, days: int = 7) -> List[str]:
+    stats = default_access_stats()
+    if stats is None:
+        return []
+    return stats.top_urls(tool, n, days)
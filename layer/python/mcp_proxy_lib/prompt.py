@@ -0,0 +1,116 @@
+"""
+mcp_proxy_lib.prompt
+
+InvokeModel request bodies for Anthropic models on Bedrock, with prompt caching.
+
+- PromptTemplate serializes the static part of the body (anthropic_version,
+  system prompt, max_tokens, temperature) once; render() splices in the
+  per-call content blocks, so a call only serializes the corpus and the
+  question.
+- With prompt caching on (BEDROCK_PROMPT_CACHE, default true) a cache
+  checkpoint (cache_control: ephemeral) is put on the system prompt when it
+  alone reaches PROMPT_CACHE_MIN_TOKENS, and on the document block when the
+  prefix up to it (system prompt + document) does (Bedrock does not cache
+  shorter prefixes). The document block must not depend on the question
+  (ask sends the question-independent part of the corpus there and the
+  question-specific part after it), so the same pages sent again within the
+  cache TTL (~5 min) are read from the cache. Hits show up as
+  CacheReadInputTokens.
+- If the model rejects cache_control, caching is turned off for the container
+  (prompt_cache_rejected / disable_prompt_cache) and the call is sent again
+  without it.
+- record_usage() turns the response usage into metrics (input, cache read,
+  cache write and output tokens).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from mcp_proxy_lib.corpus import estimate_tokens
+from mcp_proxy_lib.metrics import incr
+
+ANTHROPIC_VERSION = "bedrock-2023-05-31"
+PROMPT_CACHE_MIN_TOKENS = int(os.environ.get("BEDROCK_PROMPT_CACHE_MIN_TOKENS") or 1024)
+
+_EPHEMERAL = {"type": "ephemeral"}
+_SLOT = "__content__"
+
+_CACHE_ENABLED = (os.environ.get("BEDROCK_PROMPT_CACHE") or "true").strip().lower() in ("1", "true", "yes")
+
+
+def prompt_cache_enabled() -> bool:
+    return _CACHE_ENABLED
+
+
+def disable_prompt_cache(reason: str) -> None:
+    global _CACHE_ENABLED
+    if _CACHE_ENABLED:
+        print("[PROMPT_CACHE_DISABLED]", {"reason": reason[:500]})
+    _CACHE_ENABLED = False
+
+
+def prompt_cache_rejected(ex: BaseException) -> bool:
+    """
+    cache_control を受け付けないモデルの ValidationException か。
+    """
+    err = (getattr(ex, "response", None) or {}).get("Error") or {}
+    return err.get("Code") == "ValidationException" and "cach" in str(err.get("Message") or "").lower()
+
+
+def _block(text: str, cache: bool, prefix_tokens: int = 0) -> Dict[str, Any]:
+    """
+    prefix_tokens: この block より前にある prompt の token 数（checkpoint はそこからの累計で判定する）。
+    """
+    block: Dict[str, Any] = {"type": "text", "text": text}
+    if cache and prefix_tokens + estimate_tokens(text) >= PROMPT_CACHE_MIN_TOKENS:
+        block["cache_control"] = _EPHEMERAL
+    return block
+
+
+class PromptTemplate:
+    def __init__(self, system_text: str, max_tokens: int, temperature: float, cache: bool = True) -> None:
+        self.cache = cache
+        self._system_tokens = estimate_tokens(system_text)
+        skeleton = json.dumps(
+            {
+                "anthropic_version": ANTHROPIC_VERSION,
+                "system": [_block(system_text, cache)],  # ★messages内にsystem roleを入れない
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "messages": [{"role": "user", "content": _SLOT}],
+            },
+            ensure_ascii=False,
+        )
+        self._head, self._tail = skeleton.split(json.dumps(_SLOT), 1)
+
+    def render(self, document: str, text: str) -> bytes:
+        """
+        document: 再利用されうる本文（cache checkpoint の対象。質問に依存させないこと）、
+        text: 質問など呼び出しごとの部分。
+        """
+        blocks: List[Dict[str, Any]] = []
+        if document:
+            blocks.append(_block(document, self.cache, self._system_tokens))
+        blocks.append({"type": "text", "text": text})
+        return (self._head + json.dumps(blocks, ensure_ascii=False) + self._tail).encode("utf-8")
+
+
+def record_usage(usage: Optional[Dict[str, Any]]) -> None:
+    """
+    usage: {"input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"}
+    （あるものだけ数える）
+    """
+    if not isinstance(usage, dict):
+        return
+    for key, name in (
+        ("input_tokens", "input_tokens"),
+        ("cache_read_input_tokens", "cache_read_input_tokens"),
+        ("cache_creation_input_tokens", "cache_write_input_tokens"),
+        ("output_tokens", "output_tokens"),
+    ):
+        n = usage.get(key)
+        if isinstance(n, int) and n > 0:
+            incr(name, n)
@@ -0,0 +1,171 @@
+"""
+mcp_proxy_lib.rerank
+
+Local re-ranking of search hits and read planning for /api/ask.
+
+- Hits are scored with BM25 over title (boosted) + context, using AWS_IDF, a
+  fixed IDF table for AWS documentation vocabulary: words that appear on most
+  pages ("aws", "service", "設定", ...) weigh little, and words not in the
+  table (service names, parameters, error codes) count as rare (UNSEEN_IDF).
+  Ten snippets are too few to estimate IDF from themselves.
+- The upstream rank is kept as a prior, so the BM25 score reorders hits
+  rather than replacing the search ranking.
+- plan_reads() picks read targets adaptively: hits scoring far below the best
+  one are dropped, and reading stops once the chosen snippets cover the
+  question (IDF-weighted). If several snippets already cover the whole
+  question, the snippets are used as the corpus and nothing is read.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from typing import Any, Dict, FrozenSet, Iterable, List, NamedTuple, Sequence, Set
+
+from mcp_proxy_lib.bm25 import BM25, tokenize
+
+TITLE_BOOST = 2
+RANK_PRIOR_WEIGHT = 0.3
+UNSEEN_IDF = 4.0
+
+# 最上位との相対スコアがこれ未満のヒットは読まない
+MIN_RELATIVE_SCORE = float(os.environ.get("ASK_MIN_RELATIVE_SCORE") or 0.5)
+# 選んだヒットの snippet で質問の語（IDF 加重）がこの割合まで揃ったら、それ以上は読まない
+READ_COVERAGE = float(os.environ.get("ASK_READ_COVERAGE") or 0.9)
+# snippet だけで答える条件: 質問の語をすべて含む snippet が 2 件以上、合計この文字数以上
+SNIPPET_ONLY_COVERAGE = float(os.environ.get("ASK_SNIPPET_ONLY_COVERAGE") or 1.0)
+SNIPPET_ONLY_MIN_CHARS = int(os.environ.get("ASK_SNIPPET_ONLY_MIN_CHARS") or 800)
+SNIPPET_SOURCES = 3
+# read した本文のチャンクを「質問に関係する」とみなす被覆率（ask が read の打ち切りに使う）
+RELEVANT_CHUNK_COVERAGE = 0.5
+
+# 平仮名を含む bigram は助詞/活用語尾のまたぎが多いので、質問側の重みを下げる
+_HIRAGANA_RE = re.compile(r"[぀-ゟ]")
+HIRAGANA_WEIGHT = 0.2
+
+# AWS ドキュメントでの出現率の目安ごとの IDF（ほぼ全ページ / 多くのページ / よく出る）
+_IDF_TIERS = {
+    0.1: """
+        aws amazon
+        する して され ます です こと ため この その ください できます
+    """,
+    0.5: """
+        service services use using used user users create created creating console documentation guide
+        developer api apis resource resources account accounts region regions configure configuration
+        data information example examples see more following new set value values name type default
+        also must need want access request requests response policy policies role permissions
+        support supported enable enabled specify specified table page topic section note
+        作成 使用 設定 場合 サー ービ ビス リソ ソー ース アカ カウ ウン ント リー ージ ョン 情報 以下 次の 指定 利用
+        できる します ける れる られ
+    """,
+    1.0: """
+        instance instances cluster function functions bucket buckets key keys file files version
+        versions limit limits quota quotas error errors log logs metric metrics event events
+        cli sdk iam arn json yaml template stack endpoint endpoints network security cost pricing
+        best practices tutorial overview getting started troubleshooting monitoring
+        方法 手順 概要 機能 制限 エラ ラー ログ 料金 管理 権限 ポリ リシ シー 関数 ンス タン イン
+    """,
+}
+
+AWS_IDF: Dict[str, float] = {tok: idf for idf, words in _IDF_TIERS.items() for tok in words.split()}
+
+
+class Hit(NamedTuple):
+    order: int                 # upstream の順位（0 始まり）
+    title: str
+    url: str
+    context: str
+    score: float               # rank prior 込みの 0..1
+    coverage: float            # この snippet が覆う質問の語の割合（IDF 加重）
+    terms: FrozenSet[str]
+
+
+class ReadPlan(NamedTuple):
+    reads: List[Hit]           # read する（優先順）
+    spares: List[Hit]          # read 失敗時の予備
+    snippets: List[Hit]        # read せず snippet を corpus にする場合の出典（空なら read する）
+
+
+def query_weights(question: str) -> Dict[str, float]:
+    weights: Dict[str, float] = {}
+    for t in tokenize(question):
+        w = AWS_IDF.get(t, UNSEEN_IDF)
+        weights[t] = w * HIRAGANA_WEIGHT if _HIRAGANA_RE.search(t) else w
+    return weights
+
+
+def coverage(weights: Dict[str, float], terms: Iterable[str]) -> float:
+    total = sum(weights.values())
+    if total <= 0:
+        # 判定できない（質問が機能語だけ）: 足りたことにはしない
+        return 0.0
+    present = set(terms)
+    return sum(w for t, w in weights.items() if t in present) / total
+
+
+def rank_hits(question: str, items: Sequence[Dict[str, Any]]) -> List[Hit]:
+    """
+    items: [{"title", "url", "context"}, ...]（upstream の順）。返り値はスコアの高い順。
+    """
+    weights = query_weights(question)
+    query = list(weights)
+    docs: List[List[str]] = []
+    for it in items:
+        docs.append(tokenize(str(it.get("title") or "")) * TITLE_BOOST + tokenize(str(it.get("context") or "")))
+    if not docs:
+        return []
+
+    bm25 = BM25(docs, idf=AWS_IDF, unseen_idf=UNSEEN_IDF)
+    raw = bm25.scores(query) if query else [0.0] * len(docs)
+    top = max(raw) or 1.0
+
+    hits: List[Hit] = []
+    for i, it in enumerate(items):
+        terms = frozenset(docs[i])
+        hits.append(Hit(
+            order=i,
+            title=str(it.get("title") or ""),
+            url=str(it.get("url") or ""),
+            context=str(it.get("context") or ""),
+            score=(1.0 - RANK_PRIOR_WEIGHT) * raw[i] / top + RANK_PRIOR_WEIGHT / (1 + i),
+            coverage=coverage(weights, terms),
+            terms=terms,
+        ))
+    hits.sort(key=lambda h: (-h.score, h.order))
+    return hits
+
+
+def plan_reads(question: str, hits: List[Hit], k: int, spares: int = 0, adaptive: bool = True) -> ReadPlan:
+    """
+    hits は rank_hits の返り値。k は read の上限。
+    adaptive=False なら upstream の順に k 件（従来どおり）。
+    """
+    if not hits:
+        return ReadPlan([], [], [])
+    if k <= 0:
+        return ReadPlan([], [], hits[:SNIPPET_SOURCES])
+    if not adaptive:
+        ordered = sorted(hits, key=lambda h: h.order)
+        return ReadPlan(ordered[:k], ordered[k:k + spares], [])
+
+    # 1) snippet だけで質問の語が揃っているなら read しない
+    full = [h for h in hits[:max(k, SNIPPET_SOURCES)] if h.coverage >= SNIPPET_ONLY_COVERAGE - 1e-9]
+    if len(full) >= 2 and sum(len(h.context) for h in full) >= SNIPPET_ONLY_MIN_CHARS:
+        return ReadPlan([], [], full)
+
+    # 2) 最上位から、snippet で質問が覆えるまで読む
+    weights = query_weights(question)
+    floor = hits[0].score * MIN_RELATIVE_SCORE
+    eligible = [h for h in hits if h.score >= floor]
+    reads: List[Hit] = []
+    covered: Set[str] = set()
+    for h in eligible:
+        if len(reads) >= k:
+            break
+        reads.append(h)
+        covered |= h.terms
+        if coverage(weights, covered) >= READ_COVERAGE:
+            break
+    chosen = {h.order for h in reads}
+    rest = [h for h in eligible if h.order not in chosen]
+    return ReadPlan(reads, rest[:spares], [])
@@ -0,0 +1,160 @@
+"""
+mcp_proxy_lib.resilience
+
+Retry/backoff policy and circuit breaker for upstream calls.
+
+- Errors are classified by HTTP status (429/500/502/503/504 are retryable)
+  and transport failures, not by message substrings.
+- Backoff uses decorrelated jitter so concurrent Lambdas do not retry in
+  lockstep; Retry-After from the upstream is honored as a lower bound.
+- CircuitBreaker (per endpoint, per container) fails fast while upstream is
+  down and lets a single probe through after reset_timeout_s. A probe that
+  ends without an outcome (deadline) re-opens the breaker, and a probe that
+  never reports back is replaced after probe_timeout_s.
+- Retries are only attempted while the invocation deadline leaves room for
+  the sleep plus another attempt.
+"""
+
+from __future__ import annotations
+
+import email.utils
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+from mcp_proxy_lib.snapstart import after_restore
+
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+DEFAULT_BACKOFF_BASE_S = 0.2
+DEFAULT_BACKOFF_CAP_S = 4.0
+MAX_RETRY_AFTER_S = 10.0
+# リトライ後の 1 回の試行に最低限必要な時間
+MIN_ATTEMPT_S = 1.0
+
+
+class UpstreamHTTPError(RuntimeError):
+    def __init__(self, status: int, body: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(f"MCP HTTPError {status}: {body[:2000]}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class UpstreamConnectionError(RuntimeError):
+    def __init__(self, reason: str) -> None:
+        super().__init__(f"MCP URLError: {reason}")
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After: 秒数 or HTTP-date。上限は MAX_RETRY_AFTER_S。
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            dt = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        seconds = dt.timestamp() - time.time()
+    return min(max(0.0, seconds), MAX_RETRY_AFTER_S)
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, UpstreamHTTPError):
+        return exc.status in RETRYABLE_STATUS
+    return isinstance(exc, UpstreamConnectionError)
+
+
+# 同じ snapshot から復元した環境が同じ乱数列で jitter しないように
+after_restore(random.seed)
+
+
+class Backoff:
+    """
+    decorrelated jitter: sleep = min(cap, uniform(base, prev * 3))
+    """
+
+    def __init__(self, base_s: float = DEFAULT_BACKOFF_BASE_S, cap_s: float = DEFAULT_BACKOFF_CAP_S) -> None:
+        self.base_s = base_s
+        self.cap_s = cap_s
+        self._prev = base_s
+
+    def next(self) -> float:
+        self._prev = min(self.cap_s, random.uniform(self.base_s, self._prev * 3))
+        return self._prev
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout_s: float = 10.0, probe_timeout_s: float = 30.0) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.probe_timeout_s = probe_timeout_s
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            probe_due = self.state == self.OPEN and now - self._opened_at >= self.reset_timeout_s
+            # 結果を報告しないまま probe_timeout_s 経った probe は失われたとみなして次を通す
+            probe_lost = self.state == self.HALF_OPEN and now - self._probe_started >= self.probe_timeout_s
+            if probe_due or probe_lost:
+                # 1 件だけ試しに通す
+                self.state = self.HALF_OPEN
+                self._probe_started = now
+                return
+        raise CircuitOpenError(f"MCP circuit open: {self.name}")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print("[MCP_CIRCUIT_OPEN]", {"name": self.name, "failures": self._failures})
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def record_abandoned(self) -> None:
+        """
+        結果が分からないまま終わった呼び出し（deadline 切れ）。probe だった場合は open に戻して次の probe を待つ。
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def breaker_for(name: str) -> CircuitBreaker:
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(name)
+        if breaker is None:
+            breaker = _BREAKERS[name] = CircuitBreaker(name)
+        return breaker
@@ -0,0 +1,75 @@
+"""
+mcp_proxy_lib.routes
+
+Loads the per-tool function modules (backend/<name>/app.py) by file path so
+aggregate functions (e.g. /api/batch) can reuse their _validate_args and
+TOOL_NAME instead of duplicating them.
+
+Every function module is named app.py, so each one is imported under a
+unique module name ("mcp_fn_<name>").
+
+ROUTES maps (method, /api/<path>) to the function module whose handler serves
+it, for the consolidated router function (backend/router/app.py).
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import os
+import sys
+import threading
+from types import ModuleType
+from typing import Dict, Optional, Tuple
+
+# MCP tool name -> backend/<dir>
+TOOL_FUNCTIONS: Dict[str, str] = {
+    "aws___search_documentation": "search",
+    "aws___read_documentation": "read",
+    "aws___recommend": "recommend",
+    "aws___list_regions": "list_regions",
+    "aws___get_regional_availability": "get_regional_availability",
+}
+
+# (method, path) -> backend/<dir>（各 handler がそのまま処理する）
+ROUTES: Dict[Tuple[str, str], str] = {
+    ("POST", "/api/search"): "search",
+    ("GET", "/api/health"): "search",
+    ("POST", "/api/read"): "read",
+    ("POST", "/api/recommend"): "recommend",
+    ("POST", "/api/list_regions"): "list_regions",
+    ("POST", "/api/get_regional_availability"): "get_regional_availability",
+    ("POST", "/api/batch"): "batch",
+    ("POST", "/api/ask"): "ask",
+}
+
+_LOCK = threading.Lock()
+
+
+def route_for(method: str, raw_path: str) -> Optional[str]:
+    """
+    raw_path は stage 付き（/prod/api/search）でもよい。
+    """
+    i = raw_path.find("/api/")
+    if i < 0:
+        return None
+    return ROUTES.get((method.upper(), raw_path[i:].rstrip("/")))
+
+
+def load_function_module(base_dir: str, name: str) -> ModuleType:
+    """
+    sys.modules に載るのは exec_module が最後まで終わったモジュールだけ
+    （batch の並列 item が初期化途中のモジュールを掴まないように）。
+    """
+    mod_name = f"mcp_fn_{name}"
+    with _LOCK:
+        mod = sys.modules.get(mod_name)
+        if mod is not None:
+            return mod
+        path = os.path.join(base_dir, name, "app.py")
+        spec = importlib.util.spec_from_file_location(mod_name, path)
+        if spec is None or spec.loader is None:
+            raise ImportError(f"cannot load function module: {path}")
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        sys.modules[mod_name] = mod
+        return mod
@@ -2,12 +2,32 @@
 mcp_proxy_lib.security
 
 Common helpers for API Gateway/Lambda handlers.
+
+- @compressible: gzip / brotli response bodies negotiated from the request's
+  Accept-Encoding (base64 + isBase64Encoded, which API Gateway decodes).
+  Brotli needs the optional `brotli` package in the layer; without it only
+  gzip is offered. Bodies under COMPRESS_MIN_BYTES are left as they are.
 """
 
 from __future__ import annotations
 
+import base64
+import functools
 import json
-from typing import Any, Dict
+import os
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+from mcp_proxy_lib.metrics import stage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES") or 1024)
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
 
 
 def json_dumps(obj: Any) -> str:
@@ -30,14 +50,102 @@ def verify_origin(headers: Dict[str, Any] | None, secret: str) -> bool:
     return get_header(headers, "X-Origin-Verify") == secret
 
 
+def _cors_headers(content_type: str) -> Dict[str, str]:
+    return {
+        "Content-Type": content_type,
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Headers": "content-type,x-origin-verify",
+        "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
+    }
+
+
 def response(status: int, obj: Any) -> Dict[str, Any]:
+    with stage("serialize"):
+        body = json_dumps(obj)
     return {
         "statusCode": status,
-        "headers": {
-            "Content-Type": "application/json; charset=utf-8",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "content-type,x-origin-verify",
-            "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
-        },
-        "body": json_dumps(obj),
+        "headers": _cors_headers("application/json; charset=utf-8"),
+        "body": body,
     }
+
+
+def project(obj: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """
+    トップレベルのキーを fields だけに絞る（None なら全部）。
+    """
+    if fields is None:
+        return obj
+    return {k: v for k, v in obj.items() if k in fields}
+
+
+def _accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    # "br;q=1.0, gzip;q=0.8, *;q=0.1" -> {"br": 1.0, "gzip": 0.8, "*": 0.1}
+    out: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            out[name.strip().lower()] = q
+    return out
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted_encodings(accept_encoding or "")
+    wildcard = accepted.get("*", 0.0)
+    offered = (["br"] if brotli is not None else []) + ["gzip"]
+    best: Optional[str] = None
+    best_q = 0.0
+    for enc in offered:
+        q = accepted.get(enc, wildcard)
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # wbits=31: gzip 形式（gzip モジュールを import せずに済む）
+    c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return c.compress(data) + c.flush()
+
+
+def compress_response(resp: Dict[str, Any], accept_encoding: str) -> Dict[str, Any]:
+    headers = resp.get("headers") or {}
+    body = resp.get("body")
+    if not isinstance(body, str) or resp.get("isBase64Encoded") or "Content-Encoding" in headers:
+        return resp
+    data = body.encode("utf-8")
+    if len(data) < COMPRESS_MIN_BYTES:
+        return resp
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return resp
+    with stage("compress"):
+        packed = _compress(data, encoding)
+        if len(packed) >= len(data):
+            return resp
+        out = dict(resp)
+        out["headers"] = {**headers, "Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+        out["body"] = base64.b64encode(packed).decode("ascii")
+        out["isBase64Encoded"] = True
+    return out
+
+
+def compressible(fn: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+    """
+    Lambda handler 用デコレータ。Accept-Encoding に応じて body を圧縮する。
+    """
+    @functools.wraps(fn)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        out = fn(event, context)
+        if not isinstance(out, dict):
+            return out
+        return compress_response(out, get_header(event.get("headers"), "Accept-Encoding"))
+    return wrapper
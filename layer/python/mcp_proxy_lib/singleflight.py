@@ -0,0 +1,141 @@
+"""
+mcp_proxy_lib.singleflight
+
+Request coalescing for identical concurrent calls.
+
+- In-container: concurrent calls with the same key share one in-flight call
+  (followers wait for the leader's result or exception). A Lambda container
+  serves one invocation at a time, so this covers the threads of one
+  invocation (ask reads, batch items, document segments).
+- Across containers (shared store with lease support, i.e. MCP_CACHE_TABLE):
+  the first caller takes a short lease in the shared store and does the work;
+  the others poll the cache for its result. If the leader fails without
+  storing a result, or its lease expires, the next poller takes the lease
+  and does the work itself.
+- Without a shared store, or when the store errors, calls are not delayed
+  (fail open).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from mcp_proxy_lib.cache import ToolCache, cache_key
+from mcp_proxy_lib.deadline import Deadline, DeadlineExceeded
+from mcp_proxy_lib.metrics import incr
+
+DEFAULT_LEASE_TTL_S = 10.0
+POLL_INITIAL_S = 0.05
+POLL_MAX_S = 0.25
+
+Lookup = Callable[[], Tuple[bool, Any]]
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any], deadline: Optional[Deadline] = None) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            incr("coalesced")
+            if not call.done.wait(deadline.remaining() if deadline is not None else None):
+                raise DeadlineExceeded("deadline exceeded while waiting for an in-flight call")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+_FLIGHTS = SingleFlight()
+
+
+def _leased(cache: ToolCache, key: str, fn: Callable[[], Any], lookup: Lookup, ttl_s: float, deadline: Optional[Deadline]) -> Any:
+    shared = cache.shared
+    token = uuid.uuid4().hex
+    delay = POLL_INITIAL_S
+    waited = False
+    while True:
+        try:
+            acquired = shared.acquire_lease(key, token, ttl_s)
+        except Exception as ex:
+            print("[LEASE_ERROR]", {"op": "acquire", "error": str(ex)[:500]})
+            acquired = True
+            token = ""
+        if acquired:
+            break
+
+        # 他のコンテナが取得中: 結果が共有キャッシュに入るのを待つ
+        if not waited:
+            incr("lease_waits")
+            waited = True
+        if deadline is not None and deadline.remaining() < delay:
+            raise DeadlineExceeded("deadline exceeded while waiting for another container")
+        time.sleep(delay)
+        delay = min(delay * 2, POLL_MAX_S)
+        hit, value = lookup()
+        if hit:
+            incr("coalesced")
+            return value
+
+    try:
+        if waited:
+            # lease が空いた = 先行側が失敗したか期限切れ。直前に結果が入っていないか確認する
+            hit, value = lookup()
+            if hit:
+                return value
+        return fn()
+    finally:
+        if token:
+            try:
+                shared.release_lease(key, token)
+            except Exception as ex:
+                print("[LEASE_ERROR]", {"op": "release", "error": str(ex)[:500]})
+
+
+def coalesce(
+    tool: str,
+    arguments: Dict[str, Any],
+    fn: Callable[[], Any],
+    cache: Optional[ToolCache] = None,
+    lookup: Optional[Lookup] = None,
+    deadline: Optional[Deadline] = None,
+    lease_ttl_s: float = DEFAULT_LEASE_TTL_S,
+) -> Any:
+    """
+    fn は結果をキャッシュに書き込んでから返すこと（他のコンテナは lookup でそれを待つ）。
+    lookup の既定は cache.get(tool, arguments)。cache が無ければコンテナ内だけでまとめる。
+    """
+    key = cache_key(tool, arguments)
+    shared = cache.shared if cache is not None else None
+    if shared is None or not hasattr(shared, "acquire_lease"):
+        return _FLIGHTS.do(key, fn, deadline)
+    if lookup is None:
+        lookup = lambda: cache.get(tool, arguments)
+    return _FLIGHTS.do(key, lambda: _leased(cache, key, fn, lookup, lease_ttl_s, deadline), deadline)
@@ -0,0 +1,63 @@
+"""
+mcp_proxy_lib.snapstart
+
+Optional SnapStart / provisioned-concurrency hooks.
+
+- prime(fn): work worth doing before the first request (import boto3, build
+  clients, load the TLS trust store). It runs in the before-snapshot hook
+  under SnapStart, immediately under provisioned concurrency or when
+  PRIME_ON_INIT=true, and is skipped for on-demand inits, where it would only
+  move the same cost into INIT.
+- after_restore(fn): state that must not be shared between environments
+  restored from one snapshot (pooled sockets, the random seed used for
+  backoff jitter).
+- Outside the Lambda SnapStart runtime (snapshot_restore_py not importable)
+  the snapshot hooks are no-ops.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Callable, List
+
+try:
+    from snapshot_restore_py import register_after_restore, register_before_snapshot
+except ImportError:
+    register_after_restore = register_before_snapshot = None
+
+Hook = Callable[[], None]
+
+_PRIMED: List[Hook] = []
+
+
+def _init_type() -> str:
+    return (os.environ.get("AWS_LAMBDA_INITIALIZATION_TYPE") or "").strip()
+
+
+def _run(fn: Hook) -> None:
+    try:
+        fn()
+    except Exception as e:
+        # priming の失敗でコンテナを落とさない（最初のリクエストで改めて初期化される）
+        print("[SNAPSTART_HOOK_ERROR]", {"hook": getattr(fn, "__qualname__", repr(fn)), "error": str(e)[:500]})
+
+
+def prime(fn: Hook) -> Hook:
+    """
+    デコレータとしても使える。登録済みの関数は二重に実行しない。
+    """
+    if fn in _PRIMED:
+        return fn
+    _PRIMED.append(fn)
+    if _init_type() == "snap-start":
+        if register_before_snapshot is not None:
+            register_before_snapshot(_run, fn)
+    elif _init_type() == "provisioned-concurrency" or (os.environ.get("PRIME_ON_INIT") or "").strip().lower() in ("1", "true", "yes"):
+        _run(fn)
+    return fn
+
+
+def after_restore(fn: Hook) -> Hook:
+    if register_after_restore is not None:
+        register_after_restore(_run, fn)
+    return fn
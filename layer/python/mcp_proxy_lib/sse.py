@@ -0,0 +1,207 @@
+"""
+mcp_proxy_lib.sse
+
+Incremental decoder for MCP responses (text/event-stream or application/json).
+
+- SSEDecoder follows the event-stream rules: CRLF/CR/LF line endings,
+  multi-line "data:" fields joined with "\n", comments, blank-line dispatch.
+- read_mcp_messages() reads the socket in chunks and stops decoding as soon as
+  every wanted JSON-RPC id has a response. The rest of the stream (the server
+  closes it right after the response) is then drained within DRAIN_MAX_BYTES
+  / DRAIN_MAX_S, so the keep-alive connection can be reused; a stream that
+  goes on past that budget is left unread and the connection is dropped.
+  Socket reads and decoding are timed separately (upstream_download /
+  sse_decode, see mcp_proxy_lib.metrics).
+"""
+
+from __future__ import annotations
+
+import http.client
+import json
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from mcp_proxy_lib.metrics import record
+
+READ_CHUNK_SIZE = 64 * 1024
+# 応答が揃った後に読み捨てる残り（SSE の終端）の上限
+DRAIN_MAX_BYTES = 64 * 1024
+DRAIN_MAX_S = 0.1
+
+
+class SSEDecoder:
+    def __init__(self) -> None:
+        self._buf = b""
+        self._event = ""
+        self._data: List[str] = []
+
+    def feed(self, chunk: bytes) -> List[Tuple[str, str]]:
+        """
+        chunk を取り込み、確定したイベント [(event, data), ...] を返す。
+        """
+        self._buf += chunk
+        events: List[Tuple[str, str]] = []
+        while True:
+            line, rest = self._next_line(self._buf)
+            if line is None:
+                break
+            self._buf = rest
+            ev = self._process_line(line.decode("utf-8", errors="replace"))
+            if ev is not None:
+                events.append(ev)
+        return events
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """
+        EOF 時に呼ぶ。末尾の空行が無いイベントも寛容に確定させる。
+        """
+        events: List[Tuple[str, str]] = []
+        if self._buf:
+            ev = self._process_line(self._buf.decode("utf-8", errors="replace"))
+            self._buf = b""
+            if ev is not None:
+                events.append(ev)
+        ev = self._dispatch()
+        if ev is not None:
+            events.append(ev)
+        return events
+
+    @staticmethod
+    def _next_line(buf: bytes) -> Tuple[Optional[bytes], bytes]:
+        cr = buf.find(b"\r")
+        lf = buf.find(b"\n")
+        if cr < 0 and lf < 0:
+            return None, buf
+        if cr >= 0 and (lf < 0 or cr < lf):
+            # 末尾の CR は次の chunk の LF と対になるかもしれないので保留
+            if cr == len(buf) - 1:
+                return None, buf
+            end = cr + 2 if buf[cr + 1:cr + 2] == b"\n" else cr + 1
+            return buf[:cr], buf[end:]
+        return buf[:lf], buf[lf + 1:]
+
+    def _process_line(self, line: str) -> Optional[Tuple[str, str]]:
+        if line == "":
+            return self._dispatch()
+        if line.startswith(":"):
+            return None
+        field, sep, value = line.partition(":")
+        if sep and value.startswith(" "):
+            value = value[1:]
+        if field == "data":
+            self._data.append(value)
+        elif field == "event":
+            self._event = value
+        # id / retry は使わない
+        return None
+
+    def _dispatch(self) -> Optional[Tuple[str, str]]:
+        if not self._data:
+            self._event = ""
+            return None
+        ev = (self._event or "message", "\n".join(self._data))
+        self._event = ""
+        self._data = []
+        return ev
+
+
+def _messages_from_json(text: str) -> List[Dict[str, Any]]:
+    text = text.strip()
+    if not text:
+        return []
+    try:
+        parsed = json.loads(text)
+    except Exception:
+        return []
+    if isinstance(parsed, list):
+        return [m for m in parsed if isinstance(m, dict)]
+    if isinstance(parsed, dict):
+        return [parsed]
+    return []
+
+
+def _is_response_for(m: Dict[str, Any], want_ids: Set[Any]) -> bool:
+    return m.get("id") in want_ids and ("result" in m or "error" in m)
+
+
+def _drain(read: Any, sock: Any) -> bool:
+    """
+    残りを DRAIN_MAX_BYTES / DRAIN_MAX_S の範囲で読み捨てる。EOF まで読めたら True。
+    sock があれば読み捨ての間だけ socket timeout を DRAIN_MAX_S に下げる。
+    """
+    t_end = time.monotonic() + DRAIN_MAX_S
+    left = DRAIN_MAX_BYTES
+    old_timeout = sock.gettimeout() if sock is not None else None
+    try:
+        if sock is not None:
+            sock.settimeout(DRAIN_MAX_S)
+        while left > 0 and time.monotonic() < t_end:
+            chunk = read(min(left, READ_CHUNK_SIZE))
+            if not chunk:
+                return True
+            left -= len(chunk)
+        return False
+    except (OSError, http.client.HTTPException):
+        # timeout などで読み切れなかった（接続は捨てる）
+        return False
+    finally:
+        if sock is not None:
+            try:
+                sock.settimeout(old_timeout)
+            except OSError:
+                pass
+
+
+def read_mcp_messages(resp: Any, content_type: str, want_ids: Optional[Set[Any]] = None, sock: Any = None) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    resp（read1/read を持つ file-like）から JSON-RPC メッセージを読む。
+    返り値: (messages, drained)
+    want_ids が揃ったら以降はデコードせず、残りを短時間だけ読み捨てる（_drain）。
+    drained=False は予算内に EOF まで読めなかったことを示す（接続は再利用不可）。
+    """
+    if "text/event-stream" not in (content_type or ""):
+        t0 = time.perf_counter()
+        raw = resp.read()
+        t1 = time.perf_counter()
+        parsed = _messages_from_json(raw.decode("utf-8", errors="replace"))
+        record("upstream_download", (t1 - t0) * 1000.0)
+        record("sse_decode", (time.perf_counter() - t1) * 1000.0)
+        return parsed, True
+
+    read = getattr(resp, "read1", None) or resp.read
+    pending = set(want_ids or ())
+    decoder = SSEDecoder()
+    msgs: List[Dict[str, Any]] = []
+    read_s = decode_s = 0.0
+
+    try:
+        while True:
+            t0 = time.perf_counter()
+            chunk = read(READ_CHUNK_SIZE)
+            t1 = time.perf_counter()
+            events = decoder.feed(chunk) if chunk else decoder.flush()
+            for _, data in events:
+                for m in _messages_from_json(data):
+                    msgs.append(m)
+                    if _is_response_for(m, pending):
+                        pending.discard(m.get("id"))
+            read_s += t1 - t0
+            decode_s += time.perf_counter() - t1
+            if not chunk:
+                return msgs, True
+            if want_ids and not pending:
+                t0 = time.perf_counter()
+                drained = _drain(read, sock)
+                read_s += time.perf_counter() - t0
+                return msgs, drained
+    finally:
+        record("upstream_download", read_s * 1000.0)
+        record("sse_decode", decode_s * 1000.0)
+
+
+def decode_sse_bytes(body_bytes: bytes) -> List[Dict[str, Any]]:
+    decoder = SSEDecoder()
+    msgs: List[Dict[str, Any]] = []
+    for _, data in decoder.feed(body_bytes) + decoder.flush():
+        msgs.extend(_messages_from_json(data))
+    return msgs